@@ -0,0 +1,84 @@
+"""Recall@k and latency of the FAISS index types over our own corpus.
+
+Vectors come from the cached per-document indexes of the uploaded files (built first if missing).
+Queries are the opening words of randomly sampled chunks, and exact flat search is the ground truth:
+
+    python benchmarks/faiss_index_recall.py
+    python benchmarks/faiss_index_recall.py --types hnsw ivf_pq --k 4 --queries 500
+
+Search-time settings come from the environment (FAISS_NPROBE, FAISS_HNSW_EF_SEARCH), so run it
+again with other values to trade recall for latency. Types that need more vectors to train than
+the corpus has fall back to flat and are reported as such.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from typing import List, Tuple
+
+import faiss
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+load_dotenv()
+
+from services.RAGResourceServices import ResourceService
+from services.FaissIndexService import FaissIndexService
+
+
+def load_corpus(resource_service: ResourceService, file_paths: List[str]) -> Tuple[np.ndarray, List[str]]:
+    """Vectors and chunk texts of the files' per-document indexes, in order."""
+    embeddings = resource_service.get_embeddings()
+    vectors, texts = [], []
+    for file_path in file_paths:
+        document_index, _ = resource_service.get_document_index(file_path, embeddings)
+        if document_index is None:
+            continue
+        ntotal = document_index.index.ntotal
+        vectors.append(document_index.index.reconstruct_n(0, ntotal))
+        texts.extend(document_index.docstore.search(document_index.index_to_docstore_id[i]).page_content for i in range(ntotal))
+    if not vectors:
+        raise SystemExit("No indexable files found.")
+    return np.concatenate(vectors), texts
+
+
+def main(args: argparse.Namespace) -> None:
+    resource_service = ResourceService()
+    folder = resource_service.uploaded_rag_folder_path
+    file_paths = args.files or [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.lower().endswith(".pdf")]
+    vectors, texts = load_corpus(resource_service, file_paths)
+
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)
+    questions = [" ".join(texts[i].split()[:30]) for i in sample]
+    queries = np.stack([resource_service.embedding_service.embed_query(question) for question in questions]).astype(np.float32)
+    _, ground_truth = FaissIndexService("flat").build(vectors, "flat").search(queries, args.k)
+
+    print(f"{len(vectors)} chunks, {len(queries)} queries, k={args.k}")
+    print(f"{'type':<9} {'spec':<16} {'build s':>8} {'MB':>8} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for index_type in args.types:
+        service = FaissIndexService(index_type)
+        index = service.build(vectors, service.choose(len(vectors)))
+        latencies, hits = [], 0
+        for query, expected in zip(queries, ground_truth):
+            start = time.perf_counter()
+            _, found = index.search(query[None, :], args.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += len(set(found[0]) & set(expected[expected != -1]))
+        recall = hits / ground_truth[ground_truth != -1].size
+        size_mb = faiss.serialize_index(index).nbytes / (1024 * 1024)
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{index_type:<9} {service.last_build['spec']:<16} {service.last_build['build_seconds']:>8.2f} {size_mb:>8.1f} "
+              f"{recall:>9.3f} {statistics.median(latencies):>8.3f} {p95:>8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", nargs="*", help="PDF files to index (default: every PDF in uploaded_files)")
+    parser.add_argument("--types", nargs="+", default=["flat", "ivf_flat", "hnsw", "ivf_pq", "sq8"],
+                        choices=["flat", "ivf_flat", "hnsw", "ivf_pq", "sq8"])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,84 @@
+"""Micro-benchmark of the per-request setup cost removed by compiling the agent graphs once.
+
+Before, every request rebuilt its LangGraph graph, prompt templates and structured-output runnables;
+now they are built at import and reused. This times both paths without calling the LLM:
+
+    python benchmarks/graph_overhead.py --iterations 200
+
+Requires the backend's environment (.env with GROQ_API_KEY), since it imports the agent modules.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from typing import Callable, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.prompts import ChatPromptTemplate
+from prompt import DECISION_PROMPT, CHAT_DECISION_PROMPT, CHAT_ANSWER_PROMPT
+from schemas.rag_models import QueryDecision
+from schemas.chat_models import ChatQueryDecision, ChatCitedAnswer
+from chains_and_agents import rag_agent, chat_rag_agent
+
+
+def rebuild_rag_agent():
+    """Setup the RAG agent used to repeat on every request."""
+    graph = rag_agent.build_query_graph()
+    prompt = ChatPromptTemplate.from_template(DECISION_PROMPT)
+    model = rag_agent.chat_model.with_structured_output(QueryDecision)
+    return graph, prompt, model
+
+
+def reuse_rag_agent():
+    return rag_agent.query_graph, rag_agent.decision_prompt, rag_agent.structured_decision_model
+
+
+def rebuild_chat_agent():
+    """Setup the chat agent used to repeat on every message."""
+    graph = chat_rag_agent.build_chat_graph()
+    decision_prompt = ChatPromptTemplate.from_template(CHAT_DECISION_PROMPT)
+    decision_model = chat_rag_agent.chat_model.with_structured_output(ChatQueryDecision)
+    answer_prompt = ChatPromptTemplate.from_template(CHAT_ANSWER_PROMPT)
+    answer_model = chat_rag_agent.chat_model.with_structured_output(ChatCitedAnswer)
+    return graph, decision_prompt, decision_model, answer_prompt, answer_model
+
+
+def reuse_chat_agent():
+    return (chat_rag_agent.chat_graph, chat_rag_agent.decision_prompt, chat_rag_agent.structured_decision_model,
+            chat_rag_agent.answer_prompt, chat_rag_agent.structured_answer_model)
+
+
+def measure(func: Callable, iterations: int) -> Dict[str, float]:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": statistics.median(timings),
+        "p95_ms": timings[max(int(len(timings) * 0.95) - 1, 0)],
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    cases = [
+        ("rag agent, rebuilt per request", rebuild_rag_agent),
+        ("rag agent, compiled once", reuse_rag_agent),
+        ("chat agent, rebuilt per request", rebuild_chat_agent),
+        ("chat agent, compiled once", reuse_chat_agent),
+    ]
+    print(f"{'case':<32} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9}")
+    for name, func in cases:
+        func()  # warm up imports and caches
+        result = measure(func, args.iterations)
+        print(f"{name:<32} {result['mean_ms']:>9.3f} {result['p50_ms']:>9.3f} {result['p95_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    main(parser.parse_args())
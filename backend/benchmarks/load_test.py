@@ -0,0 +1,97 @@
+"""Concurrency load test for the question-answering endpoints.
+
+Fires requests at increasing concurrency levels against a running backend and reports
+throughput and latency percentiles per level. Run it once against this version and once
+against a checkout of the previous sync handlers to compare how each scales:
+
+    python benchmarks/load_test.py --username alice --password secret \
+        --endpoint ask_documents --concurrency 1 8 32 128 --requests 256
+
+Requires `httpx` (pip install httpx) and a user with initialized documents.
+"""
+import time
+import asyncio
+import argparse
+import statistics
+from typing import Dict, List
+
+import httpx
+
+QUESTIONS = [
+    "What is the main topic of the document?",
+    "Summarize the key findings.",
+    "What methodology is described?",
+    "What are the conclusions?",
+]
+
+
+def build_request(endpoint: str, index: int) -> Dict:
+    question = QUESTIONS[index % len(QUESTIONS)]
+    if endpoint == "chat":
+        return {"url": "/chat/message", "json": {"message": question}}
+    return {"url": f"/chain/{endpoint}", "json": {"question": question, "word_length": 100}}
+
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> str:
+    response = await client.post("/auth/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def run_level(client: httpx.AsyncClient, endpoint: str, concurrency: int, total_requests: int) -> Dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one_request(index: int) -> None:
+        nonlocal errors
+        request = build_request(endpoint, index)
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post(request["url"], json=request["json"])
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except httpx.HTTPError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(total_requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total_requests,
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_s": statistics.median(latencies) if latencies else None,
+        "p95_s": latencies[int(len(latencies) * 0.95) - 1] if latencies else None,
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        token = await login(client, args.username, args.password)
+        client.headers["Authorization"] = f"Bearer {token}"
+
+        print(f"{'concurrency':>11} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 s':>8} {'p95 s':>8}")
+        for concurrency in args.concurrency:
+            result = await run_level(client, args.endpoint, concurrency, args.requests)
+            p50 = f"{result['p50_s']:.2f}" if result["p50_s"] is not None else "-"
+            p95 = f"{result['p95_s']:.2f}" if result["p95_s"] is not None else "-"
+            print(f"{result['concurrency']:>11} {result['requests']:>8} {result['errors']:>6} "
+                  f"{result['throughput_rps']:>8.2f} {p50:>8} {p95:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--username", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--endpoint", default="ask_documents", choices=["ask_documents", "ask_wikipedia", "ask_rag_agent", "chat"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--requests", type=int, default=128, help="Requests sent at each concurrency level")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,68 @@
+"""Latency of Wikipedia retrieval per backend, on a cold and a warm cache.
+
+Each question is retrieved twice: the first pass shows cold latency (a live API call for the "api"
+backend), the second shows the cached path. The "local" backend needs no network and should show
+flat latency in both passes once the index is loaded:
+
+    python benchmarks/wikipedia_latency.py --backend local
+    python benchmarks/wikipedia_latency.py --backend api local --k 4
+
+The "local" backend requires an index built with build_wikipedia_index.py.
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+import statistics
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.EmbeddingService import EmbeddingService
+from services.WikipediaService import WikipediaService
+
+QUESTIONS = [
+    "Who developed the theory of general relativity?",
+    "What is the capital of Australia?",
+    "How does photosynthesis work?",
+    "When did the Roman Empire fall?",
+    "What is a neural network?",
+]
+
+
+def run_pass(wikipedia: WikipediaService, questions: List[str], k: int) -> Dict[str, float]:
+    timings = []
+    for question in questions:
+        start = time.perf_counter()
+        wikipedia.retrieve(question, k=k)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": statistics.median(timings), "max_ms": max(timings)}
+
+
+def main(args: argparse.Namespace) -> None:
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    embedding_service = EmbeddingService()
+    embedding_service.warm_up()
+
+    print(f"{'backend':<8} {'pass':<5} {'p50 ms':>9} {'max ms':>9}")
+    for backend in args.backend:
+        os.environ["WIKIPEDIA_BACKEND"] = backend
+        # A fresh cache directory so the first pass is really cold
+        wikipedia = WikipediaService(
+            embedding_service,
+            cache_dir=tempfile.mkdtemp(prefix="wikipedia_cache_"),
+            local_index_dir=os.getenv("WIKIPEDIA_LOCAL_INDEX_DIR", os.path.join(project_root, "wikipedia_index"))
+        )
+        if backend == "local":
+            wikipedia.local_index()  # load once up front; index loading is not query latency
+        for name in ("cold", "warm"):
+            result = run_pass(wikipedia, QUESTIONS, args.k)
+            print(f"{backend:<8} {name:<5} {result['p50_ms']:>9.1f} {result['max_ms']:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", nargs="+", default=["local"], choices=["api", "local"])
+    parser.add_argument("--k", type=int, default=4)
+    main(parser.parse_args())
@@ -0,0 +1,40 @@
+"""Build the local Wikipedia index used when WIKIPEDIA_BACKEND=local.
+
+The dump is a JSON-lines file with one article per line and "title", "text" and optional "url"
+fields, e.g. an export of the Hugging Face `wikipedia` dataset filtered to the topics you need:
+
+    python build_wikipedia_index.py --dump wikipedia_subset.jsonl
+
+The index is written to WIKIPEDIA_LOCAL_INDEX_DIR (default ../wikipedia_index).
+"""
+import os
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.EmbeddingService import EmbeddingService
+from services.EmbeddingPipeline import EmbeddingPipeline
+from services.WikipediaService import WikipediaService
+
+
+def main(args: argparse.Namespace) -> None:
+    project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    embedding_service = EmbeddingService()
+    embedding_pipeline = EmbeddingPipeline(embedding_service)
+    wikipedia = WikipediaService(
+        embedding_service,
+        cache_dir=os.getenv("WIKIPEDIA_CACHE_DIR", os.path.join(project_root, "wikipedia_cache")),
+        local_index_dir=os.getenv("WIKIPEDIA_LOCAL_INDEX_DIR", os.path.join(project_root, "wikipedia_index"))
+    )
+    try:
+        chunk_count = wikipedia.build_local_index(args.dump, embedding_pipeline)
+    finally:
+        embedding_pipeline.shutdown()
+    print(f"Indexed {chunk_count} chunks into {wikipedia.local_index_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dump", required=True, help="JSON-lines file of Wikipedia articles")
+    main(parser.parse_args())
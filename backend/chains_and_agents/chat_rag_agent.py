@@ -1,14 +1,19 @@
 import uuid
 import re
+import asyncio
 import logging
 from datetime import datetime
-from typing import TypedDict, List, Dict, Any
+from typing import TypedDict, List, Dict, Any, Optional, AsyncIterator
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END, START
 from langchain_groq.chat_models import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from initalize_resources import resource_service
 from schemas.chat_models import ChatMessage, ChatQueryDecision, ChatCitedAnswer
-from prompt import CHAT_DECISION_PROMPT, CHAT_ANSWER_PROMPT
+from services.QueryRouterService import GREETING_RESPONSE
+from schemas.rag_models import RetrievalResult
+from chains_and_agents.rag_chain import start_retrieval, discard_retrievals, SPECULATIVE_RETRIEVAL
+from prompt import CHAT_DECISION_PROMPT, CHAT_ANSWER_PROMPT, CHAT_SUMMARY_PROMPT
 
 # Initialize logger
 logger = logging.getLogger(__name__)
@@ -16,20 +21,40 @@ logger = logging.getLogger(__name__)
 # Initialize the LLM
 chat_model = ChatGroq(model=resource_service.model, api_key=resource_service.api_key, temperature=0.2)
 
+# Prompts and structured-output runnables are stateless, so build them once
+decision_prompt = ChatPromptTemplate.from_template(CHAT_DECISION_PROMPT)
+answer_prompt = ChatPromptTemplate.from_template(CHAT_ANSWER_PROMPT)
+summary_prompt = ChatPromptTemplate.from_template(CHAT_SUMMARY_PROMPT)
+structured_decision_model = chat_model.with_structured_output(ChatQueryDecision)
+structured_answer_model = chat_model.with_structured_output(ChatCitedAnswer)
+
+# Most recent messages each prompt may include verbatim, within the history token budget
+DECISION_HISTORY_MESSAGES = 20
+ANSWER_HISTORY_MESSAGES = 15
+
 # Define the state schema
 class ChatState(TypedDict):
     session_id: str
+    user_id: Optional[int]
     message: str
     chat_history: List[ChatMessage]
+    summary: str  # rolling summary of the conversation before chat_history
+    new_messages: List[ChatMessage]  # this turn's user and assistant messages, appended to the stored session
     document_descriptions: str
     context: str
     answer: str
     citations: List[int]
     action: str
     follow_up_question: str
+    stream: bool  # emit answer tokens through the graph's custom stream
+    prefetch: Dict[str, Any]  # speculative retrieval tasks by normalized query, started during the decision
+
+def retrieve_for_user(user_id: Optional[int]):
+    """Retriever over the user's vectorstore, as used by the retrieve_and_answer node."""
+    return lambda input: resource_service.formatted_retrieve_docs(input["question"], 3, user_id)
 
 # Decision node: Determine query type and generate appropriate response or follow-up question
-def decision_node(state: ChatState) -> ChatState:
+async def decision_node(state: ChatState) -> ChatState:
     """
     Classify the message and decide how to respond:
     - For greetings: Provide direct response
@@ -39,21 +64,30 @@ def decision_node(state: ChatState) -> ChatState:
     """
     logger.info(f"Processing in decision node: session {state['session_id']}")
     
-    # Format chat history for context - use last 20 messages for better context
+    # Format chat history for context - the rolling summary and the recent messages that fit the token budget
     history = state["chat_history"]
-    formatted_history = ""
-    if history:
-        recent_history = history[-20:] if len(history) > 20 else history
-        # Only include role and content in the formatted history, exclude citations details
-        formatted_history = "\n".join([f"{msg.role.title()}: {msg.content}" for msg in recent_history])
-    
-    prompt = ChatPromptTemplate.from_template(CHAT_DECISION_PROMPT)
-    structured_chat_model = chat_model.with_structured_output(ChatQueryDecision)
-    result = structured_chat_model.invoke(prompt.invoke({
-        "message": state["message"], 
-        "document_descriptions": state["document_descriptions"],
-        "chat_history": formatted_history
-    }))
+    formatted_history = resource_service.chat_history.build(history, state["summary"], DECISION_HISTORY_MESSAGES)
+    
+    # Obvious greetings and self-contained document questions are routed locally, skipping the LLM call
+    standalone = not state["summary"] and not any(msg.role == "user" for msg in history)
+    local_route = await asyncio.to_thread(resource_service.query_router.route, state["message"],
+                                          state["document_descriptions"], standalone)
+    if local_route == "greeting":
+        result = ChatQueryDecision(query_type="greeting", response=GREETING_RESPONSE, follow_up_question="")
+    elif local_route == "document_search":
+        result = ChatQueryDecision(query_type="document_search", response="", follow_up_question=state["message"])
+    else:
+        if SPECULATIVE_RETRIEVAL:
+            # Retrieve for the message as written while the LLM classifies it; used only if it is not rewritten
+            query_key = resource_service.embedding_service.normalize_query(state["message"])
+            state["prefetch"][query_key] = start_retrieval(retrieve_for_user(state["user_id"]), state["message"])
+        prompt_value = decision_prompt.invoke({
+            "message": state["message"], 
+            "document_descriptions": state["document_descriptions"],
+            "chat_history": formatted_history
+        })
+        resource_service.chat_history.record("decision", prompt_value.to_string(), formatted_history)
+        result = await structured_decision_model.ainvoke(prompt_value)
     
     logger.info(f"Message classified as: {result.query_type}")
     
@@ -79,6 +113,7 @@ def decision_node(state: ChatState) -> ChatState:
             "answer": result.response,
             "citations": [],
             "chat_history": updated_history,
+            "new_messages": [user_message, assistant_message],
             "follow_up_question": ""
         }
     else:  # document_search - use RAG system
@@ -97,7 +132,7 @@ def decision_node(state: ChatState) -> ChatState:
         }
 
 # Retrieve and answer node: Retrieve context and generate answer
-def retrieve_and_answer_node(state: ChatState) -> ChatState:
+async def retrieve_and_answer_node(state: ChatState) -> ChatState:
     """Retrieve relevant context and generate an answer."""
     logger.info(f"Processing in retrieve_and_answer node: session {state['session_id']}")
     
@@ -109,31 +144,42 @@ def retrieve_and_answer_node(state: ChatState) -> ChatState:
         logger.info(f"Using follow-up question for retrieval: '{query}'")
     
     try:
-        context = resource_service.formatted_retrieve_docs(query, k=3)
-        logger.info(f"Retrieved {context.count('Source ID:')} documents")
+        task = state["prefetch"].pop(resource_service.embedding_service.normalize_query(query), None)
+        if task is not None:
+            retrieval = await task
+        else:
+            # FAISS search and query embedding are CPU-bound, so keep them off the event loop
+            retrieval = await asyncio.to_thread(resource_service.formatted_retrieve_docs, query, 3, state["user_id"])
+        logger.info(f"Retrieved {len(retrieval.docs)} documents")
     except Exception as e:
         logger.error(f"Error retrieving documents: {str(e)}")
-        context = f"Error retrieving documents: {str(e)}"
+        retrieval = RetrievalResult(docs=[], context=f"Error retrieving documents: {str(e)}")
+    context = retrieval.context
     
-    # Format chat history for context - use last 15 messages for RAG context
-    history = state["chat_history"]
-    formatted_history = ""
-    if history:
-        recent_history = history[-15:] if len(history) > 15 else history
-        # Only include role and content in the formatted history, exclude citations details
-        formatted_history = "\n".join([f"{msg.role.title()}: {msg.content}" for msg in recent_history])
+    # Format chat history for context - the rolling summary and the recent messages that fit the token budget
+    formatted_history = resource_service.chat_history.build(state["chat_history"], state["summary"], ANSWER_HISTORY_MESSAGES)
 
     # Invoke the model
-    prompt = ChatPromptTemplate.from_template(CHAT_ANSWER_PROMPT)
-    structured_chat_model = chat_model.with_structured_output(ChatCitedAnswer)
-    response = structured_chat_model.invoke(prompt.invoke({
+    prompt_value = answer_prompt.invoke({
         "context": context,
         "message": state["message"],
         "chat_history": formatted_history
-    }))
+    })
+    resource_service.chat_history.record("answer", prompt_value.to_string(), formatted_history)
+    if state.get("stream", False):
+        # Stream plain text so tokens reach the client as they are generated
+        writer = get_stream_writer()
+        answer = ""
+        async for chunk in chat_model.astream(prompt_value):
+            if chunk.content:
+                answer += chunk.content
+                writer({"type": "token", "content": chunk.content})
+        answer = answer.strip()
+    else:
+        response = await structured_answer_model.ainvoke(prompt_value)
+        answer = response.answer
     
     # Extract answer and citations
-    answer = response.answer
     citation_numbers = [int(num) for num in re.findall(r'\[(\d+)\]', answer)]
     citations = sorted(set(citation_numbers)) if citation_numbers else []
     
@@ -141,7 +187,7 @@ def retrieve_and_answer_node(state: ChatState) -> ChatState:
     mapped_citations = []
     if citations:
         try:
-            mapped_citations = resource_service.map_citations_to_metadata(citations)
+            mapped_citations = resource_service.map_citations_to_metadata(citations, retrieval.docs)
         except Exception as e:
             logger.error(f"Error mapping citations: {str(e)}")
     
@@ -166,6 +212,7 @@ def retrieve_and_answer_node(state: ChatState) -> ChatState:
         "answer": answer,
         "citations": citations,
         "chat_history": updated_history,
+        "new_messages": [user_message, assistant_message],
         "action": "end"
     }
 
@@ -199,33 +246,68 @@ def build_chat_graph():
     compiled_graph = workflow.compile()
     return compiled_graph
 
+# Compiled once and shared by all sessions; conversation state is passed in with each message
+chat_graph = build_chat_graph()
+
 # API functions
 def start_chat_session(user_id: int) -> str:
     """Start a new chat session and return session ID."""
     return str(uuid.uuid4())
 
-def process_chat_message(session_id: str, message: str, chat_history: List[ChatMessage], document_descriptions: str) -> Dict[str, Any]:
+async def process_chat_message(session_id: str, message: str, chat_history: List[ChatMessage], document_descriptions: str,
+                         user_id: Optional[int] = None, summary: str = "") -> Dict[str, Any]:
     logger.info(f"Processing message for session {session_id}")
     
-    # Initialize graph
-    graph = build_chat_graph()
-
     # Create initial state
-    state = ChatState(
+    state = build_initial_state(session_id, message, chat_history, document_descriptions, user_id, summary)
+    
+    # Run graph
+    try:
+        result = await chat_graph.ainvoke(state)
+    finally:
+        discard_retrievals(state["prefetch"].values())
+    return format_result(session_id, result)
+
+async def stream_chat_message(session_id: str, message: str, chat_history: List[ChatMessage], document_descriptions: str,
+                              user_id: Optional[int] = None, summary: str = "") -> AsyncIterator[Dict[str, Any]]:
+    """Process a message, yielding answer token events as they are generated and then a final event with the result."""
+    logger.info(f"Streaming message for session {session_id}")
+    
+    state = build_initial_state(session_id, message, chat_history, document_descriptions, user_id, summary, stream=True)
+    
+    result = state
+    try:
+        async for mode, chunk in chat_graph.astream(state, stream_mode=["custom", "values"]):
+            if mode == "custom":
+                yield chunk
+            else:
+                result = chunk
+    finally:
+        discard_retrievals(state["prefetch"].values())
+    
+    yield {"type": "final", **format_result(session_id, result)}
+
+def build_initial_state(session_id: str, message: str, chat_history: List[ChatMessage], document_descriptions: str,
+                        user_id: Optional[int], summary: str = "", stream: bool = False) -> ChatState:
+    return ChatState(
         session_id=session_id,
+        user_id=user_id,
         message=message,
         chat_history=chat_history,
+        summary=summary,
+        new_messages=[],
         document_descriptions=document_descriptions,
         context="",
         answer="",
         citations=[],
         action="",
-        follow_up_question=""
+        follow_up_question="",
+        stream=stream,
+        prefetch={}
     )
-    
-    # Run graph
-    result = graph.invoke(state)
-    
+
+def format_result(session_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the chat response from the final graph state."""
     # Get citation data from the last assistant message (if it exists) from history
     last_message = next((msg for msg in reversed(result["chat_history"]) if msg.role == "assistant"), None)
     citations_for_response = []
@@ -237,5 +319,16 @@ def process_chat_message(session_id: str, message: str, chat_history: List[ChatM
         "session_id": session_id,
         "answer": result["answer"],
         "citations": citations_for_response,
-        "history": result["chat_history"]
+        "new_messages": result["new_messages"]
     }
+
+async def summarize_conversation(summary: str, messages: List[ChatMessage]) -> str:
+    """Fold messages into a conversation's rolling summary."""
+    prompt_value = summary_prompt.invoke({
+        "summary": summary or "(none yet)",
+        "messages": "\n".join(resource_service.chat_history.format_message(msg) for msg in messages),
+        "max_words": resource_service.chat_history.summary_max_words
+    })
+    resource_service.chat_history.record("summary", prompt_value.to_string(), summary)
+    response = await chat_model.ainvoke(prompt_value)
+    return response.content.strip()
@@ -1,31 +1,23 @@
 from langchain_core.prompts import ChatPromptTemplate
 from schemas.rag_models import SummarizeAnswer
 from prompt import SUMMARIZE_PROMPT
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_groq.chat_models import ChatGroq
 from initalize_resources import resource_service
 
 chat_model = ChatGroq(model=resource_service.model, api_key=resource_service.api_key, temperature=0.2)
 structured_chat_model= chat_model.with_structured_output(SummarizeAnswer)
+summarize_prompt = ChatPromptTemplate.from_template(SUMMARIZE_PROMPT)
 
 def summarize_document(file_path: str, max_pages: int=3):
-    loader = PyPDFLoader(file_path)
-    pages = loader.load()
-    if len(pages)<max_pages:
-        max_pages = len(pages)
-    pages = pages[:max_pages]
+    # Extracts and caches every page on first use, so indexing later reuses the same parse
+    pages = list(resource_service.load_pages(file_path, limit=max_pages))
     if not pages:
         return "Document appears to be empty."
     
-    # Combine content from pages
-    content = "\n\n".join([page.page_content for page in pages])
-    
-    # Truncate if too long (Groq has context limits)
-    if len(content) > 12000:
-        content = content[:12000] + "..."
-
-    prompt = ChatPromptTemplate.from_template(SUMMARIZE_PROMPT)
+    # Combine content from pages within the summary token budget (Groq has context limits), sharing it across
+    # pages and dropping repeated headers and footers instead of cutting the text off after the first pages
+    content = resource_service.context_packer.fit_text([page.page_content for page in pages])
     
     # Summarize using LLM
-    response = structured_chat_model.invoke(prompt.invoke({"content": content}))
+    response = structured_chat_model.invoke(summarize_prompt.invoke({"content": content}))
     return response.summary
@@ -1,19 +1,28 @@
+import asyncio
 import logging
-from typing import TypedDict, List, Dict, Any
+from typing import TypedDict, List, Dict, Any, Optional, AsyncIterator
 from langchain_groq import ChatGroq
+from langgraph.config import get_stream_writer
 from langgraph.graph import StateGraph, END, START
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.documents import Document
 from initalize_resources import resource_service
 from prompt import DECISION_PROMPT
-from schemas.rag_models import QueryDecision, RagInput
-from chains_and_agents.rag_chain import rag_chain, wikipedia_rag_chain
+from services.QueryRouterService import GREETING_RESPONSE
+from schemas.rag_models import QueryDecision, RagInput, RagResponse
+from chains_and_agents.rag_chain import (rag_chain, wikipedia_rag_chain, answer_chain, stream_rag_answer,
+                                         vector_store_retriever, wikipedia_retriever, start_retrieval,
+                                         discard_retrievals, SPECULATIVE_RETRIEVAL)
 
 # Initialize logger
 logger = logging.getLogger(__name__)
 
 chat_model = ChatGroq(model=resource_service.model, api_key=resource_service.api_key, temperature=0.1)
+decision_prompt = ChatPromptTemplate.from_template(DECISION_PROMPT)
+structured_decision_model = chat_model.with_structured_output(QueryDecision)
 
 class QueryState(TypedDict):
+    user_id: Optional[int]
     question: str                   
     word_length: int                
     document_descriptions: str       
@@ -21,12 +30,63 @@ class QueryState(TypedDict):
     action: str                      
     answer: str                      
     citations: List[int]
+    retrieved_docs: List[Document]
+    stream: bool                     # emit answer tokens through the graph's custom stream
+    prefetch: Dict[str, Any]         # speculative retrieval tasks by action, started during the decision
 
-def decision_node(state: QueryState) -> QueryState:
+async def generate_answer(state: QueryState, chain, retriever_func, action: str, config: Optional[dict] = None) -> RagResponse:
+    """Answer with the given RAG chain, forwarding tokens to the stream writer when streaming.
+
+    Retrieval that was started speculatively for this action is awaited instead of run again.
+    """
+    input_data = RagInput(question=state["question"], word_length=state["word_length"])
+    task = state["prefetch"].pop(action, None)
+    retrieval = await task if task is not None else None
+
+    if not state.get("stream", False):
+        if retrieval is not None:
+            return await answer_chain.ainvoke({
+                "question": input_data.question,
+                "word_length": input_data.word_length,
+                "retrieval": retrieval
+            })
+        return await chain.ainvoke(input_data, config=config)
+
+    writer = get_stream_writer()
+    response = None
+    async for event in stream_rag_answer(input_data, retriever_func, config=config, retrieval=retrieval):
+        if event["type"] == "token":
+            writer(event)
+        else:
+            response = event["response"]
+    return response
+
+async def decision_node(state: QueryState) -> QueryState:
     """Determine the best path for answering the query."""
-    prompt = ChatPromptTemplate.from_template(DECISION_PROMPT)
-    structured_chat_model = chat_model.with_structured_output(QueryDecision)
-    result = structured_chat_model.invoke(prompt.invoke({
+    # Obvious greetings and document questions are routed locally, skipping the LLM call
+    local_route = await asyncio.to_thread(resource_service.query_router.route, state["question"], state["document_descriptions"])
+    if local_route == "greeting":
+        return {
+            **state,
+            "action": "end",
+            "answer": GREETING_RESPONSE,
+            "citations": []
+        }
+    elif local_route == "document_search":
+        return {
+            **state,
+            "action": "vector_store"
+        }
+    
+    if SPECULATIVE_RETRIEVAL:
+        # Retrieve while the LLM classifies; the route not taken is cancelled when the graph finishes
+        state["prefetch"]["vector_store"] = start_retrieval(
+            vector_store_retriever, state["question"], config={"configurable": {"user_id": state["user_id"]}},
+            word_length=state["word_length"])
+        if state.get("approve_web_search", False):
+            state["prefetch"]["wikipedia"] = start_retrieval(wikipedia_retriever, state["question"], word_length=state["word_length"])
+    
+    result = await structured_decision_model.ainvoke(decision_prompt.invoke({
         "question": state["question"], 
         "document_descriptions": state["document_descriptions"]
     }))
@@ -59,12 +119,10 @@ def decision_node(state: QueryState) -> QueryState:
             }
     
 
-def vector_store_node(state: QueryState) -> QueryState:
+async def vector_store_node(state: QueryState) -> QueryState:
     """Retrieve from vector store and generate an answer."""
-    response = rag_chain.invoke(RagInput(
-        question=state["question"], 
-        word_length=state["word_length"]
-    ))
+    response = await generate_answer(state, rag_chain, vector_store_retriever, "vector_store",
+                                     config={"configurable": {"user_id": state["user_id"]}})
     
     needs_web_search = "don't know based on the provided information" in response.answer.lower()
     
@@ -72,6 +130,9 @@ def vector_store_node(state: QueryState) -> QueryState:
     if needs_web_search and state.get("approve_web_search", False):
         # Go to Wikipedia for additional information
         logger.debug("Vector store: Insufficient information. Using web search.")
+        if state.get("stream", False):
+            # Discard anything already streamed from the vector store answer
+            get_stream_writer()({"type": "reset"})
         return {
             **state,
             "action": "wikipedia"
@@ -87,21 +148,20 @@ def vector_store_node(state: QueryState) -> QueryState:
             **state,
             "action": "end",
             "answer": response.answer,
-            "citations": response.citations
+            "citations": response.citations,
+            "retrieved_docs": response.retrieved_docs
         }
 
-def wikipedia_node(state: QueryState) -> QueryState:
+async def wikipedia_node(state: QueryState) -> QueryState:
     """Retrieve from Wikipedia and generate an answer."""
-    response = wikipedia_rag_chain.invoke(RagInput(
-        question=state["question"], 
-        word_length=state["word_length"]
-    ))
+    response = await generate_answer(state, wikipedia_rag_chain, wikipedia_retriever, "wikipedia")
     
     return {
         **state,
         "action": "end",
         "answer": response.answer,
-        "citations": response.citations
+        "citations": response.citations,
+        "retrieved_docs": response.retrieved_docs
     }
 
 def route_next_step(state: QueryState) -> str:
@@ -132,37 +192,78 @@ def build_query_graph():
     workflow.add_edge("wikipedia", END)
     return workflow.compile()
 
-def execute_rag_agent(question: str, document_descriptions: str, word_length: int = 250, approve_web_search: bool = False) -> Dict[str, Any]:
+# Compiled once and shared by all requests; the graph holds no per-request state
+query_graph = build_query_graph()
+
+def build_initial_state(question: str, document_descriptions: str, word_length: int, approve_web_search: bool,
+                        user_id: Optional[int], stream: bool = False) -> QueryState:
+    return QueryState(
+        user_id=user_id,
+        question=question,
+        word_length=word_length,
+        document_descriptions=document_descriptions,
+        action="",
+        answer="",
+        citations=[],
+        retrieved_docs=[],
+        approve_web_search=approve_web_search,
+        stream=stream,
+        prefetch={}
+    )
+
+def format_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the agent's response from the final graph state."""
+    mapped_citations = []
+    if "citations" in result and result["citations"]:
+        mapped_citations = resource_service.map_citations_to_metadata(result["citations"], result.get("retrieved_docs", []))
+    
+    return {
+        "completed": True,
+        "answer": result.get("answer", ""),
+        "citations": mapped_citations,
+        "used_web_search": result.get("action") == "wikipedia"
+    }
+
+async def execute_rag_agent(question: str, document_descriptions: str, word_length: int = 250, approve_web_search: bool = False,
+                      user_id: Optional[int] = None) -> Dict[str, Any]:
     """Execute the RAG agent with the given parameters."""
+    initial_state = build_initial_state(question, document_descriptions, word_length, approve_web_search, user_id)
     try:
-        graph = build_query_graph()
-        initial_state = QueryState(
-            question=question,
-            word_length=word_length,
-            document_descriptions=document_descriptions,
-            action="",
-            answer="",
-            citations=[],
-            approve_web_search=approve_web_search
-        )
-        
-        result = graph.invoke(initial_state)
-        
-        mapped_citations = []
-        if "citations" in result and result["citations"]:
-            mapped_citations = resource_service.map_citations_to_metadata(result["citations"])
-        
+        result = await query_graph.ainvoke(initial_state)
+        return format_result(result)
+            
+    except Exception as e:
+        logger.error(f"Error processing question: {str(e)}", exc_info=True)
         return {
-            "completed": True,
-            "answer": result.get("answer", ""),
-            "citations": mapped_citations,
-            "used_web_search": result.get("action") == "wikipedia"
+            "completed": False,
+            "answer": f"Error processing your question: {str(e)}",
+            "citations": []
         }
+    finally:
+        discard_retrievals(initial_state["prefetch"].values())
+
+
+async def stream_rag_agent(question: str, document_descriptions: str, word_length: int = 250, approve_web_search: bool = False,
+                           user_id: Optional[int] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Run the RAG agent, yielding answer token events as they are generated and then a final event with the result."""
+    initial_state = build_initial_state(question, document_descriptions, word_length, approve_web_search, user_id, stream=True)
+    try:
+        result = initial_state
+        async for mode, chunk in query_graph.astream(initial_state, stream_mode=["custom", "values"]):
+            if mode == "custom":
+                yield chunk
+            else:
+                result = chunk
+        
+        yield {"type": "final", **format_result(result)}
             
     except Exception as e:
         logger.error(f"Error processing question: {str(e)}", exc_info=True)
-        return {
+        yield {
+            "type": "final",
             "completed": False,
             "answer": f"Error processing your question: {str(e)}",
             "citations": []
         }
+    finally:
+        discard_retrievals(initial_state["prefetch"].values())
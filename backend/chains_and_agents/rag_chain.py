@@ -1,47 +1,118 @@
+import os
 import re
+import asyncio
+from typing import Any, AsyncIterator, Dict, Iterable, Optional
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableParallel, RunnableLambda
-from schemas.rag_models import RagInput, CitedAnswer, RagResponse
-from prompt import RAG_PROMPT
+from langchain_core.runnables import RunnableConfig, RunnableParallel, RunnableLambda
+from schemas.rag_models import RagInput, CitedAnswer, RagResponse, RetrievalResult
+from prompt import RAG_PROMPT, RAG_STREAM_PROMPT
 from langchain_groq.chat_models import ChatGroq
 from initalize_resources import resource_service
 
 chat_model = ChatGroq(model=resource_service.model, api_key=resource_service.api_key, temperature=0.2)
 structured_chat_model = chat_model.with_structured_output(CitedAnswer)
 
-def vector_store_retriever(input: dict) -> str:
-    """Retrieve relevant documents based on the input question."""
+rag_prompt = ChatPromptTemplate.from_template(RAG_PROMPT)
+rag_stream_prompt = ChatPromptTemplate.from_template(RAG_STREAM_PROMPT)
+
+NO_ANSWER = "I don't know based on the provided information"
+
+# Start retrieval while the routing LLM call is in flight, discarding results the chosen route does not use
+SPECULATIVE_RETRIEVAL = os.getenv("SPECULATIVE_RETRIEVAL", "true").lower() == "true"
+
+def vector_store_retriever(input: dict, config: RunnableConfig) -> RetrievalResult:
+    """Retrieve relevant documents based on the input question from the requesting user's vectorstore."""
     question = input["question"]
-    docs = resource_service.formatted_retrieve_docs(question, k=4)
-    return docs
+    user_id = config.get("configurable", {}).get("user_id")
+    return resource_service.formatted_retrieve_docs(question, k=4, user_id=user_id, word_length=input.get("word_length"))
 
-def wikipedia_retriever(input: dict) -> str:
+def wikipedia_retriever(input: dict) -> RetrievalResult:
     """Retrieve relevant chunks from wikipedia based on the input question."""
     question = input["question"]
-    docs = resource_service.wikipedia_retriever(question, k=4)
-    return docs
+    return resource_service.wikipedia_retriever(question, k=4, word_length=input.get("word_length"))
 
-def get_prompt_template(input: dict) -> str:
-    rag_prompt = ChatPromptTemplate.from_template(RAG_PROMPT)
-    return rag_prompt.invoke(input)
+def get_prompt_template(input: dict, prompt_template: ChatPromptTemplate = rag_prompt) -> str:
+    return prompt_template.invoke({
+        "question": input["question"],
+        "word_length": input["word_length"],
+        "context": input["retrieval"].context
+    })
 
-def format_response(llm_response) -> RagResponse:
-    """Convert raw text with citations to RagResponse format."""
+def format_response(input: dict) -> RagResponse:
+    """Convert raw text with citations to RagResponse format, keeping the docs the citations refer to."""
+    llm_response = input["llm_response"]
     citation_numbers = [int(num) for num in re.findall(r'\[(\d+)\]', llm_response.answer)]
     return RagResponse(
         answer=llm_response.answer,
-        citations=sorted(set(citation_numbers)) if citation_numbers else [])
+        citations=sorted(set(citation_numbers)) if citation_numbers else [],
+        retrieved_docs=input["retrieval"].docs)
+
+# Answers from an already retrieved context: {"question", "word_length", "retrieval"} -> RagResponse
+answer_chain = RunnableParallel(
+    {
+        "llm_response": RunnableLambda(get_prompt_template) | structured_chat_model,
+        "retrieval": lambda x: x["retrieval"],
+    }
+) | RunnableLambda(format_response)
 
 def build_rag_chain(retriever_func):
     _inputs = RunnableParallel(
         {
             "question": lambda x: x.question,
             "word_length": lambda x: x.word_length,
-            "context": {"question": lambda x: x.question} | RunnableLambda(retriever_func),
+            "retrieval": {"question": lambda x: x.question, "word_length": lambda x: x.word_length} | RunnableLambda(retriever_func),
         }
     ).with_types(input_type=RagInput)
-    chain = _inputs | RunnableLambda(get_prompt_template) | structured_chat_model | RunnableLambda(format_response)
+    chain = _inputs | answer_chain
     return chain
 
 rag_chain = build_rag_chain(vector_store_retriever)
 wikipedia_rag_chain = build_rag_chain(wikipedia_retriever)
+
+
+def start_retrieval(retriever_func, question: str, config: Optional[RunnableConfig] = None,
+                    word_length: Optional[int] = None) -> asyncio.Task:
+    """Run a retriever in the background so it overlaps with other work, such as the routing LLM call."""
+    return asyncio.create_task(RunnableLambda(retriever_func).ainvoke({"question": question, "word_length": word_length}, config=config))
+
+def discard_retrievals(tasks: Iterable[asyncio.Task]) -> None:
+    """Cancel speculative retrievals that were not used."""
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            task.exception()  # mark a failure as handled; the result was never needed
+
+async def stream_rag_answer(input_data: RagInput, retriever_func, config: Optional[RunnableConfig] = None,
+                            retrieval: Optional[RetrievalResult] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Stream the answer as plain-text token events, then yield a final event with the parsed RagResponse.
+
+    Text that may still turn out to be the "I don't know" reply is held back, so callers can replace or reroute it unseen.
+    A `retrieval` that was already fetched is used instead of calling the retriever.
+    """
+    if retrieval is None:
+        retrieval = await RunnableLambda(retriever_func).ainvoke({"question": input_data.question, "word_length": input_data.word_length},
+                                                                  config=config)
+    prompt = get_prompt_template({
+        "question": input_data.question,
+        "word_length": input_data.word_length,
+        "retrieval": retrieval
+    }, prompt_template=rag_stream_prompt)
+
+    answer = ""
+    held_back = True
+    async for chunk in chat_model.astream(prompt):
+        if not chunk.content:
+            continue
+        answer += chunk.content
+        if held_back:
+            start = answer.strip().lower()
+            if NO_ANSWER.lower().startswith(start) or start.startswith(NO_ANSWER.lower()):
+                continue
+            held_back = False
+            yield {"type": "token", "content": answer}
+        else:
+            yield {"type": "token", "content": chunk.content}
+
+    response = format_response({"llm_response": CitedAnswer(answer=answer.strip()), "retrieval": retrieval})
+    yield {"type": "response", "response": response}
@@ -0,0 +1,50 @@
+"""add message positions and citation chunks
+
+Revision ID: a4f2c7e91d35
+Revises: 7c1e4d9a2b6f
+Create Date: 2026-10-18 14:47:05.613920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4f2c7e91d35'
+down_revision: Union[str, None] = '7c1e4d9a2b6f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_messages', sa.Column('position', sa.Integer(), nullable=True))
+    # Number existing messages in insertion order within their session
+    op.execute(
+        "UPDATE chat_messages SET position = ("
+        "SELECT COUNT(*) FROM chat_messages AS earlier "
+        "WHERE earlier.session_id = chat_messages.session_id AND earlier.id < chat_messages.id)"
+    )
+    with op.batch_alter_table('chat_messages') as batch_op:
+        batch_op.alter_column('position', existing_type=sa.Integer(), nullable=False)
+    op.drop_index('ix_chat_messages_session_id_id', table_name='chat_messages')
+    op.create_index('ix_chat_messages_session_id_position', 'chat_messages', ['session_id', 'position'], unique=True)
+    op.create_table('citation_chunks',
+    sa.Column('id', sa.String(), nullable=False),
+    sa.Column('page_content', sa.Text(), nullable=False),
+    sa.Column('source', sa.String(), nullable=True),
+    sa.Column('page', sa.Integer(), nullable=True),
+    sa.Column('page_label', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('citation_chunks')
+    op.drop_index('ix_chat_messages_session_id_position', table_name='chat_messages')
+    op.create_index('ix_chat_messages_session_id_id', 'chat_messages', ['session_id', 'id'], unique=False)
+    with op.batch_alter_table('chat_messages') as batch_op:
+        batch_op.drop_column('position')
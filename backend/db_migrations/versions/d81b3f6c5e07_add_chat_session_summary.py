@@ -0,0 +1,31 @@
+"""add chat session summary
+
+Revision ID: d81b3f6c5e07
+Revises: a4f2c7e91d35
+Create Date: 2026-10-18 15:06:27.514902
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd81b3f6c5e07'
+down_revision: Union[str, None] = 'a4f2c7e91d35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_sessions', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('chat_sessions', sa.Column('summarized_count', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('chat_sessions') as batch_op:
+        batch_op.drop_column('summarized_count')
+        batch_op.drop_column('summary')
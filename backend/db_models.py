@@ -1,5 +1,5 @@
 from typing import Dict, Any
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text, JSON, Index
 from services.DataBaseConfig import Base
 
 class Users(Base):
@@ -41,3 +41,64 @@ class UploadedFiles(Base):
             "upload_date": self.upload_date,
             "user_id": self.user_id
         }
+
+class ChatSessions(Base):
+    __tablename__ = "chat_sessions"
+    id = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    message_count = Column(Integer, nullable=False, default=0)
+    summary = Column(Text)  # rolling summary of the messages before position summarized_count
+    summarized_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, nullable=False)
+    last_active_at = Column(DateTime, nullable=False, index=True)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "user_id": self.user_id,
+            "message_count": self.message_count,
+            "summary": self.summary,
+            "summarized_count": self.summarized_count,
+            "created_at": self.created_at,
+            "last_active_at": self.last_active_at
+        }
+
+class ChatMessages(Base):
+    __tablename__ = "chat_messages"
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String, ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)  # 0-based index of the message within its session
+    role = Column(String, nullable=False)
+    content = Column(Text, nullable=False)
+    timestamp = Column(String, nullable=False)
+    citations = Column(JSON)
+
+    __table_args__ = (Index("ix_chat_messages_session_id_position", "session_id", "position", unique=True),)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "session_id": self.session_id,
+            "position": self.position,
+            "role": self.role,
+            "content": self.content,
+            "timestamp": self.timestamp,
+            "citations": self.citations
+        }
+
+class CitationChunks(Base):
+    __tablename__ = "citation_chunks"
+    id = Column(String, primary_key=True)  # content hash, see chunk_id in RAGResourceServices
+    page_content = Column(Text, nullable=False)
+    source = Column(String)
+    page = Column(Integer)
+    page_label = Column(String)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "chunk_id": self.id,
+            "page_content": self.page_content,
+            "source": self.source,
+            "page": self.page,
+            "page_label": self.page_label
+        }
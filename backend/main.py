@@ -1,14 +1,29 @@
 import os
 import sys
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from route.auth_route import auth_router
 from route.rag_route import chain_router
 from route.file_route import file_router
-from route.chat_route import chat_router
+from route.chat_route import chat_router, session_manager
+from initalize_resources import resource_service
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the shared embedding and reranker models before serving so the first request doesn't pay for them
+    if os.getenv("EMBEDDING_WARMUP", "true").lower() == "true":
+        resource_service.embedding_service.warm_up()
+        if resource_service.reranker.mode == "cross_encoder":
+            resource_service.reranker.model()
+    yield
+    session_manager.shutdown()
+    resource_service.embedding_pipeline.shutdown()
+    resource_service.pdf_parser.shutdown()
+    resource_service.embedding_service.unload()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS for all origins
 app.add_middleware(
@@ -30,4 +45,8 @@ app.include_router(chat_router)
 
 if __name__ == "__main__":
     sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # Each worker has its own vectorstores, answer cache and /chain/status progress. Users' selections and
+    # chat sessions are on disk, so any worker answers with the current selection (recomposing it on first
+    # use), but initialization progress and cached answers are only seen by the worker that produced them
+    workers = int(os.getenv("UVICORN_WORKERS", "1"))
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=workers == 1, workers=workers)
@@ -26,6 +26,12 @@ RAG_PROMPT = """You are a precise information assistant that answers questions u
 """
 
 
+# Streaming variant: the answer is streamed as plain text instead of a structured JSON object
+RAG_STREAM_PROMPT = RAG_PROMPT.split("### OUTPUT FORMAT:")[0] + """### OUTPUT FORMAT:
+Reply with the answer text only, with citations as described above. Do not wrap it in JSON or quotes.
+"""
+
+
 SUMMARIZE_PROMPT = """You are an expert document summarizer.
 Create a concise 2-3 line summary from the first 3 pages content of document given below.
 Focus on the main topic, purpose, and key information. Write in a professional, objective tone.
@@ -115,3 +121,19 @@ CHAT_ANSWER_PROMPT = """You are a helpful document chat assistant that answers q
 6. Use pronouns clearly and consistently when referring to previously mentioned entities
 7. Never explain your citation process or mention that you're using citations
 """
+
+
+CHAT_SUMMARY_PROMPT = """Update the running summary of a conversation between a user and a document assistant.
+
+### CURRENT SUMMARY:
+{summary}
+
+### NEW MESSAGES TO ADD:
+{messages}
+
+### INSTRUCTIONS:
+1. Return a single updated summary that covers the current summary and the new messages
+2. Keep the names, documents, facts and open questions needed to follow up on the conversation
+3. Drop greetings, pleasantries and citation markers
+4. Use at most {max_words} words and return only the summary text
+"""
@@ -1,13 +1,19 @@
+import asyncio
 import logging
 from datetime import datetime
-from typing import Annotated, List
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Annotated, Any, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
 from sqlalchemy.orm import Session
 
 from services import AuthService, DataBaseConfig, SessionManager
-from schemas.chat_models import ChatInput, ChatResponse, ChatMessage
-from chains_and_agents.chat_rag_agent import start_chat_session, process_chat_message
+from schemas.chat_models import ChatInput, ChatResponse, ChatMessage, ChatHistoryPage
+from chains_and_agents.chat_rag_agent import (start_chat_session, process_chat_message, stream_chat_message,
+                                               summarize_conversation, DECISION_HISTORY_MESSAGES)
+from initalize_resources import resource_service
 from route.file_route import get_document_descriptions
+from route.rag_route import streaming_response
 
 # Initialize logger
 logger = logging.getLogger(__name__)
@@ -18,6 +24,51 @@ db_config = DataBaseConfig()
 session_manager = SessionManager()
 user_dependency = Annotated[dict, Depends(auth_service.get_current_user)]
 db_dependency = Annotated[Session, Depends(db_config.get_db)]
+MAX_CHUNKS_PER_REQUEST = 50
+# Summary updates in flight, at most one per session
+summary_tasks: Dict[str, asyncio.Task] = {}
+
+
+def record_turn(session_id: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Append a turn's messages to the session and build the delta response: only the new messages and the cursor."""
+    messages, cursor = session_manager.append_messages(session_id, result["new_messages"])
+    assistant_message = next((msg for msg in reversed(messages) if msg.role == "assistant"), None)
+    return {
+        "session_id": session_id,
+        "answer": result["answer"],
+        "citations": (assistant_message.citations or []) if assistant_message else [],
+        "messages": messages,
+        "cursor": cursor
+    }
+
+
+async def update_summary(session_id: str) -> None:
+    """Fold the messages that no longer fit in the chat prompts into the session's rolling summary."""
+    conversation = await run_in_threadpool(session_manager.get_conversation, session_id)
+    if conversation is None:
+        return
+    messages, summary, start = conversation
+    folded = resource_service.chat_history.messages_to_fold(messages, DECISION_HISTORY_MESSAGES)
+    if not folded:
+        return
+    try:
+        updated_summary = await summarize_conversation(summary, folded)
+        await run_in_threadpool(session_manager.save_summary, session_id, updated_summary, start + len(folded))
+        resource_service.chat_history.record_summary_update(len(folded), succeeded=True)
+        logger.info(f"Folded {len(folded)} messages into the summary of session {session_id}")
+    except Exception as e:
+        # The messages stay in the history and are folded by a later update
+        resource_service.chat_history.record_summary_update(len(folded), succeeded=False)
+        logger.error(f"Error updating summary of session {session_id}: {str(e)}")
+
+
+def schedule_summary_update(session_id: str) -> None:
+    """Update the session's summary after the reply has been sent, off the request path."""
+    if session_id in summary_tasks:
+        return
+    task = asyncio.create_task(update_summary(session_id))
+    summary_tasks[session_id] = task
+    task.add_done_callback(lambda _: summary_tasks.pop(session_id, None))
 
 @chat_router.post("/start", response_model=ChatResponse)
 def start_new_chat(user: user_dependency, db: db_dependency):
@@ -37,13 +88,14 @@ def start_new_chat(user: user_dependency, db: db_dependency):
         citations=None
     )
     session_id = session_manager.create_session(user_id)
-    session_manager.update_session(session_id, [assistant_message])
+    messages, cursor = session_manager.append_messages(session_id, [assistant_message])
     
     return ChatResponse(
         session_id=session_id,
         answer=greeting,
         citations=[],
-        history=[assistant_message]
+        messages=messages,
+        cursor=cursor
     )
 
 
@@ -63,54 +115,107 @@ def get_active_sessions(user: user_dependency):
 
 
 @chat_router.post("/message", response_model=ChatResponse)
-def send_chat_message(user: user_dependency, db: db_dependency, chat_input: ChatInput):
+async def send_chat_message(user: user_dependency, db: db_dependency, chat_input: ChatInput):
     """Send a message to an existing chat session."""
     user_id = user.get("user_id")
     session_id = chat_input.session_id
     
-    # Check if session exists
-    if not session_id or not session_manager.get_session(session_id):
+    # Get existing history and its rolling summary, one cache lookup (or indexed read) in the session store
+    conversation = await run_in_threadpool(session_manager.get_conversation, session_id) if session_id else None
+    if conversation is None:
         # Create a new session if needed
-        session_id = session_manager.create_session(user_id)
+        session_id = await run_in_threadpool(session_manager.create_session, user_id)
+        history, summary = [], ""
         logger.info(f"New chat session created for user {user_id}")
-    
-    # Get existing history
-    history = session_manager.get_session(session_id) or []
+    else:
+        history, summary, _ = conversation
     
     # Get document descriptions
-    doc_descriptions = get_document_descriptions(db)
+    doc_descriptions = await run_in_threadpool(get_document_descriptions, db, user_id)
     
     # Process the message
     logger.info(f"Processing message in session {session_id}")
-    result = process_chat_message(
+    result = await process_chat_message(
         session_id=session_id,
         message=chat_input.message,
         chat_history=history,
-        document_descriptions=doc_descriptions
+        document_descriptions=doc_descriptions,
+        user_id=user_id,
+        summary=summary
     )
     
-    # Update session history
-    session_manager.update_session(session_id, result["history"])
+    # Append this turn to the session history and return only the new messages
+    response = ChatResponse(**await run_in_threadpool(record_turn, session_id, result))
+    schedule_summary_update(session_id)
+    return response
+
+
+@chat_router.post("/message/stream")
+async def send_chat_message_stream(user: user_dependency, db: db_dependency, chat_input: ChatInput):
+    """Send a message to an existing chat session, streaming the reply as Server-Sent Events."""
+    user_id = user.get("user_id")
+    session_id = chat_input.session_id
     
-    return ChatResponse(
-        session_id=result["session_id"],
-        answer=result["answer"],
-        citations=result["citations"],
-        history=result["history"]
-    )
+    # Get existing history and its rolling summary, one cache lookup (or indexed read) in the session store
+    conversation = await run_in_threadpool(session_manager.get_conversation, session_id) if session_id else None
+    if conversation is None:
+        # Create a new session if needed
+        session_id = await run_in_threadpool(session_manager.create_session, user_id)
+        history, summary = [], ""
+        logger.info(f"New chat session created for user {user_id}")
+    else:
+        history, summary, _ = conversation
+    
+    # Get document descriptions
+    doc_descriptions = await run_in_threadpool(get_document_descriptions, db, user_id)
+    
+    async def events():
+        async for event in stream_chat_message(
+            session_id=session_id,
+            message=chat_input.message,
+            chat_history=history,
+            document_descriptions=doc_descriptions,
+            user_id=user_id,
+            summary=summary
+        ):
+            if event["type"] == "final":
+                # Append this turn to the session history before the client sees the final event
+                event = {"type": "final", **jsonable_encoder(await run_in_threadpool(record_turn, session_id, event))}
+                schedule_summary_update(session_id)
+            yield event
+    
+    logger.info(f"Streaming message in session {session_id}")
+    return streaming_response(events())
 
 
-@chat_router.get("/history/{session_id}", response_model=List[ChatMessage])
-def get_chat_history(user: user_dependency, session_id: str):
-    """Get the history of a chat session."""
+@chat_router.get("/history/{session_id}", response_model=ChatHistoryPage)
+def get_chat_history(user: user_dependency, session_id: str, before: Optional[int] = Query(None, ge=0),
+                     limit: int = Query(20, ge=1, le=100)):
+    """Get a page of a chat session's history, the latest messages by default or those before a cursor."""
     user_id = user.get("user_id")
     
-    history = session_manager.get_session(session_id)
-    if not history:
+    page = session_manager.get_history(session_id, before, limit)
+    if page is None or page[1] == 0:
         logger.warning(f"Chat session {session_id} not found")
         raise HTTPException(status_code=404, detail="Chat session not found")
     
-    return history
+    messages, cursor, start = page
+    return ChatHistoryPage(session_id=session_id, messages=messages, cursor=cursor, before=start if start > 0 else None)
+
+
+@chat_router.get("/chunks", response_model=Dict[str, Dict[str, Any]])
+def get_citation_chunks(user: user_dependency, session_id: str, ids: List[str] = Query(...)):
+    """Get the source chunks referenced by citations in one of the user's sessions, keyed by chunk_id."""
+    if len(ids) > MAX_CHUNKS_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_CHUNKS_PER_REQUEST} chunks can be requested at once")
+
+    _, session_user_id = session_manager.get_session_with_user_id(session_id)
+    if session_user_id is None or session_user_id != user.get("user_id"):
+        logger.warning(f"Chat session {session_id} not found for chunk lookup")
+        raise HTTPException(status_code=404, detail="Chat session not found")
+    # Chunks are shared between users with the same files, so only those this session cites are served
+    cited = session_manager.cited_chunk_ids(session_id, ids)
+    return session_manager.get_chunks([chunk_id for chunk_id in ids if chunk_id in cited])
 
 
 @chat_router.delete("/end/{session_id}")
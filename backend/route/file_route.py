@@ -31,11 +31,11 @@ def generate_and_save_summary(file_path: str, file_id: int, db: Session):
     except Exception as e:
         print(f"Error in background summary generation: {str(e)}")
 
-def get_document_descriptions(db: Session) -> str:
-    """Get descriptions of currently selected documents."""
+def get_document_descriptions(db: Session, user_id: int) -> str:
+    """Get descriptions of the user's currently selected documents."""
     try:
         from db_models import UploadedFiles
-        selected_files = db.query(UploadedFiles).filter(UploadedFiles.is_selected == True).all()
+        selected_files = db.query(UploadedFiles).filter(UploadedFiles.is_selected == True, UploadedFiles.user_id == user_id).all()
         if selected_files:
             descriptions = []
             for file in selected_files:
@@ -77,9 +77,10 @@ async def upload_file(user: user_dependency, db: db_dependency, files: List[Uplo
         db.commit()
         db.refresh(db_file)
         
-        # Schedule background task to generate summary
+        # Schedule background tasks to generate summary and build the per-document index
         if db_file.id:
             background_tasks.add_task(generate_and_save_summary, file_path=file_path, file_id=db_file.id, db=db)
+            background_tasks.add_task(resource_service.build_document_index, file_path=file_path)
         else:
             # Update description for non-PDF files
             db_file.description = "File could not be used for summarization."
@@ -106,8 +107,8 @@ def select_files(user: user_dependency, db: db_dependency, selected_files: List[
     if len(selected_files) > 3:
         raise HTTPException(status_code=400, detail="You can select a maximum of 3 files.")
     
-    # First, unselect all files
-    db.query(UploadedFiles).update({UploadedFiles.is_selected: False})
+    # First, unselect all of this user's files
+    db.query(UploadedFiles).filter(UploadedFiles.user_id == user.get("user_id")).update({UploadedFiles.is_selected: False})
 
     # Then select the specified files
     for file_id in selected_files:
@@ -145,8 +146,9 @@ def delete_file(file_id: int, user: user_dependency, db: db_dependency):
     if file.user_id != user.get("user_id"):
         raise HTTPException(status_code=403, detail="You don't have permission to delete this file.")
     
-    # Delete from filesystem if file exists
+    # Drop cached indexes built from this file, then delete it from filesystem if it exists
     if os.path.exists(file.file_path):
+        resource_service.invalidate_file(file.file_path, user.get("user_id"))
         os.remove(file.file_path)
     # Delete from database
     db.delete(file)
@@ -1,14 +1,19 @@
-from typing import Annotated
+from typing import Annotated, Any, AsyncIterator, Dict, Optional
+import json
+import time
 import logging
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from chains_and_agents.rag_chain import rag_chain, wikipedia_rag_chain
-from schemas.rag_models import RagInput
+from chains_and_agents.rag_chain import (rag_chain, wikipedia_rag_chain, stream_rag_answer,
+                                         vector_store_retriever, wikipedia_retriever)
+from schemas.rag_models import RagInput, RagResponse
 from initalize_resources import resource_service
 from services import AuthService, DataBaseConfig
 from route.file_route import get_selected_files, get_document_descriptions
-from chains_and_agents.rag_agent import execute_rag_agent
+from chains_and_agents.rag_agent import execute_rag_agent, stream_rag_agent
 
 # Set up logger
 logger = logging.getLogger(__name__)
@@ -20,54 +25,113 @@ db_config = DataBaseConfig()
 user_dependency = Annotated[dict, Depends(auth_service.get_current_user)]
 db_dependency = Annotated[Session, Depends(db_config.get_db)]
 
-# Global status tracking
-initialization_status = {
-    "status": "not_initialized",  # not_initialized, initializing, ready, error
-    "message": "",
-    "user_id": None
-}
+# Per-user status tracking
+initialization_status = {}
+
+def get_user_status(user_id: int) -> dict:
+    """Get the initialization status of a user, creating the default entry on first use."""
+    return initialization_status.setdefault(user_id, {
+        "status": "not_initialized",  # not_initialized, initializing, ready, error
+        "message": "",
+        "peak_memory_mb": None
+    })
 
 # Helper functions
-def background_initialize_resources(user_id: int, file_paths: list):
+def background_initialize_resources(user_id: int, file_paths: list, descriptions: Optional[Dict[str, str]] = None):
     """Background task to initialize RAG resources."""
-    global initialization_status
+    user_status = get_user_status(user_id)
     try:
-        initialization_status["status"] = "initializing"
-        initialization_status["message"] = "Initializing RAG resources..."
-        initialization_status["user_id"] = user_id
+        user_status["status"] = "initializing"
+        user_status["message"] = "Initializing RAG resources..."
         
-        resource_service.initialize_resources(selected_file_paths=file_paths)
+        result = resource_service.initialize_resources(selected_file_paths=file_paths, user_id=user_id,
+                                                      descriptions=descriptions)
         
-        initialization_status["status"] = "ready"
-        initialization_status["message"] = "RAG resources initialized successfully"
+        user_status["status"] = "ready"
+        user_status["message"] = "RAG resources initialized successfully"
+        user_status["peak_memory_mb"] = result.get("peak_memory_mb")
         
     except Exception as e:
-        initialization_status["status"] = "error"
-        initialization_status["message"] = f"Failed to initialize: {str(e)}"
+        user_status["status"] = "error"
+        user_status["message"] = f"Failed to initialize: {str(e)}"
         logger.error(f"Failed to initialize: {str(e)}")
 
 
+NO_ANSWER_MESSAGE = "I don't know based on the provided information so either use wikipedia mode or hybrid mode."
+
+async def event_stream(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    """Send events as Server-Sent Events, adding time-to-first-token to the final event."""
+    start = time.perf_counter()
+    time_to_first_token = None
+    try:
+        async for event in events:
+            if time_to_first_token is None and event["type"] in ("token", "final"):
+                time_to_first_token = time.perf_counter() - start
+                logger.info(f"Time to first token: {time_to_first_token:.3f}s")
+            if event["type"] == "final":
+                event = {**event, "time_to_first_token": time_to_first_token, "total_time": time.perf_counter() - start}
+            yield f"data: {json.dumps(event)}\n\n"
+    except Exception as e:
+        logger.error(f"Error streaming response: {str(e)}")
+        yield f"data: {json.dumps({'type': 'error', 'detail': str(e)})}\n\n"
+
+def streaming_response(events: AsyncIterator[Dict[str, Any]]) -> StreamingResponse:
+    return StreamingResponse(event_stream(events), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def format_chain_answer(response: RagResponse, replace_no_answer: bool = False) -> dict:
+    """Answer and mapped citations of a RAG chain response."""
+    if replace_no_answer and response.answer in ["I don't know based on the provided information", "I don't know"]:
+        return {"answer": NO_ANSWER_MESSAGE, "citations": []}
+    mapped_citations = resource_service.map_citations_to_metadata(response.citations, response.retrieved_docs)
+    return {"answer": response.answer, "citations": mapped_citations}
+
+async def stream_chain_answer(input_data: RagInput, retriever_func, config: dict = None, replace_no_answer: bool = False,
+                              cached: RagResponse = None, cache_slot: dict = None):
+    """Forward answer tokens from the RAG chain and finish with the answer and its mapped citations."""
+    response = cached
+    if response is None:
+        async for event in stream_rag_answer(input_data, retriever_func, config=config):
+            if event["type"] == "token":
+                yield event
+            else:
+                response = event["response"]
+        resource_service.store_answer(cache_slot, response)
+    yield {"type": "final", "cached": cached is not None, **format_chain_answer(response, replace_no_answer)}
+
+async def single_event(event: Dict[str, Any]):
+    yield event
+
+async def stream_cached_agent(events: AsyncIterator[Dict[str, Any]], cache_slot: dict):
+    """Forward agent events, caching the final result if the agent completed."""
+    async for event in events:
+        if event["type"] == "final" and event.get("completed"):
+            resource_service.store_answer(cache_slot, {key: value for key, value in event.items() if key != "type"})
+        yield event
+
+
 @chain_router.post("/initialize")
 def initialize_resource(user: user_dependency, db: db_dependency, background_tasks: BackgroundTasks):
     """Initialize resources using selected files from database in background."""
-    global initialization_status
+    user_id = user.get("user_id")
+    user_status = get_user_status(user_id)
     try:
-        user_id = user.get("user_id")
-        
         selected_files = get_selected_files(user, db)
         files = selected_files.get("selected_files", [])
         if not files:
             return {"status": "warning", "message": "No files selected. Please select files first."}
 
-        if initialization_status["status"] == "initializing":
+        if user_status["status"] == "initializing":
             return {
                 "status": "info", 
                 "message": "Initialization already in progress. Please wait...",
-                "initialization_status": initialization_status["status"]
+                "initialization_status": user_status["status"]
             }
 
         file_paths = [file["file_path"] for file in files]
-        background_tasks.add_task(background_initialize_resources, user_id, file_paths)
+        descriptions = {file["file_path"]: file.get("description") for file in files}
+        user_status["status"] = "initializing"
+        background_tasks.add_task(background_initialize_resources, user_id, file_paths, descriptions)
         
         return {
             "status": "success", 
@@ -76,26 +140,32 @@ def initialize_resource(user: user_dependency, db: db_dependency, background_tas
         }
     except Exception as e:
         logger.error(f"Error initializing resources: {str(e)}")
-        initialization_status["status"] = "error"
-        initialization_status["message"] = str(e)
+        user_status["status"] = "error"
+        user_status["message"] = str(e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @chain_router.get("/status")
 def get_initialization_status(user: user_dependency):
-    """Check if RAG resources are initialized."""
-    global initialization_status
+    """Check if the user's RAG resources are initialized."""
+    user_id = user.get("user_id")
+    user_status = get_user_status(user_id)
     try:
-        is_initialized = resource_service.is_initialized()
+        is_initialized = resource_service.is_initialized(user_id)
         
-        if is_initialized and initialization_status["status"] != "ready":
-            initialization_status["status"] = "ready"
-            initialization_status["message"] = "RAG resources are ready"
+        if is_initialized and user_status["status"] not in ("ready", "initializing"):
+            user_status["status"] = "ready"
+            user_status["message"] = "RAG resources are ready"
+        elif not is_initialized and user_status["status"] == "ready":
+            # A selected file was deleted since initialization
+            user_status["status"] = "not_initialized"
+            user_status["message"] = "Selected files changed. Please initialize again."
         
         return {
             "initialized": is_initialized,
-            "status": initialization_status["status"],
-            "message": initialization_status["message"]
+            "status": user_status["status"],
+            "message": user_status["message"],
+            "peak_memory_mb": user_status.get("peak_memory_mb")
         }
     except Exception as e:
         logger.error(f"Error checking status: {str(e)}")
@@ -106,55 +176,91 @@ def get_initialization_status(user: user_dependency):
         }
 
 
+@chain_router.get("/embedding_status")
+def get_embedding_status(user: user_dependency):
+    """Report whether the shared embedding model is loaded and how long loading took."""
+    return {
+        **resource_service.embedding_service.stats(),
+        "indexing": resource_service.embedding_pipeline.stats(),
+        "vectorstores": resource_service.vectorstore_registry.stats(),
+        "answer_cache": resource_service.answer_cache.stats(),
+        "pre_router": resource_service.query_router.stats(),
+        "wikipedia": resource_service.wikipedia.stats(),
+        "reranker": resource_service.reranker.stats(),
+        "faiss_index": resource_service.faiss_index.stats(),
+        "chat_history": resource_service.chat_history.stats(),
+        "context_packer": resource_service.context_packer.stats(),
+        "hybrid_retrieval": {"enabled": resource_service.hybrid_retrieval, "rrf_k": resource_service.rrf_k},
+        "hierarchical_retrieval": resource_service.hierarchy_stats()
+    }
+
+
 @chain_router.post("/ask_documents")
-def ask_documents(user: user_dependency, input_data: RagInput):
-    """Query documents using basic RAG."""
+async def ask_documents(user: user_dependency, input_data: RagInput):
+    """Query documents using basic RAG, reusing the answer to a similar earlier question when cached."""
+    user_id = user.get("user_id")
     try:
-        response = rag_chain.invoke(input_data)
-        mapped_citations = resource_service.map_citations_to_metadata(response.citations)
-        if response.answer in ["I don't know based on the provided information", "I don't know"]:
-            return {
-                "answer": "I don't know based on the provided information so either use wikipedia mode or hybrid mode.",
-                "citations": []
-            }
-        return {
-            "answer": response.answer,
-            "citations": mapped_citations
-        }
+        response, cache_slot = await run_in_threadpool(
+            resource_service.lookup_answer, input_data.question, user_id, input_data.word_length, "documents")
+        if response is None:
+            response = await rag_chain.ainvoke(input_data, config={"configurable": {"user_id": user_id}})
+            resource_service.store_answer(cache_slot, response)
+        return format_chain_answer(response, replace_no_answer=True)
     except Exception as e:
         logger.error(f"Error querying documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@chain_router.post("/ask_documents/stream")
+async def ask_documents_stream(user: user_dependency, input_data: RagInput):
+    """Query documents using basic RAG, streaming the answer as Server-Sent Events."""
+    user_id = user.get("user_id")
+    cached, cache_slot = await run_in_threadpool(
+        resource_service.lookup_answer, input_data.question, user_id, input_data.word_length, "documents")
+    config = {"configurable": {"user_id": user_id}}
+    return streaming_response(stream_chain_answer(input_data, vector_store_retriever, config=config, replace_no_answer=True,
+                                                  cached=cached, cache_slot=cache_slot))
+
+
 @chain_router.post("/ask_wikipedia")
-def ask_wikipedia(user: user_dependency, input_data: RagInput):
+async def ask_wikipedia(user: user_dependency, input_data: RagInput):
     """Query Wikipedia using RAG."""
     try:
-        response = wikipedia_rag_chain.invoke(input_data)
-        mapped_citations = resource_service.map_citations_to_metadata(response.citations)
-        
-        return {
-            "answer": response.answer,
-            "citations": mapped_citations
-        }
+        response = await wikipedia_rag_chain.ainvoke(input_data)
+        return format_chain_answer(response)
     except Exception as e:
         logger.error(f"Error querying Wikipedia: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@chain_router.post("/ask_wikipedia/stream")
+async def ask_wikipedia_stream(user: user_dependency, input_data: RagInput):
+    """Query Wikipedia using RAG, streaming the answer as Server-Sent Events."""
+    return streaming_response(stream_chain_answer(input_data, wikipedia_retriever))
+
+
 @chain_router.post("/ask_rag_agent")
-def ask_rag_agent(user: user_dependency, db: db_dependency, input_data: RagInput, use_web_search: bool = True):
+async def ask_rag_agent(user: user_dependency, db: db_dependency, input_data: RagInput, use_web_search: bool = True):
     """Execute the RAG agent with optional web search."""
+    user_id = user.get("user_id")
     try:
-        doc_descriptions = get_document_descriptions(db)
+        cached, cache_slot = await run_in_threadpool(
+            resource_service.lookup_answer, input_data.question, user_id, input_data.word_length, f"rag_agent:{use_web_search}")
+        if cached is not None:
+            return cached
         
-        result = execute_rag_agent(
+        doc_descriptions = await run_in_threadpool(get_document_descriptions, db, user_id)
+        
+        result = await execute_rag_agent(
             question=input_data.question,
             document_descriptions=doc_descriptions,
             word_length=input_data.word_length,
-            approve_web_search=use_web_search
+            approve_web_search=use_web_search,
+            user_id=user_id
         )
         
+        if result.get("completed"):
+            resource_service.store_answer(cache_slot, result)
         return result
             
     except ValueError as e:
@@ -167,3 +273,23 @@ def ask_rag_agent(user: user_dependency, db: db_dependency, input_data: RagInput
             "answer": f"Error processing your question. Please try again.",
             "citations": []
         }
+
+
+@chain_router.post("/ask_rag_agent/stream")
+async def ask_rag_agent_stream(user: user_dependency, db: db_dependency, input_data: RagInput, use_web_search: bool = True):
+    """Execute the RAG agent with optional web search, streaming the answer as Server-Sent Events."""
+    user_id = user.get("user_id")
+    cached, cache_slot = await run_in_threadpool(
+        resource_service.lookup_answer, input_data.question, user_id, input_data.word_length, f"rag_agent:{use_web_search}")
+    if cached is not None:
+        return streaming_response(single_event({"type": "final", "cached": True, **cached}))
+    
+    doc_descriptions = await run_in_threadpool(get_document_descriptions, db, user_id)
+    
+    return streaming_response(stream_cached_agent(stream_rag_agent(
+        question=input_data.question,
+        document_descriptions=doc_descriptions,
+        word_length=input_data.word_length,
+        approve_web_search=use_web_search,
+        user_id=user_id
+    ), cache_slot))
@@ -24,4 +24,11 @@ class ChatResponse(BaseModel):
     session_id: str
     answer: str
     citations: List[Dict[str, Any]]
-    history: List[ChatMessage]
+    messages: List[ChatMessage] = Field(description="Messages added by this turn; citations reference chunks by chunk_id")
+    cursor: int = Field(description="Number of messages in the session after this turn")
+
+class ChatHistoryPage(BaseModel):
+    session_id: str
+    messages: List[ChatMessage]
+    cursor: int = Field(description="Number of messages in the session")
+    before: Optional[int] = Field(None, description="Cursor for the next older page, or None when this page starts the session")
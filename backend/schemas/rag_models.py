@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import List, Literal
+from typing import Dict, List, Literal
+from langchain_core.documents import Document
 
 class SummarizeAnswer(BaseModel):
     summary: str = Field(description="2-3 line descriptive summary of the given document content.")
@@ -12,9 +13,16 @@ class RagInput(BaseModel):
     question: str
     word_length: int = 250
 
+class RetrievalResult(BaseModel):
+    """Documents retrieved for one request and the formatted context built from them."""
+    docs: List[Document] = []
+    context: str = ""
+    timings: Dict[str, float] = Field(default={}, description="Milliseconds spent in each retrieval stage")
+
 class RagResponse(BaseModel):
     answer: str
     citations: List[int] = []
+    retrieved_docs: List[Document] = Field(default=[], description="Documents the citation IDs refer to")
 
 class CitedAnswer(BaseModel):
     answer: str = Field(description="The answer to the user's question with citation markers [0], [1], etc.")
@@ -0,0 +1,119 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerCacheService:
+    """Answers cached per scope (user, selection, word length, mode) and matched by question embedding.
+
+    A question is served from the cache when its cosine similarity to a cached question in the same scope
+    reaches the threshold. Entries expire after a TTL and the least recently used are dropped beyond the size limit.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+        self.threshold = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+        self.ttl_seconds = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+        self.max_entries = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Entry ids per scope, so a lookup only compares against questions asked of the same selection and mode
+        self._scopes: Dict[Hashable, List[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def lookup(self, scope: Hashable, embedding: Sequence[float]) -> Optional[Any]:
+        """Return the cached answer to the most similar question in the scope, if it is within the threshold."""
+        with self._lock:
+            self._expire()
+            entry_ids = self._scopes.get(scope, [])
+            if not entry_ids:
+                self.misses += 1
+                return None
+
+            query = self._normalize(embedding)
+            matrix = np.stack([self._entries[entry_id]["embedding"] for entry_id in entry_ids])
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = entry_ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            logger.info(f"Answer cache hit (similarity {similarities[best]:.3f})")
+            return self._entries[entry_id]["value"]
+
+    def store(self, scope: Hashable, embedding: Sequence[float], value: Any, file_hashes: Sequence[str] = (),
+              owner: Optional[Hashable] = None) -> None:
+        """Cache an answer; `file_hashes` are the files it was generated from and `owner` the user who asked, for invalidation."""
+        with self._lock:
+            entry_id = uuid.uuid4().hex
+            self._entries[entry_id] = {
+                "scope": scope,
+                "embedding": self._normalize(embedding),
+                "value": value,
+                "file_hashes": set(file_hashes),
+                "owner": owner,
+                "created_at": time.time(),
+            }
+            self._scopes.setdefault(scope, []).append(entry_id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, entry_id: str) -> None:
+        entry = self._entries.pop(entry_id)
+        entry_ids = self._scopes[entry["scope"]]
+        entry_ids.remove(entry_id)
+        if not entry_ids:
+            del self._scopes[entry["scope"]]
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        # Entries are only moved to the end on use, so check every entry rather than stopping at the first fresh one
+        for entry_id in [entry_id for entry_id, entry in self._entries.items() if entry["created_at"] < cutoff]:
+            self._remove(entry_id)
+            self.evictions += 1
+
+    def invalidate_file(self, file_hash: str, owner: Optional[Hashable] = None) -> int:
+        """Drop every answer generated from the given file, only the given user's when `owner` is set."""
+        with self._lock:
+            entry_ids = [entry_id for entry_id, entry in self._entries.items()
+                         if file_hash in entry["file_hashes"] and (owner is None or entry["owner"] == owner)]
+            for entry_id in entry_ids:
+                self._remove(entry_id)
+            return len(entry_ids)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "threshold": self.threshold,
+            }
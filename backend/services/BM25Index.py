@@ -0,0 +1,185 @@
+import re
+from array import array
+from collections import Counter
+from typing import Iterable, List, Sequence, Tuple
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+# Keeps identifiers such as part numbers ("ab-1234"), versions ("v2.1") and snake_case names as single terms
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*")
+MAX_TOKEN_LENGTH = 40
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if len(token) <= MAX_TOKEN_LENGTH]
+
+
+def pack_strings(strings: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Strings as one UTF-8 byte buffer and the (len + 1,) offsets of each string in it."""
+    encoded = [string.encode("utf-8") for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def unpack_strings(data: np.ndarray, offsets: np.ndarray) -> List[str]:
+    buffer = data.tobytes()
+    return [buffer[start:end].decode("utf-8") for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+
+class BM25Index:
+    """Okapi BM25 over chunk texts with postings stored as flat numpy arrays (CSR layout).
+
+    The postings of term t are `doc_ids[offsets[t]:offsets[t + 1]]` with term frequencies in `tfs`,
+    so the index costs a few bytes per (term, chunk) pair and a query touches only its terms' slices.
+    Chunks are identified by their docstore ids (keys), shared with the FAISS index they sit beside.
+    Terms and keys are stored the same way, as UTF-8 bytes sliced by offsets, rather than as fixed-width
+    numpy strings padded to the longest one at four bytes per character.
+    """
+
+    FILE_NAME = "bm25.npz"
+
+    def __init__(self, term_data: np.ndarray, term_offsets: np.ndarray, offsets: np.ndarray, doc_ids: np.ndarray,
+                 tfs: np.ndarray, doc_lengths: np.ndarray, key_data: np.ndarray, key_offsets: np.ndarray,
+                 k1: float = 1.5, b: float = 0.75):
+        self.term_data = term_data
+        self.term_offsets = term_offsets
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.doc_lengths = doc_lengths
+        self.key_data = key_data
+        self.key_offsets = key_offsets
+        self.k1 = k1
+        self.b = b
+        self.vocab = {term: i for i, term in enumerate(unpack_strings(term_data, term_offsets))}
+        document_frequencies = np.diff(offsets).astype(np.float32)
+        self.idf = np.log1p((len(doc_lengths) - document_frequencies + 0.5) / (document_frequencies + 0.5)).astype(np.float32)
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+
+    @classmethod
+    def build(cls, texts: Iterable[str], keys: Sequence[str]) -> "BM25Index":
+        """Index texts in order; `keys[i]` identifies the i-th text."""
+        vocab = {}
+        term_ids, doc_ids, tfs, doc_lengths = array("i"), array("i"), array("i"), array("i")
+        for doc_id, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_lengths.append(len(tokens))
+            for term, count in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(count)
+        return cls._from_postings(list(vocab), np.frombuffer(term_ids, dtype=np.int32), np.frombuffer(doc_ids, dtype=np.int32),
+                                  np.frombuffer(tfs, dtype=np.int32), np.frombuffer(doc_lengths, dtype=np.int32), keys)
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore: FAISS) -> "BM25Index":
+        """Index the chunk texts of a vectorstore in FAISS order."""
+        keys = [vectorstore.index_to_docstore_id[i] for i in range(vectorstore.index.ntotal)]
+        return cls.build((vectorstore.docstore.search(key).page_content for key in keys), keys)
+
+    @classmethod
+    def _from_postings(cls, terms: List[str], term_ids: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray,
+                       doc_lengths: np.ndarray, keys: Sequence[str]) -> "BM25Index":
+        """Group unordered (term, doc, tf) postings by term into the CSR arrays."""
+        order = np.lexsort((doc_ids, term_ids))
+        offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(terms)), out=offsets[1:])
+        term_data, term_offsets = pack_strings(terms)
+        key_data, key_offsets = pack_strings(keys)
+        return cls(
+            term_data=term_data,
+            term_offsets=term_offsets,
+            offsets=offsets,
+            doc_ids=doc_ids[order].astype(np.int32),
+            tfs=np.minimum(tfs[order], np.iinfo(np.uint16).max).astype(np.uint16),
+            doc_lengths=np.asarray(doc_lengths, dtype=np.int32),
+            key_data=key_data,
+            key_offsets=key_offsets,
+        )
+
+    @classmethod
+    def merge(cls, indexes: List["BM25Index"]) -> "BM25Index":
+        """Combine per-document indexes into one, in order, without re-tokenizing any text."""
+        if len(indexes) == 1:
+            return indexes[0]
+        terms = sorted(set().union(*(index.vocab for index in indexes)))
+        vocab = {term: i for i, term in enumerate(terms)}
+        term_ids, doc_ids, tfs = [], [], []
+        doc_offset = 0
+        for index in indexes:
+            local_to_global = np.array([vocab[term] for term in index.vocab], dtype=np.int32)
+            term_ids.append(np.repeat(local_to_global, np.diff(index.offsets)))
+            doc_ids.append(index.doc_ids + doc_offset)
+            tfs.append(index.tfs.astype(np.int32))
+            doc_offset += len(index.doc_lengths)
+        return cls._from_postings(
+            terms,
+            np.concatenate(term_ids) if term_ids else np.zeros(0, dtype=np.int32),
+            np.concatenate(doc_ids),
+            np.concatenate(tfs),
+            np.concatenate([index.doc_lengths for index in indexes]),
+            [key for index in indexes for key in index.keys()],
+        )
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Return up to k (key, score) pairs for chunks sharing terms with the query, best first."""
+        scores = np.zeros(len(self.doc_lengths), dtype=np.float32)
+        if not len(scores):
+            return []
+        for term in set(tokenize(query)):
+            term_id = self.vocab.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:end]
+            tf = self.tfs[start:end].astype(np.float32)
+            length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / max(self.avg_doc_length, 1.0))
+            # A term's postings hold each chunk once, so the fancy-indexed add is safe
+            scores[docs] += self.idf[term_id] * tf * (self.k1 + 1) / (tf + length_norm)
+
+        matches = np.flatnonzero(scores)
+        if len(matches) > k:
+            matches = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+        matches = matches[np.argsort(-scores[matches])]
+        return [(self.key(i), float(scores[i])) for i in matches]
+
+    def key(self, doc_id: int) -> str:
+        return self.key_data[self.key_offsets[doc_id]:self.key_offsets[doc_id + 1]].tobytes().decode("utf-8")
+
+    def keys(self) -> List[str]:
+        return unpack_strings(self.key_data, self.key_offsets)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.term_data, self.term_offsets, self.offsets, self.doc_ids, self.tfs,
+                                      self.doc_lengths, self.key_data, self.key_offsets, self.idf))
+
+    def save(self, path: str) -> None:
+        # Through a file object so numpy does not append ".npz" to temporary file names
+        with open(path, "wb") as f:
+            np.savez(f, term_data=self.term_data, term_offsets=self.term_offsets, offsets=self.offsets,
+                     doc_ids=self.doc_ids, tfs=self.tfs, doc_lengths=self.doc_lengths, key_data=self.key_data,
+                     key_offsets=self.key_offsets)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            if "terms" in data:
+                # Saved with fixed-width string arrays by an earlier version
+                term_data, term_offsets = pack_strings(data["terms"].tolist())
+                key_data, key_offsets = pack_strings(data["keys"].tolist())
+            else:
+                term_data, term_offsets = data["term_data"], data["term_offsets"]
+                key_data, key_offsets = data["key_data"], data["key_offsets"]
+            return cls(term_data, term_offsets, data["offsets"], data["doc_ids"], data["tfs"], data["doc_lengths"],
+                       key_data, key_offsets)
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Fuse ranked key lists: each key scores the sum of 1 / (k + rank) over the lists it appears in."""
+    scores = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
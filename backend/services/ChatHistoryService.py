@@ -0,0 +1,104 @@
+import os
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+from schemas.chat_models import ChatMessage
+
+from .TokenCounter import TokenCounter
+
+logger = logging.getLogger(__name__)
+
+
+class ChatHistoryService:
+    """Builds the conversation history of chat prompts within a token budget.
+
+    The newest messages are kept verbatim while they fit in `CHAT_HISTORY_TOKEN_BUDGET`; older ones are folded
+    into a rolling summary stored with the session, so prompts stop growing with the length of the conversation.
+    Token counts of every prompt are recorded per prompt type.
+    """
+
+    def __init__(self, token_counter: Optional[TokenCounter] = None):
+        self.token_counter = token_counter or TokenCounter()
+        self.token_budget = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "1500"))
+        self.summary_enabled = os.getenv("CHAT_SUMMARY_ENABLED", "true").lower() == "true"
+        self.summary_min_messages = int(os.getenv("CHAT_SUMMARY_MIN_MESSAGES", "6"))
+        self.summary_max_words = int(os.getenv("CHAT_SUMMARY_MAX_WORDS", "200"))
+        self._lock = threading.Lock()
+        self._prompts: Dict[str, Dict[str, int]] = {}
+        self.summary_updates = 0
+        self.summary_failures = 0
+        self.folded_messages = 0
+
+    def count_tokens(self, text: str) -> int:
+        return self.token_counter.count(text)
+
+    @staticmethod
+    def format_message(message: ChatMessage) -> str:
+        # Only role and content, citation details are not part of the prompt
+        return f"{message.role.title()}: {message.content}"
+
+    def recent_start(self, messages: List[ChatMessage], max_messages: int) -> int:
+        """Index of the oldest message kept verbatim: the newest messages that fit in the token budget,
+        at most `max_messages` and always at least the last one."""
+        start, used = len(messages), 0
+        while start > 0 and len(messages) - start < max_messages:
+            used += self.count_tokens(self.format_message(messages[start - 1])) + 1
+            if used > self.token_budget and start < len(messages):
+                break
+            start -= 1
+        return start
+
+    def build(self, messages: List[ChatMessage], summary: str, max_messages: int) -> str:
+        """The history section of a prompt: the rolling summary followed by the recent messages verbatim."""
+        lines = [self.format_message(message) for message in messages[self.recent_start(messages, max_messages):]]
+        if summary:
+            lines.insert(0, f"Summary of the earlier conversation: {summary}")
+        return "\n".join(lines)
+
+    def messages_to_fold(self, messages: List[ChatMessage], max_messages: int) -> List[ChatMessage]:
+        """The oldest messages that no longer make it into the prompt, once there are enough to update the summary."""
+        if not self.summary_enabled:
+            return []
+        folded = messages[:self.recent_start(messages, max_messages)]
+        return folded if len(folded) >= self.summary_min_messages else []
+
+    def record(self, prompt_name: str, prompt_text: str, history_text: str) -> int:
+        """Record the token count of a prompt sent to the LLM and the part of it taken by the history."""
+        prompt_tokens = self.count_tokens(prompt_text)
+        history_tokens = self.count_tokens(history_text)
+        with self._lock:
+            stats = self._prompts.setdefault(prompt_name, {"calls": 0, "prompt_tokens": 0, "history_tokens": 0,
+                                                           "max_prompt_tokens": 0, "last_prompt_tokens": 0})
+            stats["calls"] += 1
+            stats["prompt_tokens"] += prompt_tokens
+            stats["history_tokens"] += history_tokens
+            stats["max_prompt_tokens"] = max(stats["max_prompt_tokens"], prompt_tokens)
+            stats["last_prompt_tokens"] = prompt_tokens
+        logger.info(f"Chat {prompt_name} prompt: {prompt_tokens} tokens, {history_tokens} of them history")
+        return prompt_tokens
+
+    def record_summary_update(self, folded: int, succeeded: bool) -> None:
+        with self._lock:
+            if succeeded:
+                self.summary_updates += 1
+                self.folded_messages += folded
+            else:
+                self.summary_failures += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            prompts = {
+                name: {**stats,
+                       "avg_prompt_tokens": stats["prompt_tokens"] / stats["calls"],
+                       "avg_history_tokens": stats["history_tokens"] / stats["calls"]}
+                for name, stats in self._prompts.items()
+            }
+        return {
+            "token_budget": self.token_budget,
+            "tokenizer": self.token_counter.name,
+            "summary_enabled": self.summary_enabled,
+            "summary_updates": self.summary_updates,
+            "summary_failures": self.summary_failures,
+            "folded_messages": self.folded_messages,
+            "prompts": prompts,
+        }
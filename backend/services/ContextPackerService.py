@@ -0,0 +1,186 @@
+import os
+import re
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+
+from .BM25Index import tokenize
+from .TokenCounter import TokenCounter
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+STOPWORDS = frozenset(
+    "a an and are as at be by can did do does for from has have how i in is it its me my of on or she he that the "
+    "their them they this to was were what when where which who why will with you your".split()
+)
+# Tokens of the prompt outside the context: instructions, question and history
+PROMPT_RESERVE_TOKENS = 800
+MIN_OVERLAP_CHARS = 20
+MAX_SENTENCE_CHARS = 600
+
+
+class ContextPackerService:
+    """Packs retrieved chunks into the prompt context within a token budget.
+
+    Text repeated between chunks (the splitter's overlap, repeated sentences) is sent once, and sentences are
+    admitted by relevance: retrieval rank weighted by how many question terms they contain. The top `k` chunks
+    may contribute any sentence; extra candidates only those that mention the question. Sentences are added until
+    the budget is full, so a long answer (`word_length`) or a small model context shrinks the context instead of
+    overflowing it.
+    """
+
+    def __init__(self, token_counter: Optional[TokenCounter] = None, chunk_overlap: int = 100):
+        self.token_counter = token_counter or TokenCounter()
+        self.enabled = os.getenv("CONTEXT_PACKING", "true").lower() == "true"
+        self.token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+        self.candidates = int(os.getenv("CONTEXT_CANDIDATES", "8"))
+        self.model_context_tokens = int(os.getenv("MODEL_CONTEXT_TOKENS", "8192"))
+        self.summary_token_budget = int(os.getenv("SUMMARY_CONTEXT_TOKENS", "3000"))
+        self.max_overlap_chars = 2 * chunk_overlap
+        self._lock = threading.Lock()
+        self.packed_contexts = 0
+        self.candidate_tokens = 0
+        self.context_tokens = 0
+        self.overlap_chars_removed = 0
+        self.duplicate_sentences_removed = 0
+        self.sentences_trimmed = 0
+
+    def budget_for(self, word_length: Optional[int] = None) -> int:
+        """Context tokens for an answer of `word_length` words: the configured budget, or less when the
+        model's context window would not also fit the prompt and the answer."""
+        answer_tokens = math.ceil((word_length or 250) * 4 / 3)
+        return max(256, min(self.token_budget, self.model_context_tokens - PROMPT_RESERVE_TOKENS - answer_tokens))
+
+    @staticmethod
+    def split_sentences(text: str) -> List[str]:
+        sentences = []
+        for sentence in SENTENCE_PATTERN.split(text):
+            sentence = (sentence or "").strip()
+            # Text without sentence punctuation (tables, lists) is split by line, then by length
+            for piece in (sentence.split("\n") if len(sentence) > MAX_SENTENCE_CHARS else [sentence]):
+                piece = piece.strip()
+                sentences.extend(piece[i:i + MAX_SENTENCE_CHARS] for i in range(0, len(piece), MAX_SENTENCE_CHARS))
+        return sentences
+
+    @staticmethod
+    def normalize(sentence: str) -> str:
+        return " ".join(sentence.lower().split())
+
+    def trim_overlap(self, text: str, previous: List[str]) -> str:
+        """Drop the start or end of a chunk that repeats the end or start of an earlier chunk of the same document."""
+        removed = 0
+        for other in previous:
+            for size in range(min(self.max_overlap_chars, len(text), len(other)), MIN_OVERLAP_CHARS - 1, -1):
+                if other.endswith(text[:size]):
+                    text, removed = text[size:], removed + size
+                    break
+            for size in range(min(self.max_overlap_chars, len(text), len(other)), MIN_OVERLAP_CHARS - 1, -1):
+                if other.startswith(text[-size:]):
+                    text, removed = text[:-size], removed + size
+                    break
+        with self._lock:
+            self.overlap_chars_removed += removed
+        return text
+
+    @staticmethod
+    def header(source_id: int, doc: Document) -> str:
+        return f"Source ID: {source_id}\nContext source: {doc.metadata.get('source', 'N/A')}\nContext page content: "
+
+    def pack(self, question: str, docs: List[Document], k: int,
+             budget: Optional[int] = None) -> Tuple[List[Document], str, Dict[str, int]]:
+        """Select the sentences of the ranked `docs` to send for the question.
+
+        Returns the chunks that contributed (in Source ID order, for citation mapping), the formatted context and its token counts.
+        """
+        budget = budget or self.budget_for()
+        query_terms = {term for term in tokenize(question) if term not in STOPWORDS}
+
+        # Candidate sentences: (priority, rank, position, text, tokens)
+        candidates, seen, kept_texts = [], set(), {}
+        duplicates = 0
+        for rank, doc in enumerate(docs):
+            source = doc.metadata.get("source")
+            text = self.trim_overlap(doc.page_content, kept_texts.get(source, []))
+            kept_texts.setdefault(source, []).append(doc.page_content)
+            for position, sentence in enumerate(self.split_sentences(text)):
+                key = self.normalize(sentence)
+                if key in seen:
+                    duplicates += 1
+                    continue
+                seen.add(key)
+                matches = len(query_terms & set(tokenize(sentence)))
+                if matches == 0 and rank >= k:
+                    continue
+                candidates.append(((1 + matches) / (1 + rank), rank, position, sentence, self.token_counter.count(sentence) + 1))
+
+        # Fill the budget with the most relevant sentences, paying for a chunk's header with its first sentence
+        selected: Dict[int, List[Tuple[int, str]]] = {}
+        used = 0
+        for _, rank, position, sentence, tokens in sorted(candidates, key=lambda c: (-c[0], c[1], c[2])):
+            cost = tokens + (0 if rank in selected else self.token_counter.count(self.header(rank, docs[rank])))
+            if used + cost > budget:
+                continue
+            used += cost
+            selected.setdefault(rank, []).append((position, sentence))
+
+        packed_docs, formatted = [], []
+        for rank in sorted(selected):
+            sentences = sorted(selected[rank])
+            parts = [sentences[0][1]]
+            for (previous, _), (position, sentence) in zip(sentences, sentences[1:]):
+                parts.append(sentence if position == previous + 1 else f"... {sentence}")
+            formatted.append(self.header(len(packed_docs), docs[rank]) + " ".join(parts))
+            packed_docs.append(docs[rank])
+        context = "\n\n" + "\n\n".join(formatted)
+
+        context_tokens = self.token_counter.count(context)
+        candidate_tokens = self.token_counter.count(
+            "\n\n" + "\n\n".join(self.header(i, doc) + doc.page_content for i, doc in enumerate(docs[:k])))
+        with self._lock:
+            self.packed_contexts += 1
+            self.candidate_tokens += candidate_tokens
+            self.context_tokens += context_tokens
+            self.duplicate_sentences_removed += duplicates
+            self.sentences_trimmed += len(candidates) - sum(len(sentences) for sentences in selected.values())
+        return packed_docs, context, {"context_tokens": context_tokens, "unpacked_tokens": candidate_tokens}
+
+    def fit_text(self, texts: List[str], budget: Optional[int] = None) -> str:
+        """Join texts (such as a document's pages) within a token budget, without repeated sentences.
+
+        Each text gets an equal share of the budget, and what the shorter ones leave unused goes to the longer
+        ones, so later pages are represented instead of being cut off by the first ones.
+        """
+        budget = budget or self.summary_token_budget
+        seen, fitted, used = set(), {}, 0
+        by_length = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for n, i in enumerate(by_length):
+            share = (budget - used) // (len(texts) - n)
+            kept, kept_tokens = [], 0
+            for sentence in self.split_sentences(texts[i]):
+                key = self.normalize(sentence)
+                if key in seen:
+                    continue
+                tokens = self.token_counter.count(sentence) + 1
+                if kept_tokens + tokens > share:
+                    break
+                seen.add(key)
+                kept.append(sentence)
+                kept_tokens += tokens
+            fitted[i] = " ".join(kept)
+            used += kept_tokens
+        return "\n\n".join(fitted[i] for i in range(len(texts)) if fitted[i])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "token_budget": self.token_budget,
+            "candidates": self.candidates,
+            "model_context_tokens": self.model_context_tokens,
+            "tokenizer": self.token_counter.name,
+            "packed_contexts": self.packed_contexts,
+            "avg_context_tokens": self.context_tokens / self.packed_contexts if self.packed_contexts else None,
+            "avg_unpacked_tokens": self.candidate_tokens / self.packed_contexts if self.packed_contexts else None,
+            "overlap_chars_removed": self.overlap_chars_removed,
+            "duplicate_sentences_removed": self.duplicate_sentences_removed,
+            "sentences_trimmed": self.sentences_trimmed,
+        }
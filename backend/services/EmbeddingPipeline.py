@@ -0,0 +1,137 @@
+import os
+import time
+import logging
+import multiprocessing
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from .EmbeddingService import EmbeddingService, encode_texts
+
+logger = logging.getLogger(__name__)
+
+# Model loaded once inside each pool worker process
+_worker_model = None
+
+
+def _init_worker(model_name: str, device: str, num_threads: int) -> None:
+    global _worker_model
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(num_threads)
+    _worker_model = SentenceTransformer(model_name, device=device)
+
+
+def _encode_in_worker(texts: List[str], batch_size: int) -> np.ndarray:
+    return encode_texts(_worker_model, texts, batch_size)
+
+
+class EmbeddingPipeline:
+    """Indexing stage that embeds chunks in tunable batches, optionally across a process pool."""
+
+    def __init__(self, embedding_service: EmbeddingService):
+        self.embedding_service = embedding_service
+        cpu_count = os.cpu_count() or 1
+        self.batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+        self.num_workers = max(1, int(os.getenv("EMBEDDING_WORKERS", "1")))
+        self.num_threads = int(os.getenv("EMBEDDING_NUM_THREADS", str(cpu_count)))
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._threads_configured = False
+        self.last_stats: Dict[str, Any] = {}
+
+    def _configure_threads(self) -> None:
+        if self._threads_configured:
+            return
+        import torch
+
+        torch.set_num_threads(self.num_threads)
+        self._threads_configured = True
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            threads_per_worker = max(1, self.num_threads // self.num_workers)
+            # Spawn rather than fork: forking a process that already initialised torch threads can deadlock
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.embedding_service.model_name, self.embedding_service.device, threads_per_worker),
+            )
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _embed_batches(self, batches: Iterable[List[Document]]) -> Iterator[Tuple[List[Document], np.ndarray]]:
+        """Embed chunk batches in order, keeping only a bounded number of batches in flight."""
+        if self.num_workers > 1:
+            pool = self._get_pool()
+            pending = deque()
+            for batch in batches:
+                texts = [chunk.page_content for chunk in batch]
+                pending.append((batch, pool.submit(_encode_in_worker, texts, self.batch_size)))
+                if len(pending) >= self.num_workers * 2:
+                    done_batch, future = pending.popleft()
+                    yield done_batch, future.result()
+            while pending:
+                done_batch, future = pending.popleft()
+                yield done_batch, future.result()
+        else:
+            self._configure_threads()
+            model = self.embedding_service.model
+            for batch in batches:
+                texts = [chunk.page_content for chunk in batch]
+                yield batch, encode_texts(model, texts, self.batch_size)
+
+    def _batched(self, chunks: Iterable[Document]) -> Iterator[List[Document]]:
+        iterator = iter(chunks)
+        while True:
+            batch = list(islice(iterator, self.batch_size))
+            if not batch:
+                return
+            yield batch
+
+    def build_vectorstore(self, chunks: Iterable[Document]) -> Optional[FAISS]:
+        """Embed a (possibly lazy) stream of chunks batch by batch, adding each batch to the index as it is ready.
+
+        Only the current batches are held in memory besides the index itself, so memory stays
+        bounded regardless of document size. Returns None if the stream yields no chunks.
+        """
+        start = time.perf_counter()
+        vectorstore = None
+        chunk_count = 0
+        for batch, vectors in self._embed_batches(self._batched(chunks)):
+            text_embeddings = [(chunk.page_content, vector) for chunk, vector in zip(batch, vectors)]
+            metadatas = [chunk.metadata for chunk in batch]
+            if vectorstore is None:
+                vectorstore = FAISS.from_embeddings(text_embeddings, self.embedding_service.embeddings, metadatas=metadatas)
+            else:
+                vectorstore.add_embeddings(text_embeddings, metadatas=metadatas)
+            chunk_count += len(batch)
+
+        elapsed = time.perf_counter() - start
+        self.last_stats = {
+            "chunks": chunk_count,
+            "seconds": elapsed,
+            "chunks_per_second": chunk_count / max(elapsed, 1e-9),
+            "batch_size": self.batch_size,
+            "workers": self.num_workers,
+        }
+        logger.info(f"Embedded {chunk_count} chunks in {elapsed:.2f}s ({self.last_stats['chunks_per_second']:.1f} chunks/s)")
+        return vectorstore
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batch_size": self.batch_size,
+            "workers": self.num_workers,
+            "threads": self.num_threads,
+            "last_build": self.last_stats or None,
+        }
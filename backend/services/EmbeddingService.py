@@ -0,0 +1,197 @@
+import os
+import time
+import queue
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+# Identifies the preprocessing of `encode_texts` in index cache keys, so indexes embedded differently are rebuilt
+TEXT_PREPROCESSING = "newlines-to-spaces"
+
+
+def encode_texts(model: Any, texts: List[str], batch_size: int = 32) -> np.ndarray:
+    """Embed texts as float32 rows, with the same preprocessing for chunks, summaries and queries.
+
+    Newlines are replaced with spaces, as LangChain's sentence-transformer embeddings did when the
+    indexes were first built, so vectors stay comparable whichever path produced them.
+    """
+    texts = [text.replace("\n", " ") for text in texts]
+    return model.encode(texts, batch_size=batch_size, normalize_embeddings=False, convert_to_numpy=True,
+                        show_progress_bar=False).astype(np.float32)
+
+
+class SentenceTransformerEmbeddings(Embeddings):
+    """LangChain embeddings over a loaded sentence-transformer, so the model is loaded once and shared."""
+
+    def __init__(self, model: Any):
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return encode_texts(self.model, texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class EmbeddingService:
+    """Process-wide owner of the sentence-transformer model used for indexing and querying."""
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME, device: str = "cpu"):
+        self.model_name = model_name
+        self.device = device
+        self._model = None
+        self._embeddings: Optional[SentenceTransformerEmbeddings] = None
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+        self.warmup_seconds: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self.loaded_by: Optional[str] = None
+
+        # Query embeddings: an LRU of recent questions and a micro-batcher for concurrent ones
+        self.query_cache_size = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+        self.query_batch_window = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5")) / 1000
+        self.query_batch_max = int(os.getenv("QUERY_BATCH_MAX", "32"))
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._query_cache_lock = threading.Lock()
+        self._query_queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._query_worker: Optional[threading.Thread] = None
+        self.query_cache_hits = 0
+        self.query_cache_misses = 0
+        self.query_batches = 0
+        self.query_batched_texts = 0
+
+    @property
+    def embeddings(self) -> SentenceTransformerEmbeddings:
+        """The shared embeddings instance, loaded on first access if warm-up was skipped."""
+        return self.load(loaded_by="request")
+
+    @property
+    def model(self) -> Any:
+        """The shared SentenceTransformer, for encoding chunk batches directly."""
+        return self.load(loaded_by="request").model
+
+    def is_loaded(self) -> bool:
+        return self._embeddings is not None
+
+    def load(self, loaded_by: str = "request") -> SentenceTransformerEmbeddings:
+        """Load the model once; concurrent callers wait for the first load instead of repeating it."""
+        if self._embeddings is not None:
+            return self._embeddings
+        with self._lock:
+            if self._embeddings is None:
+                from sentence_transformers import SentenceTransformer
+
+                start = time.perf_counter()
+                self._model = SentenceTransformer(self.model_name, device=self.device)
+                self._embeddings = SentenceTransformerEmbeddings(self._model)
+                self.load_seconds = time.perf_counter() - start
+                self.loaded_at = time.time()
+                self.loaded_by = loaded_by
+                logger.info(f"Loaded embedding model {self.model_name} in {self.load_seconds:.2f}s ({loaded_by})")
+        return self._embeddings
+
+    def warm_up(self) -> None:
+        """Load the model and run one forward pass so the first request pays neither cost."""
+        embeddings = self.load(loaded_by="startup")
+        start = time.perf_counter()
+        embeddings.embed_query("warm up")
+        self.warmup_seconds = time.perf_counter() - start
+        logger.info(f"Embedding model warm-up pass took {self.warmup_seconds:.2f}s")
+
+    @staticmethod
+    def normalize_query(text: str) -> str:
+        return " ".join(text.split())
+
+    def embed_query(self, text: str) -> np.ndarray:
+        """Embed a question, served from the LRU cache or coalesced with concurrent questions into one forward pass."""
+        key = self.normalize_query(text)
+        with self._query_cache_lock:
+            vector = self._query_cache.get(key)
+            if vector is not None:
+                self._query_cache.move_to_end(key)
+                self.query_cache_hits += 1
+                return vector
+            self.query_cache_misses += 1
+
+        future: Future = Future()
+        self._ensure_query_worker()
+        self._query_queue.put((key, future))
+        vector = future.result()
+
+        with self._query_cache_lock:
+            self._query_cache[key] = vector
+            self._query_cache.move_to_end(key)
+            while len(self._query_cache) > self.query_cache_size:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def _ensure_query_worker(self) -> None:
+        if self._query_worker is not None and self._query_worker.is_alive():
+            return
+        with self._lock:
+            if self._query_worker is None or not self._query_worker.is_alive():
+                self._query_worker = threading.Thread(target=self._run_query_batches, name="query-embedding-batcher", daemon=True)
+                self._query_worker.start()
+
+    def _run_query_batches(self) -> None:
+        """Collect questions arriving within the batch window and encode them together."""
+        while True:
+            batch = [self._query_queue.get()]
+            deadline = time.perf_counter() + self.query_batch_window
+            while len(batch) < self.query_batch_max:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._query_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._encode_query_batch(batch)
+
+    def _encode_query_batch(self, batch: List[Tuple[str, Future]]) -> None:
+        # Identical questions in the same window share one row of the forward pass
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = np.asarray(self.embeddings.embed_documents(texts), dtype=np.float32)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        vectors.setflags(write=False)  # rows are shared through the cache
+        self.query_batches += 1
+        self.query_batched_texts += len(texts)
+        rows = {text: vectors[i] for i, text in enumerate(texts)}
+        for text, future in batch:
+            future.set_result(rows[text])
+
+    def unload(self) -> None:
+        """Release the model, e.g. on application shutdown."""
+        with self._lock:
+            self._embeddings = None
+            self._model = None
+            self.loaded_at = None
+            self.loaded_by = None
+        with self._query_cache_lock:
+            self._query_cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model_name": self.model_name,
+            "loaded": self.is_loaded(),
+            "loaded_by": self.loaded_by,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "loaded_at": self.loaded_at,
+            "query_cache_entries": len(self._query_cache),
+            "query_cache_hits": self.query_cache_hits,
+            "query_cache_misses": self.query_cache_misses,
+            "query_batches": self.query_batches,
+            "avg_query_batch_size": self.query_batched_texts / self.query_batches if self.query_batches else None,
+        }
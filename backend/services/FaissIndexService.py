@@ -0,0 +1,119 @@
+import os
+import math
+import time
+import logging
+from typing import Any, Dict, Optional
+import numpy as np
+import faiss
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("auto", "flat", "ivf_flat", "hnsw", "ivf_pq", "sq8")
+
+
+class FaissIndexService:
+    """Chooses, trains and tunes the FAISS index of a composed vectorstore.
+
+    "flat" is exact search; "ivf_flat" and "hnsw" trade a little recall for sub-linear search time;
+    "ivf_pq" and "sq8" also compress the vectors (PQ to `FAISS_PQ_M` bytes per chunk, SQ8 to one byte per dimension).
+    "auto" keeps exact search for small corpora and switches to HNSW, then IVF-PQ, as the corpus grows.
+    """
+
+    def __init__(self, index_type: Optional[str] = None):
+        self.index_type = (index_type or os.getenv("FAISS_INDEX_TYPE", "auto")).lower()
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"FAISS_INDEX_TYPE must be one of {', '.join(INDEX_TYPES)}, got '{self.index_type}'.")
+        self.ann_min_chunks = int(os.getenv("FAISS_ANN_MIN_CHUNKS", "50000"))
+        self.nprobe = int(os.getenv("FAISS_NPROBE", "16"))
+        self.hnsw_m = int(os.getenv("FAISS_HNSW_M", "32"))
+        self.ef_search = int(os.getenv("FAISS_HNSW_EF_SEARCH", "64"))
+        self.pq_m = int(os.getenv("FAISS_PQ_M", "64"))
+        self.max_training_points = 100_000
+        self.built_indexes = 0
+        self.last_build: Optional[Dict[str, Any]] = None
+
+    def params(self) -> Dict[str, Any]:
+        """Settings that change which index a selection composes to, for its cache key."""
+        return {
+            "faiss_index_type": self.index_type,
+            "faiss_ann_min_chunks": self.ann_min_chunks,
+            "faiss_hnsw_m": self.hnsw_m,
+            "faiss_pq_m": self.pq_m,
+        }
+
+    @staticmethod
+    def nlist(ntotal: int) -> int:
+        """Number of IVF cells: about 4 * sqrt(n), keeping at least 39 training points per cell."""
+        return max(1, min(int(4 * math.sqrt(ntotal)), ntotal // 39))
+
+    def choose(self, ntotal: int) -> str:
+        """The index type to build for a corpus of ntotal chunks."""
+        index_type = self.index_type
+        if index_type == "auto":
+            if ntotal < self.ann_min_chunks:
+                return "flat"
+            index_type = "hnsw" if ntotal < 10 * self.ann_min_chunks else "ivf_pq"
+        # Trained indexes need enough vectors to learn their centroids and codebooks
+        if (index_type in ("ivf_flat", "ivf_pq") and self.nlist(ntotal) < 2) or (index_type == "ivf_pq" and ntotal < 256 * 39):
+            return "flat"
+        return index_type
+
+    def factory_string(self, index_type: str, ntotal: int, dimension: int) -> str:
+        if index_type == "ivf_flat":
+            return f"IVF{self.nlist(ntotal)},Flat"
+        if index_type == "hnsw":
+            return f"HNSW{self.hnsw_m}"
+        if index_type == "ivf_pq":
+            # PQ needs the sub-quantizer count to divide the dimension
+            pq_m = max(m for m in range(1, min(self.pq_m, dimension) + 1) if dimension % m == 0)
+            return f"IVF{self.nlist(ntotal)},PQ{pq_m}x8"
+        if index_type == "sq8":
+            return "SQ8"
+        return "Flat"
+
+    def build(self, vectors: np.ndarray, index_type: Optional[str] = None) -> faiss.Index:
+        """Build, train and fill an index of the chosen type over float32 vectors (L2 distance, as LangChain's FAISS uses)."""
+        ntotal, dimension = vectors.shape
+        index_type = index_type or self.choose(ntotal)
+        spec = self.factory_string(index_type, ntotal, dimension)
+        start = time.perf_counter()
+        index = faiss.index_factory(dimension, spec)
+        training_seconds = 0.0
+        if not index.is_trained:
+            sample = vectors
+            if ntotal > self.max_training_points:
+                sample = vectors[np.random.default_rng(0).choice(ntotal, self.max_training_points, replace=False)]
+            index.train(sample)
+            training_seconds = time.perf_counter() - start
+        index.add(vectors)
+        self.configure(index)
+        self.built_indexes += 1
+        self.last_build = {
+            "spec": spec,
+            "chunks": ntotal,
+            "training_seconds": training_seconds,
+            "build_seconds": time.perf_counter() - start,
+        }
+        logger.info(f"Built FAISS index {spec} over {ntotal} chunks in {self.last_build['build_seconds']:.2f}s")
+        return index
+
+    def configure(self, index: faiss.Index) -> None:
+        """Apply the search-time settings, which are not stored with an index saved to disk."""
+        ivf_index = faiss.try_extract_index_ivf(index)
+        if ivf_index is not None:
+            ivf_index.nprobe = self.nprobe
+            if ivf_index.direct_map.type == faiss.DirectMap.NoMap:
+                # MMR reconstructs candidate vectors by id, which IVF indexes only support with a direct map
+                ivf_index.make_direct_map()
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = self.ef_search
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "index_type": self.index_type,
+            "ann_min_chunks": self.ann_min_chunks,
+            "nprobe": self.nprobe,
+            "ef_search": self.ef_search,
+            "built_indexes": self.built_indexes,
+            "last_build": self.last_build,
+        }
@@ -0,0 +1,122 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class HierarchicalIndex:
+    """First retrieval stage over a composed vectorstore: one vector per file and one per section.
+
+    A file is represented by the embedding of its LLM summary (or the centroid of its chunks when it has none yet)
+    and a section by the centroid of a run of `section_chunks` consecutive chunks. Files are contiguous id ranges
+    of the composed FAISS index, and so are their sections, so the chunk search of the second stage is restricted
+    to a few ranges whatever the size of the selection. Sections are stored grouped by file: a query compares
+    against every file vector, but only against the sections of the best files.
+    """
+
+    def __init__(self, file_vectors: np.ndarray, file_sections: np.ndarray, section_vectors: np.ndarray,
+                 section_ranges: np.ndarray, top_files: int = 4, top_sections: int = 16):
+        self.file_vectors = file_vectors          # (files, d), normalized
+        self.file_sections = file_sections        # (files + 1,) offsets of each file's sections
+        self.section_vectors = section_vectors    # (sections, d), normalized
+        self.section_ranges = section_ranges      # (sections, 2) [start, end) chunk ids
+        self.top_files = top_files
+        self.top_sections = top_sections
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, file_ranges: List[Tuple[int, int]],
+              summary_vectors: Optional[Sequence[Optional[np.ndarray]]] = None, section_chunks: int = 32,
+              top_files: int = 4, top_sections: int = 16) -> "HierarchicalIndex":
+        """Index the files occupying `file_ranges` of the chunk `vectors`, with optional summary embeddings per file."""
+        file_vectors, section_vectors, section_ranges, file_sections = [], [], [], [0]
+        for i, (start, end) in enumerate(file_ranges):
+            summary_vector = summary_vectors[i] if summary_vectors is not None else None
+            file_vectors.append(summary_vector if summary_vector is not None else vectors[start:end].mean(axis=0))
+            for section_start in range(start, end, section_chunks):
+                section_end = min(section_start + section_chunks, end)
+                section_vectors.append(vectors[section_start:section_end].mean(axis=0))
+                section_ranges.append((section_start, section_end))
+            file_sections.append(len(section_ranges))
+        return cls(
+            file_vectors=_normalize(np.asarray(file_vectors, dtype=np.float32)),
+            file_sections=np.asarray(file_sections, dtype=np.int64),
+            section_vectors=_normalize(np.asarray(section_vectors, dtype=np.float32)),
+            section_ranges=np.asarray(section_ranges, dtype=np.int64).reshape(-1, 2),
+            top_files=top_files,
+            top_sections=top_sections,
+        )
+
+    @staticmethod
+    def file_ranges(vectorstore: FAISS) -> Tuple[List[str], List[Tuple[int, int]]]:
+        """Sources of a composed vectorstore and their id ranges, from the runs of chunks with the same source."""
+        sources, ranges = [], []
+        for i in range(vectorstore.index.ntotal):
+            source = vectorstore.docstore.search(vectorstore.index_to_docstore_id[i]).metadata.get("source")
+            if sources and sources[-1] == source:
+                ranges[-1] = (ranges[-1][0], i + 1)
+            else:
+                sources.append(source)
+                ranges.append((i, i + 1))
+        return sources, ranges
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore: FAISS, summary_vectors: Optional[Dict[str, np.ndarray]] = None,
+                         **kwargs) -> "HierarchicalIndex":
+        """Index a composed (flat) vectorstore, with the summary embeddings available by source path."""
+        sources, ranges = cls.file_ranges(vectorstore)
+        vectors = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal)
+        summaries = [(summary_vectors or {}).get(source) for source in sources]
+        return cls.build(vectors, ranges, summaries, **kwargs)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (self.file_vectors, self.file_sections, self.section_vectors, self.section_ranges))
+
+    def select(self, query_vector: np.ndarray) -> List[Tuple[int, int]]:
+        """Chunk id ranges to search for a query: the best sections of the files closest to it, adjacent ones merged."""
+        query = _normalize(np.asarray(query_vector, dtype=np.float32))
+        file_scores = self.file_vectors @ query
+        files = np.argsort(-file_scores)[:self.top_files]
+
+        section_ids = np.concatenate([np.arange(self.file_sections[f], self.file_sections[f + 1]) for f in files])
+        # A section's score includes its file's, so a strong summary match lifts all of the file's sections
+        owners = np.repeat(files, self.file_sections[files + 1] - self.file_sections[files])
+        scores = self.section_vectors[section_ids] @ query + file_scores[owners]
+        best = section_ids[np.argsort(-scores)[:self.top_sections]]
+
+        ranges = []
+        for start, end in sorted(self.section_ranges[best].tolist()):
+            if ranges and ranges[-1][1] == start:
+                ranges[-1] = (ranges[-1][0], end)
+            else:
+                ranges.append((start, end))
+        return ranges
+
+    @staticmethod
+    def supports(index: faiss.Index) -> bool:
+        """Whether range-restricted search skips the other vectors, as with flat and scalar-quantized indexes.
+
+        IVF and HNSW indexes are already sub-linear, and filtering them by id would only cost recall.
+        """
+        return faiss.try_extract_index_ivf(index) is None and not isinstance(index, faiss.IndexHNSW)
+
+    @staticmethod
+    def search(index: faiss.Index, query_vector: np.ndarray, k: int, ranges: List[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest chunks (distances, ids) within the id ranges, best first."""
+        query = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        distances, ids = [], []
+        for start, end in ranges:
+            params = faiss.SearchParameters(sel=faiss.IDSelectorRange(start, end, True))
+            range_distances, range_ids = index.search(query, min(k, end - start), params=params)
+            distances.append(range_distances[0])
+            ids.append(range_ids[0])
+        distances, ids = np.concatenate(distances), np.concatenate(ids)
+        keep = ids != -1
+        distances, ids = distances[keep], ids[keep]
+        order = np.argsort(distances, kind="stable")[:k]
+        return distances[order], ids[order]
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import shutil
+import pickle
+import hashlib
+import logging
+from typing import Any, Dict, List, Optional
+
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from .BM25Index import BM25Index
+
+logger = logging.getLogger(__name__)
+
+
+def file_content_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """Return the sha256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexCacheService:
+    """On-disk FAISS index store keyed by file content hashes and indexing parameters."""
+
+    MANIFEST_FILE = "manifest.json"
+    INDEX_NAME = "index"
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = int(float(os.getenv("INDEX_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+        self.max_age_seconds = float(os.getenv("INDEX_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600
+        self.use_mmap = os.getenv("INDEX_CACHE_MMAP", "true").lower() == "true"
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, file_hashes: List[str], params: Dict[str, Any]) -> str:
+        """Build a cache key from the (order-independent) file hashes and indexing parameters."""
+        payload = json.dumps({"files": sorted(file_hashes), "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key)
+
+    def _read_manifest(self, entry_path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(entry_path, self.MANIFEST_FILE), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_manifest(self, entry_path: str, manifest: Dict[str, Any]) -> None:
+        tmp_path = os.path.join(entry_path, self.MANIFEST_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(entry_path, self.MANIFEST_FILE))
+
+    def contains(self, key: str) -> bool:
+        return self._read_manifest(self._entry_path(key)) is not None
+
+    def load(self, key: str, embeddings: Embeddings) -> Optional[FAISS]:
+        """Load a cached vectorstore, or return None on a cache miss."""
+        entry_path = self._entry_path(key)
+        manifest = self._read_manifest(entry_path)
+        if manifest is None:
+            return None
+        if time.time() - manifest.get("created_at", 0) > self.max_age_seconds:
+            self.remove(key)
+            return None
+
+        try:
+            vectorstore = self._load_vectorstore(entry_path, embeddings)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable index cache entry {key}: {str(e)}")
+            self.remove(key)
+            return None
+
+        manifest["last_used_at"] = time.time()
+        self._write_manifest(entry_path, manifest)
+        return vectorstore
+
+    def _load_vectorstore(self, entry_path: str, embeddings: Embeddings) -> FAISS:
+        index_file = os.path.join(entry_path, f"{self.INDEX_NAME}.faiss")
+        index = None
+        if self.use_mmap:
+            try:
+                # Memory-map the index so large entries are paged in lazily instead of copied
+                index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            except RuntimeError:
+                index = None
+        if index is None:
+            index = faiss.read_index(index_file)
+
+        with open(os.path.join(entry_path, f"{self.INDEX_NAME}.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+    def load_sparse_index(self, key: str) -> Optional[BM25Index]:
+        """Load the BM25 index stored beside a cached vectorstore, or None if the entry has none."""
+        try:
+            return BM25Index.load(os.path.join(self._entry_path(key), BM25Index.FILE_NAME))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable BM25 index in cache entry {key}: {str(e)}")
+            return None
+
+    def save_sparse_index(self, key: str, sparse_index: BM25Index) -> None:
+        """Add a BM25 index to an existing entry, e.g. one cached before hybrid retrieval existed."""
+        entry_path = self._entry_path(key)
+        if not os.path.isdir(entry_path):
+            return
+        path = os.path.join(entry_path, BM25Index.FILE_NAME)
+        sparse_index.save(path + ".tmp")
+        os.replace(path + ".tmp", path)
+
+    def save(self, key: str, vectorstore: FAISS, file_hashes: List[str], params: Dict[str, Any],
+             sparse_index: Optional[BM25Index] = None) -> None:
+        """Persist a vectorstore, and optionally its BM25 index, under the given key and apply eviction."""
+        entry_path = self._entry_path(key)
+        tmp_path = entry_path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        vectorstore.save_local(tmp_path, index_name=self.INDEX_NAME)
+        if sparse_index is not None:
+            sparse_index.save(os.path.join(tmp_path, BM25Index.FILE_NAME))
+        now = time.time()
+        self._write_manifest(tmp_path, {
+            "file_hashes": sorted(file_hashes),
+            "params": params,
+            "created_at": now,
+            "last_used_at": now,
+        })
+        shutil.rmtree(entry_path, ignore_errors=True)
+        os.replace(tmp_path, entry_path)
+        self.evict()
+
+    def remove(self, key: str) -> None:
+        shutil.rmtree(self._entry_path(key), ignore_errors=True)
+
+    def _entries(self) -> List[Dict[str, Any]]:
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_path = self._entry_path(key)
+            if key.endswith(".tmp") or not os.path.isdir(entry_path):
+                continue
+            manifest = self._read_manifest(entry_path)
+            if manifest is None:
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(entry_path, name))
+                for name in os.listdir(entry_path)
+            )
+            entries.append({"key": key, "size": size, **manifest})
+        return entries
+
+    def evict(self) -> int:
+        """Drop expired entries, then least recently used ones until the cache fits its size budget."""
+        now = time.time()
+        removed = 0
+        live_entries = []
+        for entry in self._entries():
+            if now - entry.get("created_at", 0) > self.max_age_seconds:
+                self.remove(entry["key"])
+                removed += 1
+            else:
+                live_entries.append(entry)
+
+        total_size = sum(entry["size"] for entry in live_entries)
+        for entry in sorted(live_entries, key=lambda e: e.get("last_used_at", 0)):
+            if total_size <= self.max_size_bytes:
+                break
+            self.remove(entry["key"])
+            total_size -= entry["size"]
+            removed += 1
+
+        if removed:
+            logger.info(f"Evicted {removed} index cache entries")
+        return removed
+
+    def invalidate_file(self, file_hash: str) -> int:
+        """Remove every cached index that was built from the file with the given content hash."""
+        removed = 0
+        for entry in self._entries():
+            if file_hash in entry.get("file_hashes", []):
+                self.remove(entry["key"])
+                removed += 1
+        return removed
@@ -0,0 +1,49 @@
+import os
+import gzip
+import json
+import uuid
+from typing import Iterable, Iterator, Optional
+from langchain_core.documents import Document
+
+
+class PageCacheService:
+    """Stores the extracted page text of each file once, as gzipped JSON lines keyed by file content hash."""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, file_hash: str) -> str:
+        return os.path.join(self.cache_dir, f"{file_hash}.jsonl.gz")
+
+    def has_pages(self, file_hash: str) -> bool:
+        return os.path.exists(self._path(file_hash))
+
+    def save_pages(self, file_hash: str, pages: Iterable[Document]) -> int:
+        """Write pages one line at a time, publishing the entry only once every page has been written."""
+        path = self._path(file_hash)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        count = 0
+        try:
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                for page in pages:
+                    f.write(json.dumps({"c": page.page_content, "m": page.metadata}, separators=(",", ":")) + "\n")
+                    count += 1
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return count
+
+    def iter_pages(self, file_hash: str, source: str, limit: Optional[int] = None) -> Iterator[Document]:
+        """Stream cached pages in order; `source` replaces the stored path since equal content may live under another name."""
+        with gzip.open(self._path(file_hash), "rt", encoding="utf-8") as f:
+            for i, line in enumerate(f):
+                if limit is not None and i >= limit:
+                    return
+                record = json.loads(line)
+                yield Document(page_content=record["c"], metadata={**record["m"], "source": source})
+
+    def remove(self, file_hash: str) -> None:
+        if self.has_pages(file_hash):
+            os.remove(self._path(file_hash))
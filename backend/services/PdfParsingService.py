@@ -0,0 +1,74 @@
+import os
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional
+from pypdf import PdfReader
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+def parse_page_range(file_path: str, start: int, end: int) -> List[Document]:
+    """Extract the text of pages [start, end) as Documents with PyPDFLoader-compatible metadata."""
+    reader = PdfReader(file_path)
+    total_pages = len(reader.pages)
+    page_labels = reader.page_labels
+    documents = []
+    for page_number in range(start, min(end, total_pages)):
+        documents.append(Document(
+            page_content=reader.pages[page_number].extract_text().strip(),
+            metadata={
+                "source": file_path,
+                "total_pages": total_pages,
+                "page": page_number,
+                "page_label": page_labels[page_number],
+            }
+        ))
+    return documents
+
+
+class PdfParsingService:
+    """Parses PDFs in a process pool, one task per page range, yielding pages in document order."""
+
+    def __init__(self):
+        cpu_count = os.cpu_count() or 1
+        self.num_workers = max(1, int(os.getenv("PDF_PARSE_WORKERS", str(min(4, cpu_count)))))
+        self.pages_per_task = max(1, int(os.getenv("PDF_PAGES_PER_TASK", "25")))
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawn rather than fork: the server process is multi-threaded and may hold torch/logging locks
+            self._pool = ProcessPoolExecutor(max_workers=self.num_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def page_count(self, file_path: str) -> int:
+        return len(PdfReader(file_path).pages)
+
+    def lazy_load(self, file_path: str) -> Iterator[Document]:
+        """Yield every page of a PDF in order, parsing page ranges concurrently in the process pool.
+
+        At most two ranges per worker are in flight, so memory stays bounded for very large files.
+        """
+        total_pages = self.page_count(file_path)
+        ranges = [(start, min(start + self.pages_per_task, total_pages)) for start in range(0, total_pages, self.pages_per_task)]
+        if self.num_workers == 1 or len(ranges) <= 1:
+            for start, end in ranges:
+                yield from parse_page_range(file_path, start, end)
+            return
+
+        pool = self._get_pool()
+        pending = deque()
+        for start, end in ranges:
+            pending.append(pool.submit(parse_page_range, file_path, start, end))
+            if len(pending) >= self.num_workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
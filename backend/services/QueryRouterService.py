@@ -0,0 +1,100 @@
+import os
+import re
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+
+from .EmbeddingService import EmbeddingService
+
+logger = logging.getLogger(__name__)
+
+GREETING_EXAMPLES = [
+    "hi",
+    "hello",
+    "hey",
+    "hey there",
+    "hello there",
+    "hi, how are you?",
+    "good morning",
+    "good afternoon",
+    "good evening",
+]
+
+GREETING_RESPONSE = "Hello! I'm ready to help you with your documents. What would you like to know?"
+
+# Words that refer back to earlier messages; such messages need the LLM to rewrite them before retrieval
+REFERENCE_PATTERN = re.compile(r"\b(it|its|this|that|these|those|they|them|their|he|him|his|she|her|above|previous|earlier|more)\b", re.IGNORECASE)
+QUESTION_PATTERN = re.compile(r"\?\s*$|^(what|who|whom|whose|when|where|which|why|how|is|are|does|do|did|can|could|list|describe|explain|summarize|give|show|tell)\b", re.IGNORECASE)
+
+
+class QueryRouterService:
+    """Routes obvious greetings and document questions locally with the shared embedding model.
+
+    Messages it is not confident about return None so the caller falls back to the LLM classifier.
+    """
+
+    def __init__(self, embedding_service: EmbeddingService):
+        self.embedding_service = embedding_service
+        self.enabled = os.getenv("PRE_ROUTER_ENABLED", "true").lower() == "true"
+        self.greeting_threshold = float(os.getenv("PRE_ROUTER_GREETING_THRESHOLD", "0.8"))
+        self.document_threshold = float(os.getenv("PRE_ROUTER_DOCUMENT_THRESHOLD", "0.5"))
+        self._greeting_matrix: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.counts = {"greeting": 0, "document_search": 0, "fallback": 0}
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = self.embedding_service.embed_query(text)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _greetings(self) -> np.ndarray:
+        if self._greeting_matrix is None:
+            self._greeting_matrix = np.stack([self._embed(example) for example in GREETING_EXAMPLES])
+        return self._greeting_matrix
+
+    @staticmethod
+    def _descriptions(document_descriptions: str) -> List[str]:
+        """Split the "- filename: description" lines built for the LLM prompt."""
+        return [line.lstrip("- ").strip() for line in document_descriptions.splitlines() if line.startswith("- ")]
+
+    def route(self, message: str, document_descriptions: str, standalone: bool = True) -> Optional[str]:
+        """Return "greeting" or "document_search" when the message is clearly one of them, otherwise None.
+
+        `standalone` is False when earlier conversation may be needed to interpret the message.
+        """
+        if not self.enabled or not message.strip():
+            return None
+
+        query = self._embed(message)
+        greeting_score = float(np.max(self._greetings() @ query))
+        document_score = 0.0
+        route = None
+
+        if greeting_score >= self.greeting_threshold and len(message.split()) <= 5:
+            route = "greeting"
+        else:
+            descriptions = self._descriptions(document_descriptions)
+            if descriptions:
+                document_score = max(float(self._embed(description) @ query) for description in descriptions)
+            is_question = bool(QUESTION_PATTERN.search(message.strip()))
+            needs_history = not standalone and bool(REFERENCE_PATTERN.search(message))
+            if document_score >= self.document_threshold and is_question and not needs_history:
+                route = "document_search"
+
+        with self._lock:
+            self.counts[route or "fallback"] += 1
+        logger.info(f"Pre-router: {route or 'LLM fallback'} (greeting {greeting_score:.2f}, document {document_score:.2f}, "
+                    f"fallback rate {self.fallback_rate():.0%})")
+        return route
+
+    def fallback_rate(self) -> float:
+        total = sum(self.counts.values())
+        return self.counts["fallback"] / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            **self.counts,
+            "fallback_rate": self.fallback_rate(),
+        }
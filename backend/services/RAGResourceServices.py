@@ -1,17 +1,71 @@
 import os
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_community.retrievers import WikipediaRetriever
+import sys
+import time
+import hashlib
+import faiss
+import numpy as np
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface.embeddings import HuggingFaceEmbeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.embeddings import Embeddings
 from langchain_core.documents import Document
-from typing import Any, Dict, List
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from schemas.rag_models import RetrievalResult
+from .IndexCacheService import IndexCacheService, file_content_hash
+from .EmbeddingService import EmbeddingService, TEXT_PREPROCESSING
+from .EmbeddingPipeline import EmbeddingPipeline
+from .PdfParsingService import PdfParsingService
+from .PageCacheService import PageCacheService
+from .VectorStoreRegistry import VectorStoreRegistry
+from .AnswerCacheService import AnswerCacheService
+from .QueryRouterService import QueryRouterService
+from .WikipediaService import WikipediaService
+from .RerankerService import RerankerService
+from .BM25Index import BM25Index, reciprocal_rank_fusion
+from .HierarchicalIndex import HierarchicalIndex
+from .FaissIndexService import FaissIndexService
+from .TokenCounter import TokenCounter
+from .ChatHistoryService import ChatHistoryService
+from .ContextPackerService import ContextPackerService
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+def reset_peak_memory() -> None:
+    """Reset the process peak RSS counter where the platform allows it (Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def get_peak_memory_mb() -> float:
+    """Peak resident set size of this process in MB, since the last reset where supported."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return 0.0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+def chunk_id(doc: Document) -> str:
+    """Stable id of a chunk's content and origin, so citations can reference the chunk instead of embedding it."""
+    key = "\x00".join([str(doc.metadata.get("source", "")), str(doc.metadata.get("page", "")), doc.page_content])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:24]
 
 class ResourceService:
-    def __init__(self):
-        self.vectorstore_db = None
+    def __init__(self, chunk_size: int = 1500, chunk_overlap: int = 100):
         self.api_key = os.getenv("GROQ_API_KEY")
-        self.last_retrieved_docs = []
         if not self.api_key:
             raise ValueError("GROQ_API_KEY is not set in the environment variables.")
         self.model = os.getenv("MODEL_NAME")
@@ -20,70 +74,416 @@ class ResourceService:
         self.uploaded_rag_folder_path = os.path.join(project_root, "uploaded_files")
         os.makedirs(self.uploaded_rag_folder_path, exist_ok=True)
 
-    def initialize_resources(self, selected_file_paths: List[str]):
-        """Initialize the vectorstore using selected files."""
-        documents = self.load_documents(selected_file_paths)
-        chunks = self.split_documents(documents)
-        self.vectorstore_db = self.create_vectorstore(chunks)
-        return {"message": "Resources initialized successfully."}
-
-    def load_documents(self, file_paths: List[str]) -> List[Document]:
-        """Load documents from the specified directory."""
-        documents = []
-        for file_path in file_paths:
-            loader = PyPDFLoader(file_path)
-            documents.extend(loader.load())
-        print(f"Number of documents: {len(documents)}")
-        return documents
-
-    def split_documents(self, documents: List[Document], chunk_size: int = 1500, chunk_overlap: int = 100) -> List[Document]:
-        """Split documents into chunks."""
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
-        chunks = text_splitter.split_documents(documents)
-        print(f"Number of chunks: {len(chunks)}")
-        return chunks
-
-    def create_vectorstore(self, chunks: List[Document]) -> FAISS:
-        """Create a vectorstore from document chunks."""
-        model_kwargs = {'device': 'cpu'}
-        encode_kwargs = {'normalize_embeddings': False}
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-mpnet-base-v2", model_kwargs=model_kwargs, encode_kwargs=encode_kwargs)
-        vectorstore_db = FAISS.from_documents(chunks, embeddings)
-        return vectorstore_db
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.embedding_service = EmbeddingService()
+        self.embedding_pipeline = EmbeddingPipeline(self.embedding_service)
+        self.pdf_parser = PdfParsingService()
+        self.index_cache = IndexCacheService(os.getenv("INDEX_CACHE_DIR", os.path.join(project_root, "index_cache")))
+        self.page_cache = PageCacheService(os.getenv("PAGE_CACHE_DIR", os.path.join(project_root, "page_cache")))
+        self.vectorstore_registry = VectorStoreRegistry(self.index_cache)
+        self.faiss_index = FaissIndexService()
+        self.answer_cache = AnswerCacheService()
+        self.query_router = QueryRouterService(self.embedding_service)
+        self.reranker = RerankerService()
+        self.hybrid_retrieval = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+        if self.hybrid_retrieval and self.reranker.mode == "mmr":
+            # MMR selects among FAISS's own candidates by their vectors, so BM25 results have no way in
+            print("HYBRID_RETRIEVAL is not applied with RERANKER=mmr; retrieval uses dense search only")
+            self.hybrid_retrieval = False
+        self.rrf_k = int(os.getenv("RRF_K", "60"))
+        self.hierarchical_retrieval = os.getenv("HIERARCHICAL_RETRIEVAL", "true").lower() == "true"
+        self.hierarchical_min_chunks = int(os.getenv("HIERARCHICAL_MIN_CHUNKS", "20000"))
+        self.hierarchy_params = {
+            "section_chunks": int(os.getenv("HIERARCHICAL_SECTION_CHUNKS", "32")),
+            "top_files": int(os.getenv("HIERARCHICAL_TOP_FILES", "4")),
+            "top_sections": int(os.getenv("HIERARCHICAL_TOP_SECTIONS", "16")),
+        }
+        # File path -> (summary, its embedding), also used to rebuild the hierarchy of a reloaded vectorstore
+        self.summary_vectors: Dict[str, Tuple[str, np.ndarray]] = {}
+        self.routed_queries = 0
+        self.routed_fraction = 0.0
+        self.token_counter = TokenCounter(embedding_service=self.embedding_service)
+        self.chat_history = ChatHistoryService(self.token_counter)
+        self.context_packer = ContextPackerService(self.token_counter, chunk_overlap)
+        self.wikipedia = WikipediaService(
+            self.embedding_service,
+            cache_dir=os.getenv("WIKIPEDIA_CACHE_DIR", os.path.join(project_root, "wikipedia_cache")),
+            local_index_dir=os.getenv("WIKIPEDIA_LOCAL_INDEX_DIR", os.path.join(project_root, "wikipedia_index"))
+        )
 
-    def formatted_retrieve_docs(self, question: str, k: int = 3) -> str:
-        """Retrieve relevant documents based on the input question."""
-        if not self.vectorstore_db:
+    def index_params(self) -> Dict[str, Any]:
+        """Parameters that change the content of a built index and therefore its cache key."""
+        return {
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "embedding_model": self.embedding_service.model_name,
+            "text_preprocessing": TEXT_PREPROCESSING,
+        }
+
+    def initialize_resources(self, selected_file_paths: List[str], user_id: Optional[int] = None,
+                             descriptions: Optional[Dict[str, str]] = None):
+        """Initialize the user's vectorstore by composing the per-document indexes of the selected files.
+
+        The files' summaries (`descriptions`, by file path) represent them in the first stage of hierarchical retrieval.
+        """
+        reset_peak_memory()
+        embeddings = self.get_embeddings()
+        params = self.index_params()
+        file_hashes = []
+        document_indexes = []
+        sparse_indexes = []
+        for file_path in selected_file_paths:
+            file_hash = file_content_hash(file_path)
+            if file_hash in file_hashes:
+                # Same content as an earlier file: its cached index has the same docstore ids, and is already included
+                print(f"Skipping {file_path}, its content is already in the selection")
+                continue
+            document_index, sparse_index = self.get_document_index(file_path, embeddings, file_hash)
+            if document_index is not None:
+                file_hashes.append(file_hash)
+                document_indexes.append(document_index)
+                sparse_indexes.append(sparse_index)
+        if not document_indexes:
+            raise ValueError("No text could be extracted from the selected files.")
+
+        vectorstore_db = self.compose_vectorstores(document_indexes, embeddings)
+        # Merged in the same order as the vectors, so both indexes share the docstore ids
+        sparse_index = BM25Index.merge(sparse_indexes) if self.hybrid_retrieval else None
+        # The composed index type is part of the selection's key, but not of the per-document (always flat) keys
+        params = {**params, **self.faiss_index.params()}
+        fingerprint = self.index_cache.make_key(file_hashes, params)
+        self.vectorstore_registry.register(user_id, fingerprint, vectorstore_db, selected_file_paths, file_hashes, params,
+                                           sparse_index)
+        if descriptions:
+            self.embed_summaries(descriptions, embeddings)
+        self.get_hierarchy(vectorstore_db, user_id)
+        peak_memory_mb = get_peak_memory_mb()
+        print(f"Composed index with {vectorstore_db.index.ntotal} chunks from {len(document_indexes)} files "
+              f"for user {user_id} (peak memory {peak_memory_mb:.0f} MB)")
+        return {"message": "Resources initialized successfully.", "peak_memory_mb": peak_memory_mb}
+
+    def get_vectorstore(self, user_id: Optional[int] = None) -> FAISS:
+        """Return the user's active vectorstore, recomposing it from per-document indexes if it was dropped."""
+        vectorstore_db = self.vectorstore_registry.get(user_id, self.get_embeddings())
+        if vectorstore_db is not None:
+            self.faiss_index.configure(vectorstore_db.index)
+            return vectorstore_db
+        selection = self.vectorstore_registry.selection(user_id)
+        if selection is None:
             raise ValueError("Vectorstore is not initialized. Please initialize resources first.")
-        
-        retriever = self.vectorstore_db.as_retriever(search_type="similarity", search_kwargs={'k': k})
-        retrieved_docs = retriever.invoke(question)
-        if not retrieved_docs:
-            return "No relevant documents found."
-        
-        # Store the retrieved docs for later citation mapping
-        self.last_retrieved_docs = retrieved_docs
+        self.initialize_resources(selection["file_paths"], user_id)
+        return self.vectorstore_registry.get(user_id, self.get_embeddings())
+
+    def get_sparse_index(self, vectorstore_db: FAISS, user_id: Optional[int] = None) -> Optional[BM25Index]:
+        """Return the BM25 index of the user's active vectorstore, or None when hybrid retrieval is off."""
+        if not self.hybrid_retrieval:
+            return None
+        sparse_index = self.vectorstore_registry.sparse_index(user_id)
+        if sparse_index is None:
+            sparse_index = BM25Index.from_vectorstore(vectorstore_db)
+            self.vectorstore_registry.attach_sparse_index(user_id, sparse_index)
+        return sparse_index
+
+    def embed_summaries(self, descriptions: Dict[str, str], embeddings: Embeddings) -> None:
+        """Embed the files' summaries that changed since they were last embedded."""
+        pending = {file_path: description for file_path, description in descriptions.items()
+                   if description and description != "No description available"
+                   and self.summary_vectors.get(file_path, (None, None))[0] != description}
+        if not pending:
+            return
+        vectors = embeddings.embed_documents(list(pending.values()))
+        for (file_path, description), vector in zip(pending.items(), vectors):
+            self.summary_vectors[file_path] = (description, np.asarray(vector, dtype=np.float32))
+
+    def get_hierarchy(self, vectorstore_db: FAISS, user_id: Optional[int] = None) -> Optional[HierarchicalIndex]:
+        """Return the file and section index of the user's active vectorstore, or None when the chunk search
+        is not restricted: hierarchical retrieval off, a selection below `HIERARCHICAL_MIN_CHUNKS`, or an
+        IVF/HNSW index that is sub-linear already."""
+        index = vectorstore_db.index
+        if (not self.hierarchical_retrieval or index.ntotal < self.hierarchical_min_chunks
+                or not HierarchicalIndex.supports(index)):
+            return None
+        hierarchy = self.vectorstore_registry.hierarchy(user_id)
+        if hierarchy is None:
+            start = time.perf_counter()
+            summary_vectors = {file_path: vector for file_path, (_, vector) in self.summary_vectors.items()}
+            hierarchy = HierarchicalIndex.from_vectorstore(vectorstore_db, summary_vectors, **self.hierarchy_params)
+            self.vectorstore_registry.attach_hierarchy(user_id, hierarchy)
+            print(f"Built hierarchy of {len(hierarchy.file_vectors)} files and {len(hierarchy.section_vectors)} "
+                  f"sections over {index.ntotal} chunks in {time.perf_counter() - start:.1f}s")
+        return hierarchy
+
+    def get_document_index(self, file_path: str, embeddings: Optional[Embeddings] = None,
+                           file_hash: Optional[str] = None) -> Tuple[Optional[FAISS], Optional[BM25Index]]:
+        """Load the persisted dense and BM25 indexes of a single file, building and saving them on first use."""
+        embeddings = embeddings or self.get_embeddings()
+        file_hash = file_hash or file_content_hash(file_path)
+        params = self.index_params()
+        cache_key = self.index_cache.make_key([file_hash], params)
+
+        document_index = self.index_cache.load(cache_key, embeddings)
+        if document_index is not None:
+            print(f"Loaded cached index {cache_key[:12]} for {os.path.basename(file_path)}")
+            self.set_source(document_index, file_path)
+            sparse_index = None
+            if self.hybrid_retrieval:
+                sparse_index = self.index_cache.load_sparse_index(cache_key)
+                if sparse_index is None:
+                    # Entries cached before hybrid retrieval get their BM25 index from the stored chunk text
+                    sparse_index = BM25Index.from_vectorstore(document_index)
+                    self.index_cache.save_sparse_index(cache_key, sparse_index)
+            return document_index, sparse_index
+
+        document_index = self.create_vectorstore(self.stream_chunks(file_path, file_hash))
+        if document_index is None:
+            print(f"No text extracted from {os.path.basename(file_path)}, skipping")
+            return None, None
+        print(f"Number of chunks: {document_index.index.ntotal}")
+        sparse_index = BM25Index.from_vectorstore(document_index) if self.hybrid_retrieval else None
+        self.index_cache.save(cache_key, document_index, [file_hash], params, sparse_index)
+        return document_index, sparse_index
+
+    @staticmethod
+    def set_source(vectorstore: FAISS, file_path: str) -> None:
+        """Point a cached index's chunks at this file; the cache is keyed by content, so they may carry the path
+        of another upload of the same file."""
+        for doc in vectorstore.docstore._dict.values():
+            if doc.metadata.get("source") != file_path:
+                doc.metadata = {**doc.metadata, "source": file_path}
+
+    def load_pages(self, file_path: str, file_hash: Optional[str] = None, limit: Optional[int] = None) -> Iterator[Document]:
+        """Stream a file's pages from the page cache, extracting and caching them on first use."""
+        file_hash = file_hash or file_content_hash(file_path)
+        if not self.page_cache.has_pages(file_hash):
+            page_count = self.page_cache.save_pages(file_hash, self.pdf_parser.lazy_load(file_path))
+            print(f"Cached {page_count} extracted pages for {os.path.basename(file_path)}")
+        return self.page_cache.iter_pages(file_hash, file_path, limit)
+
+    def stream_chunks(self, file_path: str, file_hash: Optional[str] = None) -> Iterator[Document]:
+        """Stream a file's pages and yield their chunks, so no full page or chunk list is built."""
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+        for page in self.load_pages(file_path, file_hash):
+            yield from text_splitter.split_documents([page])
+
+    def build_document_index(self, file_path: str) -> None:
+        """Build and persist the index of a newly uploaded file ahead of its first selection."""
+        try:
+            self.get_document_index(file_path)
+        except Exception as e:
+            print(f"Error building document index for {file_path}: {str(e)}")
+
+    def compose_vectorstores(self, vectorstores: List[FAISS], embeddings: Embeddings) -> FAISS:
+        """Merge per-document indexes into one searchable vectorstore without re-embedding.
+
+        Large selections are rebuilt into the approximate index type chosen by the FAISS index service.
+        """
+        index_type = self.faiss_index.choose(sum(vectorstore.index.ntotal for vectorstore in vectorstores))
+        if len(vectorstores) == 1 and index_type == "flat":
+            return vectorstores[0]
+
+        # Copy vectors out of each source rather than using FAISS.merge_from, which
+        # resets the source index and would fail on memory-mapped cache entries
+        index = faiss.IndexFlatL2(vectorstores[0].index.d)
+        docstore = InMemoryDocstore()
+        index_to_docstore_id = {}
+        for vectorstore in vectorstores:
+            ntotal = vectorstore.index.ntotal
+            if ntotal == 0:
+                continue
+            offset = index.ntotal
+            index.add(vectorstore.index.reconstruct_n(0, ntotal))
+            documents = {}
+            for i in range(ntotal):
+                docstore_id = vectorstore.index_to_docstore_id[i]
+                index_to_docstore_id[offset + i] = docstore_id
+                documents[docstore_id] = vectorstore.docstore.search(docstore_id)
+            docstore.add(documents)
+        if index_type != "flat":
+            # Trained on the selection's own vectors, so the approximate index fits this corpus
+            index = self.faiss_index.build(index.reconstruct_n(0, index.ntotal), index_type)
+            print(f"Built {self.faiss_index.last_build['spec']} index over {index.ntotal} chunks "
+                  f"in {self.faiss_index.last_build['build_seconds']:.1f}s")
+        return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+    def invalidate_file(self, file_path: str, user_id: Optional[int] = None) -> int:
+        """Drop the user's selection and cached answers that include the given file, e.g. before it is deleted.
+
+        Pages and indexes are cached by content, so they are only removed once no selection references the content.
+        """
+        if not os.path.exists(file_path):
+            return 0
+        file_hash = file_content_hash(file_path)
+        self.vectorstore_registry.invalidate_file(user_id, file_path)
+        self.answer_cache.invalidate_file(file_hash, owner=user_id)
+        if self.vectorstore_registry.is_referenced(file_hash):
+            return 0
+        self.page_cache.remove(file_hash)
+        return self.index_cache.invalidate_file(file_hash)
+
+    def lookup_answer(self, question: str, user_id: Optional[int], word_length: int, mode: str) -> Tuple[Optional[Any], Optional[Dict[str, Any]]]:
+        """Look up a cached answer to a similar question asked of the user's current selection.
+
+        Also returns the cache slot to store a newly generated answer under, or None when caching does not apply.
+        """
+        if not self.answer_cache.enabled:
+            return None, None
+        selection = self.vectorstore_registry.selection(user_id)
+        if selection is None:
+            return None, None
+        slot = {
+            # The fingerprint only covers content, and cached answers carry the user's source paths
+            "scope": (user_id, selection["fingerprint"], tuple(selection["file_paths"]), word_length, mode),
+            "embedding": self.embedding_service.embed_query(question),
+            "file_hashes": selection["file_hashes"],
+            "user_id": user_id,
+        }
+        return self.answer_cache.lookup(slot["scope"], slot["embedding"]), slot
+
+    def store_answer(self, slot: Optional[Dict[str, Any]], answer: Any) -> None:
+        """Cache an answer under the slot returned by `lookup_answer`, unless it is an "I don't know" reply."""
+        if slot is not None and not self.is_abstention(answer):
+            self.answer_cache.store(slot["scope"], slot["embedding"], answer, slot["file_hashes"], owner=slot["user_id"])
+
+    @staticmethod
+    def is_abstention(answer: Any) -> bool:
+        # Usually a retrieval miss; caching it would repeat the miss for every similar question instead of retrying
+        text = answer.get("answer") if isinstance(answer, dict) else getattr(answer, "answer", None)
+        return isinstance(text, str) and text.strip().startswith("I don't know")
+
+    def get_embeddings(self) -> Embeddings:
+        """Return the shared embedding model used for indexing and querying."""
+        return self.embedding_service.embeddings
+
+    def create_vectorstore(self, chunks: Iterable[Document]) -> Optional[FAISS]:
+        """Create a vectorstore from a list or stream of document chunks using the batched embedding pipeline."""
+        vectorstore_db = self.embedding_pipeline.build_vectorstore(chunks)
+        return vectorstore_db
+
+    def format_docs(self, docs: List[Document]) -> str:
+        """Format documents as numbered sources for the prompt context."""
         formatted = [
             f"Source ID: {i}\n" +
             f"Context source: {doc.metadata.get('source', 'N/A')}\nContext page content: {doc.page_content}"
-            for i, doc in enumerate(retrieved_docs)
+            for i, doc in enumerate(docs)
         ]
         return "\n\n" + "\n\n".join(formatted)
 
-    def map_citations_to_metadata(self, citations: List[int]) -> List[Dict[str, Any]]:
-        """Map citation IDs back to document metadata."""
+    def formatted_retrieve_docs(self, question: str, k: int = 3, user_id: Optional[int] = None,
+                                word_length: Optional[int] = None) -> RetrievalResult:
+        """Retrieve relevant documents from the user's vectorstore based on the input question."""
+        vectorstore_db = self.get_vectorstore(user_id)
+        sparse_index = self.get_sparse_index(vectorstore_db, user_id)
+        hierarchy = self.get_hierarchy(vectorstore_db, user_id)
+        # Extra candidates let the context packer fill its token budget with relevant sentences beyond the top k
+        fetch_k = max(k, self.context_packer.candidates) if self.context_packer.enabled else k
+        retrieved_docs, timings = self.search_vectorstore(vectorstore_db, question, fetch_k, sparse_index, hierarchy)
+        if not retrieved_docs:
+            return RetrievalResult(docs=[], context="No relevant documents found.", timings=timings)
+        
+        # The docs travel with the request so citations are mapped against this request's sources
+        return self.build_retrieval(question, retrieved_docs, k, timings, word_length)
+
+    def build_retrieval(self, question: str, docs: List[Document], k: int, timings: Optional[Dict[str, float]] = None,
+                        word_length: Optional[int] = None) -> RetrievalResult:
+        """Format ranked documents as the prompt context, packed into the token budget when context packing is enabled."""
+        timings = timings if timings is not None else {}
+        if not self.context_packer.enabled:
+            return RetrievalResult(docs=docs[:k], context=self.format_docs(docs[:k]), timings=timings)
+        
+        start = time.perf_counter()
+        budget = self.context_packer.budget_for(word_length)
+        packed_docs, context, token_counts = self.context_packer.pack(question, docs, k, budget)
+        timings["pack_ms"] = (time.perf_counter() - start) * 1000
+        print(f"Packed {token_counts['context_tokens']} context tokens (budget {budget}) from {len(packed_docs)} of "
+              f"{len(docs)} chunks; the top {k} chunks unpacked: {token_counts['unpacked_tokens']} tokens")
+        return RetrievalResult(docs=packed_docs, context=context, timings=timings)
+
+    def search_vectorstore(self, vectorstore_db: FAISS, question: str, k: int, sparse_index: Optional[BM25Index] = None,
+                           hierarchy: Optional[HierarchicalIndex] = None) -> Tuple[List[Document], Dict[str, float]]:
+        """Over-fetch candidates from FAISS (fused with BM25 when given, except in MMR mode) and re-rank them down to k,
+        timing each stage in milliseconds.
+
+        With a hierarchy, FAISS only searches the sections of the files that best match the question, while
+        BM25 still searches every chunk.
+        """
+        timings = {}
+        start = time.perf_counter()
+        # Repeated and concurrent questions share query embeddings through the embedding service
+        query_embedding = self.embedding_service.embed_query(question).tolist()
+        timings["embed_ms"] = (time.perf_counter() - start) * 1000
+        
+        ranges = None
+        if hierarchy is not None and self.reranker.mode != "mmr":
+            start = time.perf_counter()
+            ranges = hierarchy.select(np.asarray(query_embedding, dtype=np.float32))
+            timings["route_ms"] = (time.perf_counter() - start) * 1000
+            self.routed_queries += 1
+            self.routed_fraction += sum(end - begin for begin, end in ranges) / vectorstore_db.index.ntotal
+        
+        start = time.perf_counter()
+        fetch_k = max(self.reranker.fetch_k, k)
+        if sparse_index is not None and self.reranker.mode != "mmr":
+            dense_keys = self.dense_search(vectorstore_db, query_embedding, fetch_k, ranges)
+            timings["search_ms"] = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            sparse_keys = [key for key, _ in sparse_index.search(question, fetch_k)]
+            timings["bm25_ms"] = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            fused_keys = reciprocal_rank_fusion([dense_keys, sparse_keys], self.rrf_k)
+            fused_keys = fused_keys[:fetch_k if self.reranker.mode == "cross_encoder" else k]
+            docs = [vectorstore_db.docstore.search(key) for key in fused_keys]
+            timings["fusion_ms"] = (time.perf_counter() - start) * 1000
+        elif self.reranker.mode == "mmr":
+            # FAISS selects from the over-fetched candidates itself, so search and MMR are one stage
+            docs = vectorstore_db.max_marginal_relevance_search_by_vector(query_embedding, k=k, fetch_k=fetch_k,
+                                                                          lambda_mult=self.reranker.mmr_lambda)
+            timings["search_ms"] = (time.perf_counter() - start) * 1000
+        elif ranges is not None:
+            keys = self.dense_search(vectorstore_db, query_embedding,
+                                     fetch_k if self.reranker.mode == "cross_encoder" else k, ranges)
+            docs = [vectorstore_db.docstore.search(key) for key in keys]
+            timings["search_ms"] = (time.perf_counter() - start) * 1000
+        elif self.reranker.mode == "cross_encoder":
+            docs = vectorstore_db.similarity_search_by_vector(query_embedding, k=fetch_k)
+            timings["search_ms"] = (time.perf_counter() - start) * 1000
+        else:
+            docs = vectorstore_db.similarity_search_by_vector(query_embedding, k=k)
+            timings["search_ms"] = (time.perf_counter() - start) * 1000
+        
+        if self.reranker.mode == "cross_encoder":
+            start = time.perf_counter()
+            docs = self.reranker.rerank(question, docs, k)
+            timings["rerank_ms"] = (time.perf_counter() - start) * 1000
+        
+        print(f"Retrieved {len(docs)} chunks: " + ", ".join(f"{stage} {ms:.1f}" for stage, ms in timings.items()))
+        return docs, timings
+
+    @staticmethod
+    def dense_search(vectorstore_db: FAISS, query_embedding: List[float], k: int,
+                     ranges: Optional[List[Tuple[int, int]]] = None) -> List[str]:
+        """Docstore ids of the k nearest chunks, best first, among the chunk id ranges when given."""
+        if ranges is not None:
+            _, indices = HierarchicalIndex.search(vectorstore_db.index, np.asarray(query_embedding, dtype=np.float32), k, ranges)
+            return [vectorstore_db.index_to_docstore_id[int(i)] for i in indices]
+        _, indices = vectorstore_db.index.search(np.asarray([query_embedding], dtype=np.float32), k)
+        return [vectorstore_db.index_to_docstore_id[i] for i in indices[0] if i != -1]
+
+    def map_citations_to_metadata(self, citations: List[int], retrieved_docs: List[Document]) -> List[Dict[str, Any]]:
+        """Map citation IDs back to the metadata of the documents retrieved for the same request."""
         mapped_citations = []
         for citation_id in citations:
-            if citation_id < 0 or citation_id >= len(self.last_retrieved_docs):
+            if citation_id < 0 or citation_id >= len(retrieved_docs):
                 # Invalid citation ID
                 mapped_citations.append({
                     "source_id": citation_id,
                     "error": "Invalid citation ID"
                 })
                 continue
-            doc = self.last_retrieved_docs[citation_id]
+            doc = retrieved_docs[citation_id]
             mapped_citations.append({
                 "source_id": citation_id,
+                "chunk_id": chunk_id(doc),
                 "page": doc.metadata.get('page', 'N/A'),
                 "page_label": doc.metadata.get('page_label', 'N/A'),
                 "source": doc.metadata.get('source', 'N/A'),
@@ -91,20 +491,21 @@ class ResourceService:
             })
         return mapped_citations
     
-    def wikipedia_retriever(self, question: str, k: int = 3) -> str:
+    def wikipedia_retriever(self, question: str, k: int = 3, word_length: Optional[int] = None) -> RetrievalResult:
         """Retrieve relevant chunks from wikipedia based on the input question."""
-        wikipedia_retriever = WikipediaRetriever(top_k_results=k, doc_content_chars_max=3000)
-        retrieved_docs = wikipedia_retriever.invoke(question)
+        retrieved_docs = self.wikipedia.retrieve(question, k=k)
+        return self.build_retrieval(question, retrieved_docs, k, word_length=word_length)
 
-        # Store the retrieved docs for later citation mapping
-        self.last_retrieved_docs = retrieved_docs
-        formatted = [
-            f"Source ID: {i}\n" +
-            f"Context source: {doc.metadata.get('source', 'N/A')}\nContext page content: {doc.page_content}"
-            for i, doc in enumerate(retrieved_docs)
-        ]
-        return "\n\n" + "\n\n".join(formatted)
+    def hierarchy_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.hierarchical_retrieval,
+            "min_chunks": self.hierarchical_min_chunks,
+            **self.hierarchy_params,
+            "summaries_embedded": len(self.summary_vectors),
+            "routed_queries": self.routed_queries,
+            "avg_searched_fraction": self.routed_fraction / self.routed_queries if self.routed_queries else None,
+        }
 
-    def is_initialized(self) -> bool:
-        """Check if the vectorstore is initialized."""
-        return self.vectorstore_db is not None
+    def is_initialized(self, user_id: Optional[int] = None) -> bool:
+        """Check if the user's vectorstore is initialized."""
+        return self.vectorstore_registry.is_loaded(user_id)
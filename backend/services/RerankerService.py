@@ -0,0 +1,76 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+RERANKER_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class RerankerService:
+    """Second retrieval stage: re-orders over-fetched FAISS candidates so only the best few reach the prompt.
+
+    Modes: "cross_encoder" scores every (question, chunk) pair with a local CPU cross-encoder in one batch,
+    "mmr" picks relevant but mutually diverse chunks from the candidates, "none" keeps the raw FAISS order.
+    """
+
+    def __init__(self, model_name: str = RERANKER_MODEL_NAME, device: str = "cpu"):
+        self.mode = os.getenv("RERANKER", "cross_encoder").lower()
+        if self.mode not in ("cross_encoder", "mmr", "none"):
+            raise ValueError(f"RERANKER must be 'cross_encoder', 'mmr' or 'none', got '{self.mode}'.")
+        self.model_name = os.getenv("RERANKER_MODEL", model_name)
+        self.device = device
+        self.fetch_k = int(os.getenv("RERANK_FETCH_K", "30"))
+        self.mmr_lambda = float(os.getenv("RERANK_MMR_LAMBDA", "0.5"))
+        self._model = None
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+        self.reranked_queries = 0
+        self.total_rerank_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "none"
+
+    def model(self):
+        """The cross-encoder, loaded once on first use."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    start = time.perf_counter()
+                    self._model = CrossEncoder(self.model_name, device=self.device)
+                    self.load_seconds = time.perf_counter() - start
+                    logger.info(f"Loaded reranker {self.model_name} in {self.load_seconds:.2f}s")
+        return self._model
+
+    def rerank(self, question: str, candidates: List[Document], k: int) -> List[Document]:
+        """Return the k candidates the cross-encoder scores as most relevant, best first."""
+        if len(candidates) <= 1:
+            return candidates[:k]
+        start = time.perf_counter()
+        pairs = [(question, doc.page_content) for doc in candidates]
+        # All candidates in one batch, so re-ranking costs a single forward pass
+        scores = self.model().predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        ranked = sorted(zip(scores, range(len(candidates))), key=lambda pair: pair[0], reverse=True)
+        self.record((time.perf_counter() - start) * 1000)
+        return [candidates[i] for _, i in ranked[:k]]
+
+    def record(self, rerank_ms: float) -> None:
+        self.reranked_queries += 1
+        self.total_rerank_ms += rerank_ms
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "model_name": self.model_name if self.mode == "cross_encoder" else None,
+            "fetch_k": self.fetch_k,
+            "loaded": self._model is not None,
+            "load_seconds": self.load_seconds,
+            "reranked_queries": self.reranked_queries,
+            "avg_rerank_ms": self.total_rerank_ms / self.reranked_queries if self.reranked_queries else None,
+        }
@@ -1,69 +1,336 @@
+import os
 import uuid
-from typing import Dict, List, Optional, Tuple
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
 from schemas.chat_models import ChatMessage
 
+from .SessionStore import SessionStore, InMemorySessionStore, SqlSessionStore, cited_chunk_ids
+
+logger = logging.getLogger(__name__)
+
+# Messages kept in memory per session and passed to the chat agent; older ones stay in the store
+MAX_HISTORY_MESSAGES = 40
+CHUNK_CACHE_SIZE = 2000
+# Flushes of a session's pending messages before they are dropped, so a failing session cannot pile up forever
+MAX_FLUSH_ATTEMPTS = 3
+
+
+def compact_citations(message: ChatMessage) -> Tuple[ChatMessage, Dict[str, Dict]]:
+    """Move the chunk text out of a message's citations, which then reference it by chunk id."""
+    if not message.citations:
+        return message, {}
+    citations, chunks = [], {}
+    for citation in message.citations:
+        citation = dict(citation)
+        page_content = citation.pop("page_content", None)
+        if page_content is not None and citation.get("chunk_id"):
+            chunks[citation["chunk_id"]] = {
+                "chunk_id": citation["chunk_id"],
+                "page_content": page_content,
+                "source": citation.get("source"),
+                "page": citation.get("page"),
+                "page_label": citation.get("page_label"),
+            }
+        citations.append(citation)
+    return ChatMessage(role=message.role, content=message.content, timestamp=message.timestamp, citations=citations), chunks
+
+
 class SessionManager:
-    
-    def __init__(self):
-        # In-memory storage for chat sessions
-        # In production, this would be replaced with a database
-        self._chat_sessions: Dict[str, Dict] = {}
-    
+    """Chat sessions in a durable store behind an in-memory LRU with write-behind appends.
+
+    Reads are served from the LRU after a primary-key version check against the store, so a session
+    continued in another uvicorn worker is reloaded. New messages are appended to the LRU immediately
+    and flushed to the store in batches by a background thread, which also expires idle sessions.
+    Citation chunk text is stored once per chunk and fetched by id, not repeated in every message.
+    """
+
+    def __init__(self, store: Optional[SessionStore] = None):
+        if store is None:
+            backend = os.getenv("SESSION_BACKEND", "sqlite").lower()
+            if backend not in ("sqlite", "memory"):
+                raise ValueError(f"SESSION_BACKEND must be 'sqlite' or 'memory', got '{backend}'.")
+            if backend == "sqlite":
+                from .DataBaseConfig import DataBaseConfig
+
+                store = SqlSessionStore(DataBaseConfig().SessionLocal)
+            else:
+                store = InMemorySessionStore()
+        self.store = store
+        self.ttl = timedelta(hours=float(os.getenv("SESSION_TTL_HOURS", "24")))
+        self.cache_size = int(os.getenv("SESSION_CACHE_SIZE", "1000"))
+        self.flush_interval = float(os.getenv("SESSION_FLUSH_INTERVAL_MS", "200")) / 1000
+        self.sweep_interval = float(os.getenv("SESSION_SWEEP_INTERVAL_SECONDS", "300"))
+        # session_id -> {"user_id", "messages", "version": messages in the store or pending, "summary",
+        #                "summarized_count": messages folded into the summary, "last_active_at"}
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._pending: Dict[str, List[ChatMessage]] = {}
+        self._flushing: Dict[str, List[ChatMessage]] = {}
+        self._pending_chunks: Dict[str, Dict] = {}
+        self._flush_attempts: Dict[str, int] = {}
+        self._chunks: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._worker = threading.Thread(target=self._run_background, name="session-writer", daemon=True)
+        self._worker.start()
+
     def create_session(self, user_id: int) -> str:
         session_id = str(uuid.uuid4())
-        self._chat_sessions[session_id] = {
-            "user_id": user_id,
-            "messages": []
-        }
+        now = datetime.now()
+        # Written through, so the session exists in the store before any of its messages
+        self.store.create(session_id, user_id, now)
+        with self._lock:
+            self._cache_put(session_id, {"user_id": user_id, "messages": [], "version": 0, "summary": "",
+                                         "summarized_count": 0, "last_active_at": now})
         return session_id
-    
+
+    def _cache_put(self, session_id: str, entry: Dict) -> None:
+        self._cache[session_id] = entry
+        self._cache.move_to_end(session_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _load(self, session_id: str) -> Optional[Dict]:
+        """The cached session, reloaded from the store when missing or stale."""
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None and (session_id in self._pending or session_id in self._flushing):
+                # Unflushed appends mean this worker wrote last, so the cache is current
+                self._cache.move_to_end(session_id)
+                return entry
+        if entry is not None:
+            version = self.store.message_count(session_id)
+            if version is None:
+                with self._lock:
+                    self._cache.pop(session_id, None)
+                return None
+            if version == entry["version"]:
+                with self._lock:
+                    if session_id in self._cache:
+                        self._cache.move_to_end(session_id)
+                return entry
+
+        loaded = self.store.load(session_id, MAX_HISTORY_MESSAGES)
+        if loaded is None:
+            return None
+        user_id, version, messages, summary, summarized_count = loaded
+        entry = {"user_id": user_id, "messages": messages, "version": version, "summary": summary,
+                 "summarized_count": summarized_count, "last_active_at": datetime.now()}
+        with self._lock:
+            self._cache_put(session_id, entry)
+        return entry
+
     def get_session(self, session_id: str) -> Optional[List[ChatMessage]]:
-        if session_id in self._chat_sessions:
-            return self._chat_sessions[session_id]["messages"]
-        return None
-    
+        entry = self._load(session_id)
+        return list(entry["messages"]) if entry is not None else None
+
     def get_session_with_user_id(self, session_id: str) -> Tuple[Optional[List[ChatMessage]], Optional[int]]:
         """Returns both the session messages and user_id associated with the session."""
-        if session_id in self._chat_sessions:
-            return (self._chat_sessions[session_id]["messages"], 
-                    self._chat_sessions[session_id]["user_id"])
-        return None, None
-    
+        entry = self._load(session_id)
+        if entry is None:
+            return None, None
+        return list(entry["messages"]), entry["user_id"]
+
+    def get_conversation(self, session_id: str) -> Optional[Tuple[List[ChatMessage], str, int]]:
+        """The cached messages not yet folded into the session's rolling summary, the summary, and the position
+        of the first message returned."""
+        entry = self._load(session_id)
+        if entry is None:
+            return None
+        with self._lock:
+            start = entry["version"] - len(entry["messages"])
+            skip = max(0, entry["summarized_count"] - start)
+            return entry["messages"][skip:], entry["summary"], start + skip
+
+    def save_summary(self, session_id: str, summary: str, summarized_count: int) -> None:
+        """Replace the session's rolling summary with one covering its first `summarized_count` messages."""
+        with self._lock:
+            entry = self._cache.get(session_id)
+            if entry is not None and summarized_count > entry["summarized_count"]:
+                entry["summary"] = summary
+                entry["summarized_count"] = summarized_count
+        # Written through: summaries are updated off the request path and far less often than messages
+        self.store.save_summary(session_id, summary, summarized_count)
+
+    def get_history(self, session_id: str, before: Optional[int] = None,
+                    limit: int = 20) -> Optional[Tuple[List[ChatMessage], int, int]]:
+        """A page of up to `limit` messages ending before position `before` (default: the latest).
+
+        Returns (messages, cursor, start): the session's message count and the position of the first message returned.
+        """
+        entry = self._load(session_id)
+        if entry is None:
+            return None
+        with self._lock:
+            cursor = entry["version"]
+            cached_start = cursor - len(entry["messages"])
+            end = cursor if before is None else max(0, min(before, cursor))
+            start = max(0, end - limit)
+            tail = entry["messages"][max(start, cached_start) - cached_start:max(end, cached_start) - cached_start]
+        if start >= cached_start:
+            return tail, cursor, start
+        # Messages older than the cached tail have already been flushed to the store
+        head_end = min(end, cached_start)
+        loaded = self.store.load(session_id, head_end - start, head_end)
+        if loaded is None:
+            return None
+        return loaded[2] + tail, cursor, start
+
+    def get_chunks(self, chunk_ids: List[str]) -> Dict[str, Dict]:
+        """Citation chunks by id, from memory or the store."""
+        found = {}
+        with self._lock:
+            for chunk_id in chunk_ids:
+                chunk = self._pending_chunks.get(chunk_id) or self._chunks.get(chunk_id)
+                if chunk is not None:
+                    found[chunk_id] = chunk
+        missing = [chunk_id for chunk_id in chunk_ids if chunk_id not in found]
+        if missing:
+            loaded = self.store.get_chunks(missing)
+            with self._lock:
+                for chunk_id, chunk in loaded.items():
+                    self._cache_chunk(chunk_id, chunk)
+            found.update(loaded)
+        return found
+
+    def cited_chunk_ids(self, session_id: str, chunk_ids: List[str]) -> Set[str]:
+        """Those of the chunk ids cited in the session, so chunks are only served to the owner of a session citing them."""
+        entry = self._load(session_id)
+        if entry is None:
+            return set()
+        with self._lock:
+            found = cited_chunk_ids(entry["messages"], chunk_ids)
+            # The cache holds the latest messages, including unflushed ones; older ones are already in the store
+            cached_all = len(entry["messages"]) == entry["version"]
+        missing = [chunk_id for chunk_id in chunk_ids if chunk_id not in found]
+        if missing and not cached_all:
+            found |= self.store.cited_chunk_ids(session_id, missing)
+        return found
+
+    def _cache_chunk(self, chunk_id: str, chunk: Dict) -> None:
+        self._chunks[chunk_id] = chunk
+        self._chunks.move_to_end(chunk_id)
+        while len(self._chunks) > CHUNK_CACHE_SIZE:
+            self._chunks.popitem(last=False)
+
     def get_active_sessions(self, user_id: int) -> List[str]:
-        """Returns a list of active session IDs for the given user."""
-        return [session_id for session_id, data in self._chat_sessions.items() 
-                if data["user_id"] == user_id and data["messages"]]
-
-    def update_session(self, session_id: str, messages: List[ChatMessage]) -> None:
-        # Keep only the last 40 messages (ensures we have enough history)
-        if len(messages) > 40:
-            messages = messages[-40:]
-        
-        if session_id in self._chat_sessions:
-            self._chat_sessions[session_id]["messages"] = messages
-        else:
-            # If session doesn't exist, create it with default user_id 0
-            self._chat_sessions[session_id] = {
-                "user_id": 0,
-                "messages": messages
-            }
-    
+        """Returns the user's non-empty sessions within the TTL, from the store's per-user index."""
+        session_ids = self.store.user_sessions(user_id, datetime.now() - self.ttl)
+        with self._lock:
+            # Sessions whose first messages have not been flushed yet
+            unflushed = [session_id for session_id in self._pending
+                         if session_id not in session_ids and self._cache.get(session_id, {}).get("user_id") == user_id]
+        return unflushed + session_ids
+
+    def append_messages(self, session_id: str, messages: List[ChatMessage]) -> Tuple[List[ChatMessage], int]:
+        """Append messages to a session; they are visible at once and written to the store by the next flush.
+
+        Returns the messages as stored, with compacted citations, and the session's new cursor.
+        """
+        entry = self._load(session_id)
+        if entry is None:
+            raise KeyError(f"Chat session {session_id} not found")
+        stored, chunks = [], {}
+        for message in messages:
+            message, message_chunks = compact_citations(message)
+            stored.append(message)
+            chunks.update(message_chunks)
+        with self._lock:
+            entry["messages"] = (entry["messages"] + stored)[-MAX_HISTORY_MESSAGES:]
+            entry["version"] += len(stored)
+            entry["last_active_at"] = datetime.now()
+            self._pending.setdefault(session_id, []).extend(stored)
+            for chunk_id, chunk in chunks.items():
+                if chunk_id not in self._chunks:
+                    self._pending_chunks[chunk_id] = chunk
+            return stored, entry["version"]
+
     def delete_session(self, session_id: str) -> bool:
-        if session_id in self._chat_sessions:
-            del self._chat_sessions[session_id]
-            return True
-        return False
-    
-    def add_message_to_session(self, session_id: str, message: ChatMessage) -> None:
-        if session_id not in self._chat_sessions:
-            # Create session with default user_id 0
-            self._chat_sessions[session_id] = {
-                "user_id": 0,
-                "messages": []
-            }
-        
-        self._chat_sessions[session_id]["messages"].append(message)
-        
-        # Keep only the last 40 messages (ensures we have enough history)
-        if len(self._chat_sessions[session_id]["messages"]) > 40:
-            self._chat_sessions[session_id]["messages"] = self._chat_sessions[session_id]["messages"][-40:]
+        with self._lock:
+            self._cache.pop(session_id, None)
+            self._pending.pop(session_id, None)
+            self._flush_attempts.pop(session_id, None)
+        return self.store.delete(session_id)
+
+    def flush(self) -> None:
+        """Write all pending appends to the store, one transaction per session.
+
+        A session whose append fails is retried by the next flushes, up to MAX_FLUSH_ATTEMPTS times, and then
+        dropped; the other sessions of the batch are written regardless.
+        """
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            chunks, self._pending_chunks = self._pending_chunks, {}
+            self._flushing = batch
+        if not batch and not chunks:
+            return
+        try:
+            if chunks:
+                try:
+                    self.store.add_chunks(chunks)
+                    with self._lock:
+                        for chunk_id, chunk in chunks.items():
+                            self._cache_chunk(chunk_id, chunk)
+                except Exception as e:
+                    logger.error(f"Error flushing {len(chunks)} citation chunks, will retry: {str(e)}")
+                    with self._lock:
+                        for chunk_id, chunk in chunks.items():
+                            self._pending_chunks.setdefault(chunk_id, chunk)
+            now = datetime.now()
+            for session_id, messages in batch.items():
+                try:
+                    self.store.append(session_id, messages, now)
+                    with self._lock:
+                        self._flush_attempts.pop(session_id, None)
+                except Exception as e:
+                    self._flush_failed(session_id, messages, e)
+        finally:
+            with self._lock:
+                self._flushing = {}
+
+    def _flush_failed(self, session_id: str, messages: List[ChatMessage], error: Exception) -> None:
+        with self._lock:
+            attempts = self._flush_attempts.get(session_id, 0) + 1
+            if attempts < MAX_FLUSH_ATTEMPTS:
+                self._flush_attempts[session_id] = attempts
+                self._pending[session_id] = messages + self._pending.get(session_id, [])
+            else:
+                self._flush_attempts.pop(session_id, None)
+                # The cached copy includes the lost messages, so reload the session from the store on its next read
+                self._cache.pop(session_id, None)
+        if attempts < MAX_FLUSH_ATTEMPTS:
+            logger.warning(f"Error flushing chat session {session_id}, will retry: {str(error)}")
+        else:
+            logger.error(f"Dropping {len(messages)} messages of chat session {session_id} after {attempts} "
+                         f"failed flushes: {str(error)}")
+
+    def sweep(self) -> int:
+        """Delete sessions idle for longer than the TTL."""
+        cutoff = datetime.now() - self.ttl
+        with self._lock:
+            for session_id in [session_id for session_id, entry in self._cache.items()
+                               if entry["last_active_at"] <= cutoff and session_id not in self._pending]:
+                del self._cache[session_id]
+        removed = self.store.delete_expired(cutoff)
+        if removed:
+            logger.info(f"Expired {removed} idle chat sessions")
+        return removed
+
+    def _run_background(self) -> None:
+        last_sweep = datetime.now()
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+            if (datetime.now() - last_sweep).total_seconds() >= self.sweep_interval:
+                last_sweep = datetime.now()
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Error expiring chat sessions: {str(e)}")
+
+    def shutdown(self) -> None:
+        """Stop the background thread and write any pending messages."""
+        self._stop.set()
+        self._worker.join(timeout=5)
+        self.flush()
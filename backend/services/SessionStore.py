@@ -0,0 +1,288 @@
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from schemas.chat_models import ChatMessage
+
+
+def cited_chunk_ids(messages: List[ChatMessage], chunk_ids: List[str]) -> Set[str]:
+    """Those of the chunk ids referenced by the citations of the messages."""
+    wanted = set(chunk_ids)
+    return {citation.get("chunk_id") for message in messages for citation in message.citations or []
+            if citation.get("chunk_id") in wanted}
+
+
+class SessionStore(ABC):
+    """Durable backend of the chat session manager.
+
+    Messages are only ever appended; a session's `message_count` grows with every append, so it doubles
+    as a version that tells a worker whether its cached copy of the session is still current.
+    """
+
+    @abstractmethod
+    def create(self, session_id: str, user_id: int, now: datetime) -> None:
+        ...
+
+    @abstractmethod
+    def load(self, session_id: str, limit: int, before: Optional[int] = None) -> Optional[Tuple[int, int, List[ChatMessage], str, int]]:
+        """(user_id, message_count, up to `limit` messages before position `before`, or the latest, summary,
+        summarized_count) of a session, or None if it does not exist."""
+
+    @abstractmethod
+    def message_count(self, session_id: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def append(self, session_id: str, messages: List[ChatMessage], now: datetime) -> bool:
+        """Append messages to a session in one transaction; False if the session no longer exists.
+
+        Positions are assigned atomically, so several workers may append to the same session.
+        """
+
+    @abstractmethod
+    def add_chunks(self, chunks: Dict[str, Dict]) -> None:
+        """Store the chunks referenced by message citations; chunks already stored are skipped."""
+
+    @abstractmethod
+    def get_chunks(self, chunk_ids: List[str]) -> Dict[str, Dict]:
+        ...
+
+    @abstractmethod
+    def cited_chunk_ids(self, session_id: str, chunk_ids: List[str]) -> Set[str]:
+        """Those of the chunk ids referenced by citations in the session's messages."""
+
+    @abstractmethod
+    def save_summary(self, session_id: str, summary: str, summarized_count: int) -> None:
+        """Store the rolling summary of a session's first `summarized_count` messages, unless a newer one is stored."""
+
+    @abstractmethod
+    def user_sessions(self, user_id: int, active_after: datetime) -> List[str]:
+        """Ids of the user's non-empty sessions active since the given time, most recent first."""
+
+    @abstractmethod
+    def delete(self, session_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def delete_expired(self, cutoff: datetime) -> int:
+        ...
+
+
+class InMemorySessionStore(SessionStore):
+    """Process-local store with a per-user index, for development and single-worker deployments."""
+
+    def __init__(self):
+        self._sessions: Dict[str, Dict] = {}
+        self._user_sessions: Dict[int, set] = {}
+        self._chunks: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def create(self, session_id: str, user_id: int, now: datetime) -> None:
+        with self._lock:
+            self._sessions[session_id] = {"user_id": user_id, "messages": [], "summary": "", "summarized_count": 0,
+                                          "last_active_at": now}
+            self._user_sessions.setdefault(user_id, set()).add(session_id)
+
+    def load(self, session_id: str, limit: int, before: Optional[int] = None) -> Optional[Tuple[int, int, List[ChatMessage], str, int]]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            messages = session["messages"]
+            end = len(messages) if before is None else min(before, len(messages))
+            return (session["user_id"], len(messages), messages[max(0, end - limit):end],
+                    session["summary"], session["summarized_count"])
+
+    def message_count(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return len(session["messages"]) if session is not None else None
+
+    def append(self, session_id: str, messages: List[ChatMessage], now: datetime) -> bool:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            session["messages"].extend(messages)
+            session["last_active_at"] = now
+            return True
+
+    def add_chunks(self, chunks: Dict[str, Dict]) -> None:
+        with self._lock:
+            self._chunks.update(chunks)
+
+    def get_chunks(self, chunk_ids: List[str]) -> Dict[str, Dict]:
+        with self._lock:
+            return {chunk_id: self._chunks[chunk_id] for chunk_id in chunk_ids if chunk_id in self._chunks}
+
+    def cited_chunk_ids(self, session_id: str, chunk_ids: List[str]) -> Set[str]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return cited_chunk_ids(session["messages"], chunk_ids) if session is not None else set()
+
+    def save_summary(self, session_id: str, summary: str, summarized_count: int) -> None:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and summarized_count > session["summarized_count"]:
+                session["summary"] = summary
+                session["summarized_count"] = summarized_count
+
+    def user_sessions(self, user_id: int, active_after: datetime) -> List[str]:
+        with self._lock:
+            sessions = [(session_id, self._sessions[session_id]) for session_id in self._user_sessions.get(user_id, ())]
+            active = [(session["last_active_at"], session_id) for session_id, session in sessions
+                      if session["messages"] and session["last_active_at"] > active_after]
+            return [session_id for _, session_id in sorted(active, reverse=True)]
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self._user_sessions.get(session["user_id"], set()).discard(session_id)
+            return True
+
+    def delete_expired(self, cutoff: datetime) -> int:
+        with self._lock:
+            # Scanned and deleted under one lock, so a session appended to meanwhile is never removed
+            expired = [session_id for session_id, session in self._sessions.items() if session["last_active_at"] <= cutoff]
+            for session_id in expired:
+                session = self._sessions.pop(session_id)
+                self._user_sessions.get(session["user_id"], set()).discard(session_id)
+            return len(expired)
+
+
+class SqlSessionStore(SessionStore):
+    """Store in the application database (SQLite by default), shared by every uvicorn worker."""
+
+    def __init__(self, session_factory: sessionmaker):
+        self.session_factory = session_factory
+
+    def create(self, session_id: str, user_id: int, now: datetime) -> None:
+        from db_models import ChatSessions  # Importing here to avoid circular import issues
+
+        with self.session_factory() as db:
+            db.add(ChatSessions(id=session_id, user_id=user_id, message_count=0, summarized_count=0, created_at=now,
+                                last_active_at=now))
+            db.commit()
+
+    def load(self, session_id: str, limit: int, before: Optional[int] = None) -> Optional[Tuple[int, int, List[ChatMessage], str, int]]:
+        from db_models import ChatSessions, ChatMessages
+
+        with self.session_factory() as db:
+            session = db.get(ChatSessions, session_id)
+            if session is None:
+                return None
+            # The (session_id, position) index serves any page without scanning the session
+            query = db.query(ChatMessages).filter(ChatMessages.session_id == session_id)
+            if before is not None:
+                query = query.filter(ChatMessages.position < before)
+            rows = query.order_by(ChatMessages.position.desc()).limit(limit).all()
+            messages = [ChatMessage(role=row.role, content=row.content, timestamp=row.timestamp, citations=row.citations)
+                        for row in reversed(rows)]
+            return session.user_id, session.message_count, messages, session.summary or "", session.summarized_count
+
+    def message_count(self, session_id: str) -> Optional[int]:
+        from db_models import ChatSessions
+
+        with self.session_factory() as db:
+            return db.query(ChatSessions.message_count).filter(ChatSessions.id == session_id).scalar()
+
+    def append(self, session_id: str, messages: List[ChatMessage], now: datetime) -> bool:
+        from db_models import ChatSessions, ChatMessages
+
+        with self.session_factory() as db:
+            # Reserve the positions with the update that increments message_count: it keeps the session row
+            # (in SQLite, the database) locked until commit, so concurrent appends get consecutive ranges
+            updated = db.query(ChatSessions).filter(ChatSessions.id == session_id).update({
+                ChatSessions.message_count: ChatSessions.message_count + len(messages),
+                ChatSessions.last_active_at: now,
+            }, synchronize_session=False)
+            if not updated:
+                return False  # deleted or expired before the write-behind flush
+            start = db.query(ChatSessions.message_count).filter(ChatSessions.id == session_id).scalar() - len(messages)
+            db.add_all(ChatMessages(session_id=session_id, position=start + i, role=message.role,
+                                    content=message.content, timestamp=message.timestamp, citations=message.citations)
+                       for i, message in enumerate(messages))
+            db.commit()
+            return True
+
+    def add_chunks(self, chunks: Dict[str, Dict]) -> None:
+        from db_models import CitationChunks
+
+        for attempt in range(2):
+            with self.session_factory() as db:
+                # Chunks are content-addressed, so one already stored by an earlier answer is identical
+                stored = {chunk_id for (chunk_id,) in db.query(CitationChunks.id).filter(CitationChunks.id.in_(list(chunks)))}
+                db.add_all(CitationChunks(id=chunk_id, page_content=chunk["page_content"], source=chunk.get("source"),
+                                          page=chunk.get("page"), page_label=chunk.get("page_label"))
+                           for chunk_id, chunk in chunks.items() if chunk_id not in stored)
+                try:
+                    db.commit()
+                    return
+                except IntegrityError:
+                    # Another worker stored one of them since the check; check again
+                    db.rollback()
+                    if attempt:
+                        raise
+
+    def get_chunks(self, chunk_ids: List[str]) -> Dict[str, Dict]:
+        from db_models import CitationChunks
+
+        with self.session_factory() as db:
+            rows = db.query(CitationChunks).filter(CitationChunks.id.in_(chunk_ids)).all()
+            return {row.id: row.to_dict() for row in rows}
+
+    def cited_chunk_ids(self, session_id: str, chunk_ids: List[str]) -> Set[str]:
+        from db_models import ChatMessages
+
+        with self.session_factory() as db:
+            rows = db.query(ChatMessages.citations).filter(ChatMessages.session_id == session_id,
+                                                           ChatMessages.citations.isnot(None))
+            wanted, found = set(chunk_ids), set()
+            for (citations,) in rows:
+                found.update(citation.get("chunk_id") for citation in citations or [] if citation.get("chunk_id") in wanted)
+            return found
+
+    def save_summary(self, session_id: str, summary: str, summarized_count: int) -> None:
+        from db_models import ChatSessions
+
+        with self.session_factory() as db:
+            # Conditional, so a slower update from another worker never replaces a newer summary
+            db.query(ChatSessions).filter(ChatSessions.id == session_id, ChatSessions.summarized_count < summarized_count).update({
+                ChatSessions.summary: summary,
+                ChatSessions.summarized_count: summarized_count,
+            }, synchronize_session=False)
+            db.commit()
+
+    def user_sessions(self, user_id: int, active_after: datetime) -> List[str]:
+        from db_models import ChatSessions
+
+        with self.session_factory() as db:
+            rows = (db.query(ChatSessions.id)
+                    .filter(ChatSessions.user_id == user_id, ChatSessions.message_count > 0,
+                            ChatSessions.last_active_at > active_after)
+                    .order_by(ChatSessions.last_active_at.desc()).all())
+            return [session_id for (session_id,) in rows]
+
+    def delete(self, session_id: str) -> bool:
+        from db_models import ChatSessions, ChatMessages
+
+        with self.session_factory() as db:
+            db.query(ChatMessages).filter(ChatMessages.session_id == session_id).delete(synchronize_session=False)
+            deleted = db.query(ChatSessions).filter(ChatSessions.id == session_id).delete(synchronize_session=False)
+            db.commit()
+            return deleted > 0
+
+    def delete_expired(self, cutoff: datetime) -> int:
+        from db_models import ChatSessions, ChatMessages
+
+        with self.session_factory() as db:
+            expired = db.query(ChatSessions.id).filter(ChatSessions.last_active_at <= cutoff)
+            db.query(ChatMessages).filter(ChatMessages.session_id.in_(expired.scalar_subquery())).delete(synchronize_session=False)
+            deleted = db.query(ChatSessions).filter(ChatSessions.last_active_at <= cutoff).delete(synchronize_session=False)
+            db.commit()
+            return deleted
@@ -0,0 +1,49 @@
+import os
+import logging
+import threading
+from typing import Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCounter:
+    """Counts prompt tokens with a tokenizer loaded on first use: the Hugging Face tokenizer named by
+    `PROMPT_TOKENIZER`, or else the embedding model's own. Token counts are estimated at four characters
+    per token only when no tokenizer can be loaded."""
+
+    def __init__(self, tokenizer_name: Optional[str] = None, embedding_service: Optional[Any] = None):
+        self.tokenizer_name = tokenizer_name if tokenizer_name is not None else os.getenv("PROMPT_TOKENIZER", "")
+        self.embedding_service = embedding_service
+        self._tokenizer = None
+        self._unavailable = not self.tokenizer_name and embedding_service is None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        if self._unavailable:
+            return "estimate"
+        return self.tokenizer_name or self.embedding_service.model_name
+
+    def _get_tokenizer(self) -> Optional[Any]:
+        if self._tokenizer is None and not self._unavailable:
+            with self._lock:
+                if self._tokenizer is None and not self._unavailable:
+                    try:
+                        if self.tokenizer_name:
+                            from transformers import AutoTokenizer
+
+                            self._tokenizer = AutoTokenizer.from_pretrained(self.tokenizer_name)
+                        else:
+                            # The sentence-transformer is loaded at startup for retrieval anyway
+                            self._tokenizer = self.embedding_service.model.tokenizer
+                    except Exception as e:
+                        logger.warning(f"Could not load tokenizer {self.name}, estimating token counts instead: {str(e)}")
+                        self._unavailable = True
+        return self._tokenizer
+
+    def count(self, text: str) -> int:
+        tokenizer = self._get_tokenizer()
+        if tokenizer is not None:
+            # Without special tokens, which a prompt has once and not once per counted piece
+            return len(tokenizer.tokenize(text))
+        return (len(text) + 3) // 4
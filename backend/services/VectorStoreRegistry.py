@@ -0,0 +1,276 @@
+import os
+import json
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from .IndexCacheService import IndexCacheService
+from .BM25Index import BM25Index
+from .HierarchicalIndex import HierarchicalIndex
+
+logger = logging.getLogger(__name__)
+
+
+class VectorStoreRegistry:
+    """Loaded vectorstores keyed by (user, selection fingerprint), kept within an LRU memory budget.
+
+    Cold entries are persisted to the index cache when evicted and reloaded from disk on their next use.
+    Users' selections are also written to disk so every uvicorn worker can serve any user.
+    The lock only guards the bookkeeping: indexes are saved and loaded outside it, so one user's cold
+    reload or eviction does not block the others, and concurrent reloads of one entry share a single load.
+    """
+
+    def __init__(self, index_cache: IndexCacheService):
+        self.index_cache = index_cache
+        self.selections_dir = os.path.join(index_cache.cache_dir, "selections")
+        os.makedirs(self.selections_dir, exist_ok=True)
+        self.memory_budget_bytes = int(float(os.getenv("VECTORSTORE_MEMORY_MB", "1024")) * 1024 * 1024)
+        self._entries: "OrderedDict[Tuple[Hashable, str], Dict[str, Any]]" = OrderedDict()
+        # Each user's current selection (fingerprint, file paths and file hashes) with the identity of the file it was read from
+        self._selections: Dict[Hashable, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+        # Entries being written to disk after eviction, and reloads in progress
+        self._evicting: Dict[Tuple[Hashable, str], Dict[str, Any]] = {}
+        self._loading: Dict[Tuple[Hashable, str], Future] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def estimate_size(vectorstore: FAISS, sparse_index: Optional[BM25Index] = None,
+                      hierarchy: Optional[HierarchicalIndex] = None) -> int:
+        """Approximate resident size of a vectorstore: float32 vectors plus chunk text, plus its BM25 postings
+        and file and section vectors."""
+        index = vectorstore.index
+        text_bytes = sum(len(doc.page_content) for doc in vectorstore.docstore._dict.values())
+        sparse_bytes = sparse_index.nbytes if sparse_index is not None else 0
+        hierarchy_bytes = hierarchy.nbytes if hierarchy is not None else 0
+        return index.ntotal * index.d * 4 + text_bytes + sparse_bytes + hierarchy_bytes
+
+    def register(self, user_id: Hashable, fingerprint: str, vectorstore: FAISS, file_paths: List[str],
+                 file_hashes: List[str], params: Dict[str, Any], sparse_index: Optional[BM25Index] = None) -> None:
+        """Make a vectorstore the user's active one and evict cold entries beyond the memory budget."""
+        with self._lock:
+            # Only the active selection of a user is ever queried, so drop any previous one
+            for key in [key for key in self._entries if key[0] == user_id and key[1] != fingerprint]:
+                del self._entries[key]
+            selection = {
+                "fingerprint": fingerprint,
+                "file_paths": list(file_paths),
+                "file_hashes": list(file_hashes),
+                "params": params,
+            }
+            if self.selection(user_id) != selection:
+                self._write_selection(user_id, selection)
+            self._entries[(user_id, fingerprint)] = {
+                "vectorstore": vectorstore,
+                "sparse_index": sparse_index,
+                "hierarchy": None,
+                "size": self.estimate_size(vectorstore, sparse_index),
+                "file_hashes": list(file_hashes),
+                "params": params,
+            }
+            self._entries.move_to_end((user_id, fingerprint))
+            evicted = self._evict()
+        self._save_evicted(evicted)
+
+    def _selection_path(self, user_id: Hashable) -> str:
+        return os.path.join(self.selections_dir, f"{user_id}.json")
+
+    def _write_selection(self, user_id: Hashable, selection: Dict[str, Any]) -> None:
+        path = self._selection_path(user_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(selection, f)
+        os.replace(tmp_path, path)
+        self._selections[user_id] = (self._file_version(path), selection)
+
+    @staticmethod
+    def _file_version(path: str) -> Tuple[int, int]:
+        # Selections are replaced atomically, so every write gives the file a new inode
+        stat = os.stat(path)
+        return stat.st_ino, stat.st_mtime_ns
+
+    def selection(self, user_id: Hashable) -> Optional[Dict[str, Any]]:
+        """The user's active selection, re-read from disk when another worker process changed or removed it."""
+        path = self._selection_path(user_id)
+        try:
+            version = self._file_version(path)
+        except OSError:
+            self._selections.pop(user_id, None)
+            return None
+        cached = self._selections.get(user_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        try:
+            with open(path) as f:
+                selection = json.load(f)
+        except (OSError, ValueError):
+            return None
+        self._selections[user_id] = (version, selection)
+        return selection
+
+    def get(self, user_id: Hashable, embeddings: Embeddings) -> Optional[FAISS]:
+        """Return the user's active vectorstore, reloading it from disk if it was evicted."""
+        with self._lock:
+            selection = self.selection(user_id)
+            if selection is None:
+                return None
+            key = (user_id, selection["fingerprint"])
+            entry = self._entries.get(key)
+            if entry is None and key in self._evicting:
+                # Still in memory while its save completes, so take it back
+                entry = self._entries[key] = self._evicting[key]
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry["vectorstore"]
+            future = self._loading.get(key)
+            loading = future is None
+            if loading:
+                future = self._loading[key] = Future()
+        if not loading:
+            return future.result()
+
+        try:
+            vectorstore = self._load(user_id, selection, embeddings)
+            future.set_result(vectorstore)
+            return vectorstore
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+
+    def _load(self, user_id: Hashable, selection: Dict[str, Any], embeddings: Embeddings) -> Optional[FAISS]:
+        # The fingerprint is the selection's index cache key, saved there when the entry was evicted
+        vectorstore = self.index_cache.load(selection["fingerprint"], embeddings)
+        if vectorstore is None:
+            return None
+        # The key only covers content, so the entry may have been saved from another user's copies of the files
+        sources = {doc.metadata.get("source") for doc in vectorstore.docstore._dict.values()}
+        if not sources <= set(selection["file_paths"]):
+            return None
+        sparse_index = self.index_cache.load_sparse_index(selection["fingerprint"])
+        logger.info(f"Reloaded evicted vectorstore {selection['fingerprint'][:12]} for user {user_id}")
+        self.register(user_id, selection["fingerprint"], vectorstore, selection["file_paths"],
+                      selection["file_hashes"], selection["params"], sparse_index)
+        return vectorstore
+
+    def sparse_index(self, user_id: Hashable) -> Optional[BM25Index]:
+        """The BM25 index of the user's loaded vectorstore, if one was registered with it."""
+        with self._lock:
+            selection = self.selection(user_id)
+            if selection is None:
+                return None
+            entry = self._entries.get((user_id, selection["fingerprint"]))
+            return entry["sparse_index"] if entry is not None else None
+
+    def attach_sparse_index(self, user_id: Hashable, sparse_index: BM25Index) -> None:
+        """Store a BM25 index built after registration with the user's loaded vectorstore."""
+        with self._lock:
+            selection = self.selection(user_id)
+            if selection is None:
+                return
+            entry = self._entries.get((user_id, selection["fingerprint"]))
+            if entry is None:
+                return
+            entry["sparse_index"] = sparse_index
+            entry["size"] = self.estimate_size(entry["vectorstore"], sparse_index, entry["hierarchy"])
+        if self.index_cache.contains(selection["fingerprint"]):
+            self.index_cache.save_sparse_index(selection["fingerprint"], sparse_index)
+
+    def hierarchy(self, user_id: Hashable) -> Optional[HierarchicalIndex]:
+        """The file and section index of the user's loaded vectorstore, if one was attached to it."""
+        with self._lock:
+            selection = self.selection(user_id)
+            if selection is None:
+                return None
+            entry = self._entries.get((user_id, selection["fingerprint"]))
+            return entry["hierarchy"] if entry is not None else None
+
+    def attach_hierarchy(self, user_id: Hashable, hierarchy: HierarchicalIndex) -> None:
+        """Store a file and section index with the user's loaded vectorstore.
+
+        It is cheap to rebuild from the vectorstore, so it is kept in memory only and dropped on eviction.
+        """
+        with self._lock:
+            selection = self.selection(user_id)
+            if selection is None:
+                return
+            entry = self._entries.get((user_id, selection["fingerprint"]))
+            if entry is None:
+                return
+            entry["hierarchy"] = hierarchy
+            entry["size"] = self.estimate_size(entry["vectorstore"], entry["sparse_index"], hierarchy)
+
+    def is_loaded(self, user_id: Hashable) -> bool:
+        return self.selection(user_id) is not None
+
+    def _evict(self) -> List[Tuple[Tuple[Hashable, str], Dict[str, Any]]]:
+        """Take the least recently used entries beyond the memory budget out of the LRU, to be saved by `_save_evicted`."""
+        evicted = []
+        total_size = sum(entry["size"] for entry in self._entries.values())
+        while total_size > self.memory_budget_bytes and len(self._entries) > 1:
+            key, entry = self._entries.popitem(last=False)
+            self._evicting[key] = entry
+            evicted.append((key, entry))
+            total_size -= entry["size"]
+        return evicted
+
+    def _save_evicted(self, evicted: List[Tuple[Tuple[Hashable, str], Dict[str, Any]]]) -> None:
+        """Write evicted entries to the index cache, outside the lock."""
+        for (user_id, fingerprint), entry in evicted:
+            try:
+                # The disk copy may be missing, or removed since by the index cache's own eviction
+                if not self.index_cache.contains(fingerprint):
+                    self.index_cache.save(fingerprint, entry["vectorstore"], entry["file_hashes"], entry["params"],
+                                          entry["sparse_index"])
+                logger.info(f"Evicted vectorstore {fingerprint[:12]} of user {user_id} to disk")
+            except Exception as e:
+                logger.error(f"Error saving evicted vectorstore {fingerprint[:12]}: {str(e)}")
+            finally:
+                with self._lock:
+                    if self._evicting.get((user_id, fingerprint)) is entry:
+                        del self._evicting[(user_id, fingerprint)]
+
+    def invalidate_file(self, user_id: Hashable, file_path: str) -> bool:
+        """Forget the user's selection and loaded vectorstore if they include the given file.
+
+        Other users' selections of files with the same content are left alone.
+        """
+        with self._lock:
+            selection = self.selection(user_id)
+            if selection is None or file_path not in selection["file_paths"]:
+                return False
+            self._entries.pop((user_id, selection["fingerprint"]), None)
+            self._evicting.pop((user_id, selection["fingerprint"]), None)
+            self._selections.pop(user_id, None)
+            try:
+                os.remove(self._selection_path(user_id))
+            except OSError:
+                pass
+            return True
+
+    def is_referenced(self, file_hash: str) -> bool:
+        """Whether any user's selection, in this or another worker process, includes the given file content."""
+        for name in os.listdir(self.selections_dir):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.selections_dir, name)) as f:
+                    if file_hash in json.load(f)["file_hashes"]:
+                        return True
+            except (OSError, ValueError, KeyError):
+                continue
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "loaded_vectorstores": len(self._entries),
+                "users": len(self._selections),
+                "memory_bytes": sum(entry["size"] for entry in self._entries.values()),
+                "memory_budget_bytes": self.memory_budget_bytes,
+            }
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+from langchain_community.retrievers import WikipediaRetriever
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from .EmbeddingService import EmbeddingService
+from .EmbeddingPipeline import EmbeddingPipeline
+
+logger = logging.getLogger(__name__)
+
+# Expired cache files are deleted on the first write after this interval
+CACHE_SWEEP_INTERVAL_SECONDS = 3600
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class WikipediaService:
+    """Wikipedia retrieval through the live API with a persistent page cache, or from a local FAISS index.
+
+    The "api" backend caches every fetched page by title and every query's result titles, both with a TTL.
+    The "local" backend searches an index built from a pre-downloaded dump with `build_local_index`,
+    so Wikipedia answers need no network and have predictable latency.
+    """
+
+    def __init__(self, embedding_service: EmbeddingService, cache_dir: str, local_index_dir: str):
+        self.embedding_service = embedding_service
+        self.backend = os.getenv("WIKIPEDIA_BACKEND", "api").lower()
+        if self.backend not in ("api", "local"):
+            raise ValueError(f"WIKIPEDIA_BACKEND must be 'api' or 'local', got '{self.backend}'.")
+        self.cache_dir = cache_dir
+        self.local_index_dir = local_index_dir
+        self.ttl_seconds = float(os.getenv("WIKIPEDIA_CACHE_TTL_HOURS", "168")) * 3600
+        self.doc_content_chars_max = 3000
+        os.makedirs(os.path.join(self.cache_dir, "queries"), exist_ok=True)
+        os.makedirs(os.path.join(self.cache_dir, "pages"), exist_ok=True)
+        self._retrievers: Dict[int, WikipediaRetriever] = {}
+        self._local_index: Optional[FAISS] = None
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_evictions = 0
+        self._last_sweep = 0.0
+
+    def retrieve(self, question: str, k: int = 3) -> List[Document]:
+        """Return up to k Wikipedia documents relevant to the question from the configured backend."""
+        if self.backend == "local":
+            return self._retrieve_local(question, k)
+
+        cached = self._read_cached_query(question, k)
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        self.cache_misses += 1
+
+        docs = self._retriever(k).invoke(question)
+        self._write_cached_query(question, k, docs)
+        return docs
+
+    # API backend and its cache
+
+    def _retriever(self, k: int) -> WikipediaRetriever:
+        retriever = self._retrievers.get(k)
+        if retriever is None:
+            retriever = WikipediaRetriever(top_k_results=k, doc_content_chars_max=self.doc_content_chars_max)
+            self._retrievers[k] = retriever
+        return retriever
+
+    def _query_path(self, question: str, k: int) -> str:
+        key = _digest(json.dumps({"query": " ".join(question.lower().split()), "k": k}))
+        return os.path.join(self.cache_dir, "queries", f"{key}.json")
+
+    def _page_path(self, title: str) -> str:
+        return os.path.join(self.cache_dir, "pages", f"{_digest(title)}.json")
+
+    def _read_json(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - record.get("fetched_at", 0) > self.ttl_seconds:
+            return None
+        return record
+
+    def _write_json(self, path: str, record: Dict[str, Any]) -> None:
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def _read_cached_query(self, question: str, k: int) -> Optional[List[Document]]:
+        record = self._read_json(self._query_path(question, k))
+        if record is None:
+            return None
+        docs = []
+        for title in record["titles"]:
+            page = self._read_json(self._page_path(title))
+            if page is None:
+                return None  # a page expired or was removed, so refetch the whole result
+            docs.append(Document(page_content=page["page_content"], metadata=page["metadata"]))
+        return docs
+
+    def _write_cached_query(self, question: str, k: int, docs: List[Document]) -> None:
+        fetched_at = time.time()
+        titles = []
+        for doc in docs:
+            title = doc.metadata.get("title") or doc.metadata.get("source", "")
+            titles.append(title)
+            self._write_json(self._page_path(title), {
+                "title": title,
+                "page_content": doc.page_content,
+                "metadata": doc.metadata,
+                "fetched_at": fetched_at,
+            })
+        self._write_json(self._query_path(question, k), {"query": question, "k": k, "titles": titles, "fetched_at": fetched_at})
+        if fetched_at - self._last_sweep >= CACHE_SWEEP_INTERVAL_SECONDS:
+            self._last_sweep = fetched_at
+            removed = self.evict_expired()
+            if removed:
+                logger.info(f"Deleted {removed} expired Wikipedia cache files")
+
+    def evict_expired(self) -> int:
+        """Delete cached queries and pages older than the TTL."""
+        removed = 0
+        cutoff = time.time() - self.ttl_seconds
+        for folder in ("queries", "pages"):
+            folder_path = os.path.join(self.cache_dir, folder)
+            for name in os.listdir(folder_path):
+                path = os.path.join(folder_path, name)
+                try:
+                    if os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        removed += 1
+                except OSError:
+                    continue
+        self.cache_evictions += removed
+        return removed
+
+    # Local backend
+
+    def local_index(self) -> FAISS:
+        if self._local_index is None:
+            with self._lock:
+                if self._local_index is None:
+                    if not os.path.exists(os.path.join(self.local_index_dir, "index.faiss")):
+                        raise ValueError(f"No local Wikipedia index found in {self.local_index_dir}. Build one with build_wikipedia_index.py.")
+                    self._local_index = FAISS.load_local(self.local_index_dir, self.embedding_service.embeddings,
+                                                         allow_dangerous_deserialization=True)
+                    logger.info(f"Loaded local Wikipedia index with {self._local_index.index.ntotal} chunks")
+        return self._local_index
+
+    def _retrieve_local(self, question: str, k: int) -> List[Document]:
+        query_embedding = self.embedding_service.embed_query(question)
+        return self.local_index().similarity_search_by_vector(query_embedding.tolist(), k=k)
+
+    @staticmethod
+    def iter_dump(dump_path: str, chunk_size: int = 1500, chunk_overlap: int = 100) -> Iterator[Document]:
+        """Chunk articles from a JSON-lines dump with "title", "text" and optional "url" fields."""
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        with open(dump_path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                article = json.loads(line)
+                title = article["title"]
+                source = article.get("url") or f"https://en.wikipedia.org/wiki/{title.replace(' ', '_')}"
+                for chunk in text_splitter.split_text(article["text"]):
+                    yield Document(page_content=chunk, metadata={"title": title, "source": source})
+
+    def build_local_index(self, dump_path: str, embedding_pipeline: EmbeddingPipeline) -> int:
+        """Embed a Wikipedia dump with the shared embedding stack and save it as the local backend's index."""
+        vectorstore = embedding_pipeline.build_vectorstore(self.iter_dump(dump_path))
+        if vectorstore is None:
+            raise ValueError(f"No articles found in {dump_path}.")
+        vectorstore.save_local(self.local_index_dir)
+        with self._lock:
+            self._local_index = vectorstore
+        return vectorstore.index.ntotal
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "backend": self.backend,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_hit_rate": self.cache_hits / lookups if lookups else 0.0,
+            "cache_evictions": self.cache_evictions,
+            "local_index_loaded": self._local_index is not None,
+        }
@@ -1,4 +1,5 @@
 from .RAGResourceServices import ResourceService
 from .AuthService import AuthService
 from .DataBaseConfig import DataBaseConfig
-from .SessionManager import SessionManager
\ No newline at end of file
+from .SessionManager import SessionManager
+from .EmbeddingService import EmbeddingService
\ No newline at end of file
@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+# Tests import the backend packages the way the application does, from the backend directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+VOCAB = ["apple", "banana", "cherry", "engine", "piston", "valve", "river", "delta", "flood", "hello", "hi", "there", "good", "morning"]
+
+
+@pytest.fixture
+def model_loads(monkeypatch):
+    """Replace the downloaded model with a bag-of-words SentenceTransformer, which needs no network
+    but is encoded through the same SentenceTransformer API. Returns the list of model loads."""
+    sentence_transformers = pytest.importorskip("sentence_transformers")
+    from sentence_transformers.models import BoW
+
+    real_class = sentence_transformers.SentenceTransformer
+    calls = []
+
+    def load(*args, **kwargs):
+        calls.append(args)
+        return real_class(modules=[BoW(vocab=VOCAB)])
+
+    monkeypatch.setattr(sentence_transformers, "SentenceTransformer", load)
+    return calls
+
+
+@pytest.fixture
+def embedding_service(model_loads):
+    from services.EmbeddingService import EmbeddingService
+
+    return EmbeddingService()
+
+
+@pytest.fixture
+def pipeline(embedding_service, monkeypatch):
+    from services.EmbeddingPipeline import EmbeddingPipeline
+
+    monkeypatch.setenv("EMBEDDING_WORKERS", "1")
+    monkeypatch.setenv("EMBEDDING_BATCH_SIZE", "2")
+    return EmbeddingPipeline(embedding_service)
@@ -0,0 +1,80 @@
+import pytest
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setenv("ANSWER_CACHE_THRESHOLD", "0.95")
+    monkeypatch.setenv("ANSWER_CACHE_TTL_SECONDS", "60")
+    monkeypatch.setenv("ANSWER_CACHE_MAX_ENTRIES", "2")
+    from services.AnswerCacheService import AnswerCacheService
+
+    return AnswerCacheService()
+
+
+@pytest.fixture
+def embed(embedding_service):
+    return embedding_service.embed_query
+
+
+SCOPE = (7, "fingerprint", ("fruit.pdf",), 250, "document")
+
+
+def test_similar_questions_hit_within_the_threshold(cache, embed):
+    cache.store(SCOPE, embed("apple banana"), "fruit answer")
+
+    # Same bag of words, cosine similarity 1
+    assert cache.lookup(SCOPE, embed("banana apple")) == "fruit answer"
+    # Half the words in common, cosine similarity 0.5
+    assert cache.lookup(SCOPE, embed("apple cherry")) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_scopes_are_isolated(cache, embed):
+    cache.store(SCOPE, embed("apple banana"), "user 7 answer")
+
+    other_user = (8,) + SCOPE[1:]
+    other_mode = SCOPE[:-1] + ("agent",)
+    assert cache.lookup(other_user, embed("apple banana")) is None
+    assert cache.lookup(other_mode, embed("apple banana")) is None
+
+
+def test_least_recently_used_entry_is_evicted(cache, embed):
+    cache.store(SCOPE, embed("apple"), "apple answer")
+    cache.store(SCOPE, embed("engine"), "engine answer")
+    cache.lookup(SCOPE, embed("apple"))
+    cache.store(SCOPE, embed("river"), "river answer")
+
+    assert cache.lookup(SCOPE, embed("engine")) is None
+    assert cache.lookup(SCOPE, embed("apple")) == "apple answer"
+    assert cache.lookup(SCOPE, embed("river")) == "river answer"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_the_ttl(cache, embed, monkeypatch):
+    from types import SimpleNamespace
+    import services.AnswerCacheService as answer_cache_module
+
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache_module, "time", SimpleNamespace(time=lambda: now[0]))
+    cache.store(SCOPE, embed("apple"), "apple answer")
+    now[0] += 30
+    assert cache.lookup(SCOPE, embed("apple")) == "apple answer"
+
+    # Use does not extend the TTL
+    now[0] += 31
+    assert cache.lookup(SCOPE, embed("apple")) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_invalidate_file_drops_only_the_owners_answers_from_that_file(cache, embed):
+    other_scope = (8,) + SCOPE[1:]
+    cache.store(SCOPE, embed("apple"), "user 7 answer", file_hashes=["fruit-hash"], owner=7)
+    cache.store(other_scope, embed("apple"), "user 8 answer", file_hashes=["fruit-hash"], owner=8)
+
+    assert cache.invalidate_file("fruit-hash", owner=7) == 1
+    assert cache.invalidate_file("other-hash") == 0
+    assert cache.lookup(SCOPE, embed("apple")) is None
+    assert cache.lookup(other_scope, embed("apple")) == "user 8 answer"
+
+    assert cache.invalidate_file("fruit-hash") == 1
+    assert cache.lookup(other_scope, embed("apple")) is None
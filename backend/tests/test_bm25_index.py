@@ -0,0 +1,55 @@
+import numpy as np
+
+from services.BM25Index import BM25Index, reciprocal_rank_fusion
+
+
+def test_search_ranks_chunks_by_shared_terms():
+    index = BM25Index.build(["apple banana", "engine piston valve piston", "river delta"], ["a", "b", "c"])
+
+    assert [key for key, _ in index.search("piston engine", 5)] == ["b"]
+    assert [key for key, _ in index.search("apple river", 1)] in (["a"], ["c"])
+    assert index.search("unknown", 5) == []
+    assert BM25Index.build([], []).search("apple", 5) == []
+
+
+def test_merge_matches_a_single_build():
+    texts, keys = ["apple banana", "banana cherry", "engine part ab-1234", "v2.1 río"], ["k1", "k2", "k3", "k4"]
+    merged = BM25Index.merge([BM25Index.build(texts[:2], keys[:2]), BM25Index.build(texts[2:], keys[2:])])
+    built = BM25Index.build(texts, keys)
+
+    assert merged.keys() == keys
+    for query in ("banana", "ab-1234 engine", "río", "v2.1 cherry"):
+        assert merged.search(query, 4) == built.search(query, 4)
+
+
+def test_terms_and_keys_are_utf8_buffers(tmp_path):
+    index = BM25Index.build(["café crème", "naïve"], ["clé-1", "k2"])
+
+    assert index.key_data.dtype == np.uint8 and index.term_data.dtype == np.uint8
+    assert index.key_data.nbytes == len("clé-1k2".encode("utf-8"))
+    assert index.key(0) == "clé-1"
+
+    path = str(tmp_path / BM25Index.FILE_NAME)
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert loaded.keys() == ["clé-1", "k2"]
+    assert loaded.vocab == index.vocab
+    assert loaded.search("crème", 2) == index.search("crème", 2)
+
+
+def test_loads_indexes_saved_with_string_arrays(tmp_path):
+    index = BM25Index.build(["apple banana", "cherry"], ["a", "b"])
+    path = str(tmp_path / BM25Index.FILE_NAME)
+    with open(path, "wb") as f:
+        np.savez(f, terms=np.array(list(index.vocab), dtype=str), offsets=index.offsets, doc_ids=index.doc_ids,
+                 tfs=index.tfs, doc_lengths=index.doc_lengths, keys=np.array(index.keys(), dtype=str))
+
+    assert BM25Index.load(path).search("cherry", 2) == index.search("cherry", 2)
+
+
+def test_reciprocal_rank_fusion_favours_keys_ranked_by_both():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d", "c"]], k=60)
+
+    assert fused[0] == "b"
+    assert set(fused) == {"a", "b", "c", "d"}
+    assert fused.index("c") < fused.index("a")
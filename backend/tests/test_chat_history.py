@@ -0,0 +1,56 @@
+import pytest
+
+from schemas.chat_models import ChatMessage
+from services.TokenCounter import TokenCounter
+
+
+def make_messages(count):
+    # Each formatted message is 43 characters: 11 estimated tokens, 12 with its line break
+    return [ChatMessage(role="user" if i % 2 == 0 else "assistant", content=f"message {i:02d} " + "x" * (26 if i % 2 == 0 else 21),
+                        timestamp="2026-01-01T00:00:00") for i in range(count)]
+
+
+@pytest.fixture
+def history(monkeypatch):
+    monkeypatch.delenv("PROMPT_TOKENIZER", raising=False)
+    monkeypatch.setenv("CHAT_HISTORY_TOKEN_BUDGET", "50")
+    monkeypatch.setenv("CHAT_SUMMARY_MIN_MESSAGES", "3")
+    from services.ChatHistoryService import ChatHistoryService
+
+    return ChatHistoryService(TokenCounter())
+
+
+def test_build_keeps_the_newest_messages_within_the_budget(history):
+    messages = make_messages(10)
+    assert all(history.count_tokens(history.format_message(message)) == 11 for message in messages)
+
+    built = history.build(messages, "", max_messages=20)
+
+    assert built.splitlines() == [history.format_message(message) for message in messages[6:]]
+    assert history.count_tokens(built) <= history.token_budget
+
+
+def test_build_puts_the_summary_first_and_respects_max_messages(history):
+    messages = make_messages(10)
+
+    built = history.build(messages, "They talked about engines.", max_messages=2)
+
+    assert built.splitlines() == ["Summary of the earlier conversation: They talked about engines."] + \
+        [history.format_message(message) for message in messages[8:]]
+
+
+def test_last_message_is_kept_even_over_budget(history):
+    long_message = ChatMessage(role="user", content="x" * 400, timestamp="2026-01-01T00:00:00")
+
+    assert history.build(make_messages(3) + [long_message], "", max_messages=20) == history.format_message(long_message)
+
+
+def test_messages_to_fold_waits_for_enough_messages(history):
+    # 4 messages fit the budget, so the 2 older ones would be folded: fewer than the minimum of 3
+    assert history.messages_to_fold(make_messages(6), max_messages=20) == []
+
+    messages = make_messages(9)
+    assert history.messages_to_fold(messages, max_messages=20) == messages[:5]
+
+    history.summary_enabled = False
+    assert history.messages_to_fold(messages, max_messages=20) == []
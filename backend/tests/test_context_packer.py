@@ -0,0 +1,92 @@
+from langchain_core.documents import Document
+
+from services.ContextPackerService import ContextPackerService
+from services.TokenCounter import TokenCounter
+
+
+def make_packer(monkeypatch, chunk_overlap=100):
+    monkeypatch.delenv("PROMPT_TOKENIZER", raising=False)
+    # Four characters per token, so budgets are easy to reason about
+    return ContextPackerService(TokenCounter(), chunk_overlap)
+
+
+def test_overlap_between_chunks_of_a_document_is_sent_once(monkeypatch):
+    packer = make_packer(monkeypatch)
+    shared = "The valve opens when the piston reaches the top."
+    docs = [
+        Document(page_content=f"The engine has four cylinders. {shared}", metadata={"source": "motor.pdf"}),
+        Document(page_content=f"{shared} The exhaust leaves through the manifold.", metadata={"source": "motor.pdf"}),
+    ]
+
+    packed_docs, context, tokens = packer.pack("How does the valve open?", docs, k=2, budget=1000)
+
+    assert context.count(shared) == 1
+    assert "The exhaust leaves through the manifold." in context
+    assert packed_docs == docs
+    assert packer.stats()["overlap_chars_removed"] == len(shared)
+    assert tokens["context_tokens"] < tokens["unpacked_tokens"]
+
+
+def test_overlap_is_only_trimmed_within_a_document(monkeypatch):
+    packer = make_packer(monkeypatch)
+    text = "The river delta floods every spring."
+    docs = [
+        Document(page_content=f"{text} Farmers plant after the flood.", metadata={"source": "a.pdf"}),
+        Document(page_content=f"Boats carry grain. {text}", metadata={"source": "b.pdf"}),
+    ]
+
+    packer.pack("When does the delta flood?", docs, k=2, budget=1000)
+
+    assert packer.stats()["overlap_chars_removed"] == 0
+    # The repeated sentence itself is still sent once
+    assert packer.stats()["duplicate_sentences_removed"] == 1
+
+
+def test_budget_keeps_the_most_relevant_sentences(monkeypatch):
+    packer = make_packer(monkeypatch)
+    filler = " ".join(f"Filler sentence number {i} says nothing useful." for i in range(30))
+    docs = [Document(page_content=f"{filler} The piston moves the crankshaft.", metadata={"source": "motor.pdf"})]
+    budget = 60
+
+    _, context, tokens = packer.pack("What moves the piston?", docs, k=1, budget=budget)
+
+    assert tokens["context_tokens"] <= budget
+    assert "The piston moves the crankshaft." in context
+    assert "Filler sentence number 0 says nothing useful." in context
+    assert "Filler sentence number 29" not in context
+    assert packer.stats()["sentences_trimmed"] > 0
+
+
+def test_extra_candidates_only_contribute_sentences_about_the_question(monkeypatch):
+    packer = make_packer(monkeypatch)
+    docs = [
+        Document(page_content="The piston moves the crankshaft.", metadata={"source": "motor.pdf"}),
+        Document(page_content="Rivers carry silt to the delta.", metadata={"source": "geo.pdf"}),
+        Document(page_content="Oil cools the engine. The piston is lubricated by oil.", metadata={"source": "extra.pdf"}),
+    ]
+
+    packed_docs, context, _ = packer.pack("What moves the piston?", docs, k=1, budget=1000)
+
+    assert "Rivers carry silt" not in context
+    assert "The piston is lubricated by oil." in context
+    assert "Oil cools the engine." not in context
+    # Source IDs follow the order of the packed chunks
+    assert context.index("Source ID: 0") < context.index("Source ID: 1")
+    assert [doc.metadata["source"] for doc in packed_docs] == ["motor.pdf", "extra.pdf"]
+
+
+def test_fit_text_shares_the_budget_between_texts(monkeypatch):
+    packer = make_packer(monkeypatch)
+    short = "Page one is short."
+    long_first = " ".join(f"First long page sentence {i}." for i in range(50))
+    long_last = " ".join(f"Last long page sentence {i}." for i in range(50))
+
+    fitted = packer.fit_text([short, long_first, long_last, short], budget=100)
+
+    parts = fitted.split("\n\n")
+    # The repeated page is kept once, and the last long page is represented as well as the first
+    assert parts[0] == short
+    assert len(parts) == 3
+    assert parts[1].startswith("First long page sentence 0.") and parts[2].startswith("Last long page sentence 0.")
+    assert abs(len(parts[1]) - len(parts[2])) < 40
+    assert sum(packer.token_counter.count(sentence) + 1 for sentence in packer.split_sentences(fitted)) <= 100
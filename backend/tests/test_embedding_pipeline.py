@@ -0,0 +1,46 @@
+from langchain_core.documents import Document
+
+
+def test_in_process_build_indexes_every_chunk(pipeline):
+    chunks = [
+        Document(page_content="apple banana cherry", metadata={"source": "fruit.pdf", "page": 0}),
+        Document(page_content="engine piston valve", metadata={"source": "motor.pdf", "page": 0}),
+        Document(page_content="river delta flood", metadata={"source": "geo.pdf", "page": 1}),
+    ]
+    vectorstore = pipeline.build_vectorstore(iter(chunks))
+
+    assert vectorstore.index.ntotal == 3
+    best = vectorstore.similarity_search("piston engine", k=1)[0]
+    assert best.page_content == "engine piston valve"
+    assert best.metadata == {"source": "motor.pdf", "page": 0}
+    assert pipeline.stats()["last_build"]["chunks"] == 3
+
+
+def test_indexing_and_queries_share_one_model(pipeline, model_loads):
+    pipeline.build_vectorstore([Document(page_content="apple", metadata={})])
+    pipeline.embedding_service.embeddings.embed_query("apple")
+
+    assert len(model_loads) == 1
+    assert pipeline.embedding_service.model is pipeline.embedding_service.embeddings.model
+
+
+def test_empty_stream_builds_nothing(pipeline):
+    assert pipeline.build_vectorstore(iter([])) is None
+    assert pipeline.stats()["last_build"]["chunks"] == 0
+
+
+def test_chunks_and_queries_are_preprocessed_alike(pipeline, monkeypatch):
+    model = pipeline.embedding_service.model
+    encoded = []
+    real_encode = model.encode
+
+    def encode(texts, **kwargs):
+        encoded.extend(texts)
+        return real_encode(texts, **kwargs)
+
+    monkeypatch.setattr(model, "encode", encode)
+    vectorstore = pipeline.build_vectorstore([Document(page_content="apple\nbanana", metadata={})])
+    query_vector = pipeline.embedding_service.embeddings.embed_query("apple\nbanana")
+
+    assert encoded == ["apple banana", "apple banana"]
+    assert vectorstore.index.reconstruct(0).tolist() == query_vector
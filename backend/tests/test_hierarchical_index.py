@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from services.HierarchicalIndex import HierarchicalIndex
+
+FILES = {
+    "fruit.pdf": ["apple", "banana", "cherry"],
+    "motor.pdf": ["engine", "piston", "valve"],
+    "geo.pdf": ["river", "delta", "flood"],
+}
+
+
+@pytest.fixture
+def vectorstore(pipeline):
+    chunks = [Document(page_content=word, metadata={"source": source}) for source, words in FILES.items() for word in words]
+    return pipeline.build_vectorstore(chunks)
+
+
+@pytest.fixture
+def embed(embedding_service):
+    return embedding_service.embed_query
+
+
+def test_file_ranges_follow_the_runs_of_each_source(vectorstore):
+    assert HierarchicalIndex.file_ranges(vectorstore) == (list(FILES), [(0, 3), (3, 6), (6, 9)])
+
+
+def test_select_restricts_the_search_to_the_closest_file(vectorstore, embed):
+    hierarchy = HierarchicalIndex.from_vectorstore(vectorstore, section_chunks=2, top_files=1, top_sections=1)
+
+    ranges = hierarchy.select(embed("piston"))
+    assert ranges == [(3, 5)]
+
+    distances, ids = HierarchicalIndex.search(vectorstore.index, embed("piston"), 3, ranges)
+    assert ids.tolist()[0] == 4
+    assert all(3 <= i < 5 for i in ids.tolist())
+    assert np.all(np.diff(distances) >= 0)
+
+
+def test_adjacent_sections_are_merged_into_one_range(vectorstore, embed):
+    hierarchy = HierarchicalIndex.from_vectorstore(vectorstore, section_chunks=2, top_files=1, top_sections=2)
+
+    assert hierarchy.select(embed("valve piston")) == [(3, 6)]
+
+
+def test_summary_vector_represents_its_file(vectorstore, embed):
+    # The summary mentions the river, so the fruit file now matches a river question better than the geo file
+    hierarchy = HierarchicalIndex.from_vectorstore(vectorstore, {"fruit.pdf": embed("river flood")}, top_files=1)
+
+    assert hierarchy.select(embed("river")) == [(0, 3)]
+
+
+def test_search_returns_the_k_best_across_ranges(vectorstore, embed):
+    distances, ids = HierarchicalIndex.search(vectorstore.index, embed("apple river"), 2, [(0, 3), (6, 9)])
+
+    assert sorted(ids.tolist()) == [0, 6]
+    assert len(distances) == 2
@@ -0,0 +1,48 @@
+import pytest
+
+DESCRIPTIONS = "- motor.pdf: engine piston valve manual\n- fruit.pdf: apple banana orchard guide"
+
+
+@pytest.fixture
+def router(embedding_service, monkeypatch):
+    monkeypatch.setenv("PRE_ROUTER_GREETING_THRESHOLD", "0.8")
+    monkeypatch.setenv("PRE_ROUTER_DOCUMENT_THRESHOLD", "0.5")
+    from services.QueryRouterService import QueryRouterService
+
+    return QueryRouterService(embedding_service)
+
+
+def test_short_greetings_are_answered_locally(router):
+    assert router.route("Hello there", DESCRIPTIONS) == "greeting"
+    assert router.route("good morning", DESCRIPTIONS) == "greeting"
+    # Greeting words in a longer message are not enough
+    assert router.route("hello, how does the engine piston work?", DESCRIPTIONS) != "greeting"
+
+
+def test_questions_close_to_a_document_go_to_search(router):
+    # Cosine similarity 1/sqrt(3) to the motor description, above the 0.5 threshold
+    assert router.route("How does the piston move?", DESCRIPTIONS) == "document_search"
+    assert router.route("apple banana?", DESCRIPTIONS) == "document_search"
+
+
+def test_unclear_messages_fall_back_to_the_llm(router):
+    # Not about any document
+    assert router.route("How does the river flood?", DESCRIPTIONS) is None
+    # Not a question
+    assert router.route("piston", DESCRIPTIONS) is None
+    # Refers back to the conversation
+    assert router.route("How does it move the piston?", DESCRIPTIONS, standalone=False) is None
+    assert router.route("How does it move the piston?", DESCRIPTIONS) == "document_search"
+    # No document descriptions to compare against
+    assert router.route("How does the piston move?", "") is None
+    assert router.route("   ", DESCRIPTIONS) is None
+
+    assert router.counts == {"greeting": 0, "document_search": 1, "fallback": 4}
+    assert router.fallback_rate() == pytest.approx(0.8)
+
+
+def test_disabled_router_always_falls_back(embedding_service, monkeypatch):
+    monkeypatch.setenv("PRE_ROUTER_ENABLED", "false")
+    from services.QueryRouterService import QueryRouterService
+
+    assert QueryRouterService(embedding_service).route("Hello there", DESCRIPTIONS) is None
@@ -0,0 +1,110 @@
+from datetime import datetime
+
+import pytest
+
+from schemas.chat_models import ChatMessage
+from services.SessionStore import SessionStore, InMemorySessionStore
+
+
+def test_incomplete_backend_fails_on_instantiation():
+    class AppendOnlyStore(SessionStore):
+        def append(self, session_id, messages, now):
+            pass
+
+    with pytest.raises(TypeError):
+        AppendOnlyStore()
+
+
+def test_in_memory_store_appends_and_pages():
+    store = InMemorySessionStore()
+    now = datetime.now()
+    store.create("s1", 7, now)
+    messages = [ChatMessage(role="user", content=f"message {i}", timestamp=now.isoformat()) for i in range(5)]
+    assert store.append("s1", messages, now)
+
+    user_id, count, page, summary, summarized_count = store.load("s1", 2, before=3)
+    assert (user_id, count, summary, summarized_count) == (7, 5, "", 0)
+    assert [message.content for message in page] == ["message 1", "message 2"]
+    assert store.message_count("s1") == 5
+    assert store.user_sessions(7, now.replace(year=now.year - 1)) == ["s1"]
+
+
+def test_sql_store_appends_from_two_workers_get_consecutive_positions(tmp_path):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from services.DataBaseConfig import Base
+    from services.SessionStore import SqlSessionStore
+    import db_models  # noqa: F401 registers the tables
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'sessions.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    # Two stores on one database, as in two uvicorn workers
+    first, second = (SqlSessionStore(sessionmaker(bind=engine)) for _ in range(2))
+    now = datetime.now()
+    first.create("s1", 7, now)
+    for store, name in ((first, "a"), (second, "b"), (first, "c")):
+        assert store.append("s1", [ChatMessage(role="user", content=f"{name}{i}", timestamp=now.isoformat())
+                                   for i in range(2)], now)
+    assert not second.append("missing", [ChatMessage(role="user", content="x", timestamp=now.isoformat())], now)
+
+    chunk = {"chunk_id": "c1", "page_content": "text", "source": "a.pdf", "page": 1, "page_label": "1"}
+    first.add_chunks({"c1": chunk})
+    second.add_chunks({"c1": chunk})
+
+    _, count, page, _, _ = second.load("s1", 10)
+    assert count == 6
+    assert [message.content for message in page] == ["a0", "a1", "b0", "b1", "c0", "c1"]
+    assert list(first.get_chunks(["c1"])) == ["c1"]
+
+    first.append("s1", [ChatMessage(role="assistant", content="answer", timestamp=now.isoformat(),
+                                    citations=[{"chunk_id": "c1", "source": "a.pdf"}])], now)
+    assert second.cited_chunk_ids("s1", ["c1", "c2"]) == {"c1"}
+    assert second.cited_chunk_ids("missing", ["c1"]) == set()
+
+
+def test_failing_session_does_not_block_the_others():
+    from services.SessionManager import SessionManager, MAX_FLUSH_ATTEMPTS
+
+    class FlakyStore(InMemorySessionStore):
+        def append(self, session_id, messages, now):
+            if session_id == "bad":
+                raise RuntimeError("constraint failed")
+            return super().append(session_id, messages, now)
+
+    store = FlakyStore()
+    manager = SessionManager(store)
+    manager.shutdown()
+    now = datetime.now()
+    for session_id in ("good", "bad"):
+        store.create(session_id, 7, now)
+        manager.append_messages(session_id, [ChatMessage(role="user", content="hi", timestamp=now.isoformat())])
+
+    manager.flush()
+    assert store.message_count("good") == 1
+    assert "bad" in manager._pending
+
+    for _ in range(MAX_FLUSH_ATTEMPTS - 1):
+        manager.flush()
+    assert "bad" not in manager._pending
+    assert manager.get_session("bad") == []
+
+
+def test_chunks_are_only_cited_by_the_sessions_that_reference_them():
+    from services.SessionManager import SessionManager, MAX_HISTORY_MESSAGES
+
+    store = InMemorySessionStore()
+    manager = SessionManager(store)
+    manager.shutdown()
+    now = datetime.now().isoformat()
+    mine, other = manager.create_session(7), manager.create_session(8)
+    cited = ChatMessage(role="assistant", content="answer", timestamp=now,
+                        citations=[{"chunk_id": "c1", "source": "a.pdf", "page_content": "text"}])
+    manager.append_messages(mine, [cited])
+    manager.append_messages(other, [cited.model_copy(update={"citations": [{"chunk_id": "c2", "page_content": "other"}]})])
+    # Push the citing message out of the cached tail, so it is only found in the store
+    manager.append_messages(mine, [ChatMessage(role="user", content=str(i), timestamp=now) for i in range(MAX_HISTORY_MESSAGES)])
+    manager.flush()
+
+    assert manager.cited_chunk_ids(mine, ["c1", "c2"]) == {"c1"}
+    assert manager.cited_chunk_ids(other, ["c1", "c2"]) == {"c2"}
+    assert manager.cited_chunk_ids("missing", ["c1"]) == set()
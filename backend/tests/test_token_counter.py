@@ -0,0 +1,26 @@
+from services.TokenCounter import TokenCounter
+
+
+def test_counts_with_the_embedding_model_tokenizer_by_default(embedding_service, monkeypatch):
+    monkeypatch.delenv("PROMPT_TOKENIZER", raising=False)
+    counter = TokenCounter(embedding_service=embedding_service)
+
+    # The bag-of-words test model only tokenizes its vocabulary words
+    assert counter.count("apple banana unknownword cherry") == 3
+    assert counter.name == embedding_service.model_name
+
+
+def test_estimates_when_no_tokenizer_can_be_loaded(monkeypatch):
+    monkeypatch.delenv("PROMPT_TOKENIZER", raising=False)
+    assert TokenCounter().count("x" * 10) == 3
+
+    class BrokenService:
+        model_name = "broken"
+
+        @property
+        def model(self):
+            raise OSError("model not downloaded")
+
+    counter = TokenCounter(embedding_service=BrokenService())
+    assert counter.count("x" * 10) == 3
+    assert counter.name == "estimate"
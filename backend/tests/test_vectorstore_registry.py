@@ -0,0 +1,136 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from services.IndexCacheService import IndexCacheService
+from services.VectorStoreRegistry import VectorStoreRegistry
+
+EMBEDDINGS = DeterministicFakeEmbedding(size=16)
+
+
+def make_vectorstore(*texts):
+    return FAISS.from_texts(list(texts), EMBEDDINGS, metadatas=[{"source": f"{text}.pdf"} for text in texts])
+
+
+def test_selection_changed_by_another_worker_is_reloaded(tmp_path):
+    # Two registries over one cache directory stand for two uvicorn worker processes
+    worker_a = VectorStoreRegistry(IndexCacheService(str(tmp_path)))
+    worker_b = VectorStoreRegistry(IndexCacheService(str(tmp_path)))
+
+    worker_a.register(7, "first", make_vectorstore("alpha"), ["alpha.pdf"], ["hash-a"], {})
+    assert worker_b.selection(7)["fingerprint"] == "first"
+
+    worker_a.register(7, "second", make_vectorstore("beta"), ["beta.pdf"], ["hash-b"], {})
+    assert worker_b.selection(7)["fingerprint"] == "second"
+    assert worker_b.selection(7)["file_paths"] == ["beta.pdf"]
+
+
+def test_file_invalidated_by_another_worker_drops_the_selection(tmp_path):
+    worker_a = VectorStoreRegistry(IndexCacheService(str(tmp_path)))
+    worker_b = VectorStoreRegistry(IndexCacheService(str(tmp_path)))
+
+    worker_a.register(7, "first", make_vectorstore("alpha"), ["alpha.pdf"], ["hash-a"], {})
+    worker_b.register(7, "first", make_vectorstore("alpha"), ["alpha.pdf"], ["hash-a"], {})
+    assert worker_a.invalidate_file(7, "alpha.pdf")
+
+    assert worker_b.selection(7) is None
+    assert worker_b.get(7, EMBEDDINGS) is None
+    assert not worker_b.is_loaded(7)
+
+
+def test_deleting_a_file_keeps_other_users_selections_of_the_same_content(tmp_path):
+    registry = VectorStoreRegistry(IndexCacheService(str(tmp_path)))
+    registry.register(1, "same-content", make_vectorstore("alpha"), ["u1/alpha.pdf"], ["hash-a"], {})
+    registry.register(2, "same-content", make_vectorstore("alpha"), ["u2/alpha.pdf"], ["hash-a"], {})
+
+    # User 2 does not have user 1's path selected, so only user 1's selection goes
+    assert not registry.invalidate_file(2, "u1/alpha.pdf")
+    assert registry.invalidate_file(1, "u1/alpha.pdf")
+
+    assert registry.selection(1) is None
+    assert registry.get(2, EMBEDDINGS) is not None
+    assert registry.is_referenced("hash-a")
+    assert registry.invalidate_file(2, "u2/alpha.pdf")
+    assert not registry.is_referenced("hash-a")
+
+
+def test_evicted_single_file_selection_is_saved_and_reloaded(tmp_path, monkeypatch):
+    monkeypatch.setenv("VECTORSTORE_MEMORY_MB", "0")
+    registry = VectorStoreRegistry(IndexCacheService(str(tmp_path)))
+
+    # The selection's key includes the composed index params, so it is not the per-document cache entry
+    registry.register(1, "single-file", make_vectorstore("alpha"), ["alpha.pdf"], ["hash-a"], {"index_type": "flat"})
+    registry.register(2, "other", make_vectorstore("beta"), ["beta.pdf"], ["hash-b"], {"index_type": "flat"})
+
+    assert registry.index_cache.contains("single-file")
+    reloaded = registry.get(1, EMBEDDINGS)
+    assert reloaded is not None
+    assert [doc.page_content for doc in reloaded.docstore._dict.values()] == ["alpha"]
+
+
+def test_entry_saved_with_another_users_paths_is_not_reloaded(tmp_path, monkeypatch):
+    monkeypatch.setenv("VECTORSTORE_MEMORY_MB", "0")
+    registry = VectorStoreRegistry(IndexCacheService(str(tmp_path)))
+
+    # Users 1 and 2 uploaded the same content, so their selections share the content-based fingerprint
+    registry.register(1, "same-content", make_vectorstore("alpha"), ["alpha.pdf"], ["hash-a"], {})
+    registry.register(3, "other", make_vectorstore("beta"), ["beta.pdf"], ["hash-b"], {})
+    registry._write_selection(2, {"fingerprint": "same-content", "file_paths": ["user2/alpha.pdf"],
+                                  "file_hashes": ["hash-a"], "params": {}})
+
+    assert registry.get(1, EMBEDDINGS) is not None
+    assert registry.get(2, EMBEDDINGS) is None
+
+
+def test_concurrent_reloads_of_one_entry_share_a_single_load(tmp_path, monkeypatch):
+    monkeypatch.setenv("VECTORSTORE_MEMORY_MB", "0")
+    registry = VectorStoreRegistry(IndexCacheService(str(tmp_path)))
+    registry.register(1, "first", make_vectorstore("alpha"), ["alpha.pdf"], ["hash-a"], {})
+    registry.register(2, "other", make_vectorstore("beta"), ["beta.pdf"], ["hash-b"], {})
+
+    loads, release = [], threading.Event()
+    real_load = registry.index_cache.load
+
+    def slow_load(key, embeddings):
+        loads.append(key)
+        release.wait(5)
+        return real_load(key, embeddings)
+
+    monkeypatch.setattr(registry.index_cache, "load", slow_load)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(registry.get, 1, EMBEDDINGS) for _ in range(4)]
+        time.sleep(0.2)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert loads == ["first"]
+    assert all(result is results[0] for result in results)
+
+
+def test_saving_an_evicted_entry_does_not_block_other_users(tmp_path, monkeypatch):
+    monkeypatch.setenv("VECTORSTORE_MEMORY_MB", "0")
+    registry = VectorStoreRegistry(IndexCacheService(str(tmp_path)))
+    registry.register(1, "first", make_vectorstore("alpha"), ["alpha.pdf"], ["hash-a"], {})
+
+    saving, release = threading.Event(), threading.Event()
+    real_save = registry.index_cache.save
+
+    def slow_save(*args, **kwargs):
+        saving.set()
+        release.wait(5)
+        return real_save(*args, **kwargs)
+
+    monkeypatch.setattr(registry.index_cache, "save", slow_save)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        registering = pool.submit(registry.register, 2, "other", make_vectorstore("beta"), ["beta.pdf"], ["hash-b"], {})
+        assert saving.wait(5)
+        # User 1's entry is being saved; both users are still served meanwhile, without waiting for the save
+        start = time.perf_counter()
+        assert registry.get(2, EMBEDDINGS) is not None
+        assert registry.get(1, EMBEDDINGS) is not None
+        assert time.perf_counter() - start < 1
+        release.set()
+        registering.result()
@@ -0,0 +1,67 @@
+import json
+import os
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+import services.WikipediaService as wikipedia_module
+from services.WikipediaService import WikipediaService
+
+ARTICLES = [
+    {"title": "Apple", "text": "apple banana cherry"},
+    {"title": "Engine", "text": "engine piston valve", "url": "https://example.org/engine"},
+    {"title": "River", "text": "river delta flood"},
+]
+
+
+def make_service(tmp_path, embedding_service=None):
+    return WikipediaService(embedding_service, cache_dir=str(tmp_path / "cache"), local_index_dir=str(tmp_path / "index"))
+
+
+def test_local_backend_searches_the_built_index(tmp_path, monkeypatch, embedding_service, pipeline):
+    monkeypatch.setenv("WIKIPEDIA_BACKEND", "local")
+    dump_path = tmp_path / "articles.jsonl"
+    dump_path.write_text("\n".join(json.dumps(article) for article in ARTICLES) + "\n")
+
+    assert make_service(tmp_path, embedding_service).build_local_index(str(dump_path), pipeline) == 3
+
+    # A new service loads the saved index from disk
+    service = make_service(tmp_path, embedding_service)
+    docs = service.retrieve("piston engine", k=1)
+    assert [doc.metadata for doc in docs] == [{"title": "Engine", "source": "https://example.org/engine"}]
+    assert service.stats()["local_index_loaded"]
+
+
+def test_local_backend_without_an_index_fails(tmp_path, monkeypatch, embedding_service):
+    monkeypatch.setenv("WIKIPEDIA_BACKEND", "local")
+    with pytest.raises(ValueError):
+        make_service(tmp_path, embedding_service).retrieve("apple")
+
+
+def test_cached_queries_expire_after_the_ttl(tmp_path, monkeypatch):
+    service = make_service(tmp_path)
+    service.ttl_seconds = 60
+    docs = [Document(page_content="Rivers flow.", metadata={"title": "River", "source": "https://example.org/river"})]
+    service._write_cached_query("what is a river", 1, docs)
+
+    assert service._read_cached_query("What is  a river", 1) == docs
+
+    now = time.time()
+    monkeypatch.setattr(wikipedia_module.time, "time", lambda: now + 120)
+    assert service._read_cached_query("what is a river", 1) is None
+    assert service.evict_expired() == 2  # the query and its page
+    assert service.stats()["cache_evictions"] == 2
+
+
+def test_writes_sweep_expired_files(tmp_path):
+    service = make_service(tmp_path)
+    service.ttl_seconds = 60
+    stale_path = os.path.join(service.cache_dir, "pages", "stale.json")
+    with open(stale_path, "w") as f:
+        json.dump({"fetched_at": 0}, f)
+    os.utime(stale_path, (0, 0))
+
+    service._write_cached_query("apple", 1, [Document(page_content="Apples.", metadata={"title": "Apple"})])
+    assert not os.path.exists(stale_path)
+    assert service._read_cached_query("apple", 1) is not None
@@ -8,6 +8,12 @@ let chatHistory = [];
 let assistantMessages = [];
 let isRagInitialized = false;
 let chatSessionActive = false;
+// Number of messages in the server-side session, returned with every turn as its cursor
+let historyCursor = 0;
+// Position of the oldest message loaded, or null when the whole history is shown
+let historyBefore = null;
+// Citation chunk text by chunk_id, fetched once when a citation is first opened
+const chunkCache = new Map();
 
 // Document ready function
 document.addEventListener('DOMContentLoaded', async function() {
@@ -114,37 +120,13 @@ async function createChatSession() {
         
         // If we have an answer in the response (welcome message), add it to the UI
         if (result.answer) {
-            // If there's a history in the response, use that directly
-            if (result.history && Array.isArray(result.history)) {
+            // If the response carries the stored messages, use those directly
+            if (result.messages && Array.isArray(result.messages)) {
                 // Clear the existing chat history
                 chatHistory = [];
-                
-                // Process each message from history
-                result.history.forEach(msg => {
-                    const messageId = 'msg_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
-                    const messageObj = {
-                        id: messageId,
-                        role: msg.role,
-                        message: msg.content,
-                        timestamp: msg.timestamp || new Date().toISOString(),
-                        citations: msg.role === 'assistant' ? (msg.citations || []) : []
-                    };
-                    
-                    // Add to chat history
-                    chatHistory.push(messageObj);
-                    
-                    // Add to UI
-                    addMessageToUI(messageObj);
-                    
-                    // Store assistant messages with citations for citation handling
-                    if (msg.role === 'assistant' && msg.citations && msg.citations.length > 0) {
-                        assistantMessages.push({
-                            id: messageId,
-                            message: messageObj.message,
-                            citations: messageObj.citations
-                        });
-                    }
-                });
+                appendMessagesFromAPI(result.messages);
+                historyCursor = result.cursor || result.messages.length;
+                historyBefore = null;
             } else {
                 // No history provided, just add the greeting message
                 const messageId = 'msg_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
@@ -581,11 +563,12 @@ async function sendMessage(event) {
     try {
         // Send message to API following the expected format in chat_route.py
         const token = localStorage.getItem('authToken');
-        const response = await fetch('/api/chat/message', {
+        const response = await fetch('/api/chat/message/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
-                'Authorization': `Bearer ${token}`
+                'Authorization': `Bearer ${token}`,
+                'Accept': 'text/event-stream'
             },
             body: JSON.stringify({ 
                 session_id: sessionId,
@@ -597,12 +580,35 @@ async function sendMessage(event) {
             throw new Error(`API error: ${response.status}`);
         }
         
-        const data = await response.json();
+        // Show the reply as it is generated; it is replaced by the history from the final event
+        let streamingText = '';
+        let streamingMessageEl = null;
+        const data = await readAnswerStream(response, {
+            onToken: (content) => {
+                streamingText += content;
+                if (!streamingMessageEl) {
+                    hideTypingIndicator();
+                    const streamingId = 'temp_' + Date.now();
+                    addMessageToUI({
+                        id: streamingId,
+                        role: 'assistant',
+                        message: streamingText,
+                        citations: [],
+                        timestamp: new Date().toISOString(),
+                        isTemp: true
+                    });
+                    streamingMessageEl = document.querySelector(`[data-message-id="${streamingId}"] .message-text`);
+                }
+                if (streamingMessageEl) {
+                    streamingMessageEl.textContent = streamingText;
+                }
+            }
+        });
         
         // Hide typing indicator
         hideTypingIndicator();
         
-        // The API returns: session_id, answer, citations, and history
+        // The final event contains: session_id, answer, citations, messages (this turn only), cursor and time_to_first_token
         console.log('Message response:', data);
         
         // Check for valid session ID and update if needed
@@ -611,48 +617,17 @@ async function sendMessage(event) {
             localStorage.setItem('chatSessionId', data.session_id);
         }
         
-        // Instead of manually adding messages, use the history from the API response
-        if (data.history && Array.isArray(data.history)) {
-            // Clear existing messages from UI
-            const chatMessagesElement = document.getElementById('chatMessages');
-            // Keep the empty chat div if it exists
-            const emptyChat = document.getElementById('emptyChat');
-            chatMessagesElement.innerHTML = '';
-            if (emptyChat) {
-                chatMessagesElement.appendChild(emptyChat);
-            }
+        // Replace the temporary messages with the ones the backend stored for this turn
+        if (data.messages && Array.isArray(data.messages)) {
+            document.querySelectorAll('#chatMessages [data-temp="true"]').forEach(el => el.remove());
             
-            // Clear existing chat history
-            chatHistory = [];
-            assistantMessages = [];
-            
-            // Process the entire history from the API
-            data.history.forEach(msg => {
-                // Convert backend format to frontend format
-                const messageObj = {
-                    id: 'msg_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9),
-                    role: msg.role,
-                    message: msg.content,
-                    timestamp: msg.timestamp || new Date().toISOString(),
-                    // Use the citations from the individual message if available
-                    citations: msg.role === 'assistant' ? (msg.citations || []) : []
-                };
-                
-                // Add to chat history
-                chatHistory.push(messageObj);
-                
-                // If it's the assistant's message with citations, add to assistantMessages
-                if (msg.role === 'assistant' && messageObj.citations.length > 0) {
-                    assistantMessages.push({
-                        id: messageObj.id,
-                        message: messageObj.message,
-                        citations: messageObj.citations
-                    });
-                }
-                
-                // Add to UI
-                addMessageToUI(messageObj);
-            });
+            if (data.cursor !== historyCursor + data.messages.length) {
+                // The session was also continued elsewhere (another tab), so reload the latest page
+                await loadChatHistory();
+            } else {
+                appendMessagesFromAPI(data.messages);
+                historyCursor = data.cursor;
+            }
         }
         
         // Re-enable the chat input
@@ -666,6 +641,78 @@ async function sendMessage(event) {
     }
 }
 
+/**
+ * Read Server-Sent Events from a streaming response and resolve with the final event
+ */
+async function readAnswerStream(response, handlers = {}) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let finalEvent = null;
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const rawEvents = buffer.split('\n\n');
+        buffer = rawEvents.pop(); // Keep the incomplete event for the next chunk
+        
+        for (const rawEvent of rawEvents) {
+            if (!rawEvent.startsWith('data: ')) continue;
+            const event = JSON.parse(rawEvent.slice(6));
+            
+            if (event.type === 'token' && handlers.onToken) {
+                handlers.onToken(event.content);
+            } else if (event.type === 'error') {
+                throw new Error(event.detail);
+            } else if (event.type === 'final') {
+                finalEvent = event;
+            }
+        }
+    }
+    
+    if (!finalEvent) {
+        throw new Error('Message stream ended unexpectedly');
+    }
+    return finalEvent;
+}
+
+/**
+ * Convert a message from the API to the frontend format, tracking it for citation handling
+ */
+function messageFromAPI(msg) {
+    const messageObj = {
+        id: 'msg_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9),
+        role: msg.role,
+        message: msg.content,
+        timestamp: msg.timestamp || new Date().toISOString(),
+        citations: msg.role === 'assistant' ? (msg.citations || []) : []
+    };
+    
+    // Store assistant messages with citations for citation handling
+    if (messageObj.role === 'assistant' && messageObj.citations.length > 0) {
+        assistantMessages.push({
+            id: messageObj.id,
+            message: messageObj.message,
+            citations: messageObj.citations
+        });
+    }
+    
+    return messageObj;
+}
+
+/**
+ * Append messages returned by the API to the chat history and the UI
+ */
+function appendMessagesFromAPI(messages) {
+    messages.forEach(msg => {
+        const messageObj = messageFromAPI(msg);
+        chatHistory.push(messageObj);
+        addMessageToUI(messageObj);
+    });
+}
+
 /**
  * Add a message to the chat
  */
@@ -799,7 +846,7 @@ function processMessageWithCitations(message, citations, messageId = null) {
  * @param {number} index - The citation index
  * @param {string|null} messageId - Optional message ID for historical messages
  */
-function showCitationDetails(index, messageId = null) {
+async function showCitationDetails(index, messageId = null) {
     console.log('Showing citation:', index, 'Message ID:', messageId);
     console.log('Assistant Messages:', assistantMessages);
     
@@ -866,9 +913,13 @@ function showCitationDetails(index, messageId = null) {
     //   "page_content": "100 Common Birds in India..."
     // }
     
-    // Extract citation details
+    // Extract citation details; the chunk text is referenced by chunk_id and fetched once
     const source = citation.source || '';
-    const pageContent = citation.page_content || '';
+    let pageContent = citation.page_content || '';
+    if (!pageContent && citation.chunk_id) {
+        const chunks = await fetchCitationChunks([citation.chunk_id]);
+        pageContent = chunks[citation.chunk_id] ? chunks[citation.chunk_id].page_content : '';
+    }
     const page = citation.page || citation.page_label || '';
     const sourceId = citation.source_id || '';
     
@@ -931,6 +982,45 @@ function showCitationDetails(index, messageId = null) {
     void tooltip.offsetWidth;
 }
 
+/**
+ * Fetch citation chunks by chunk_id, skipping those already in the client-side cache
+ * @param {string[]} chunkIds - The chunk ids referenced by citations
+ */
+async function fetchCitationChunks(chunkIds) {
+    const missing = [...new Set(chunkIds)].filter(id => !chunkCache.has(id));
+    if (missing.length > 0) {
+        try {
+            const token = localStorage.getItem('authToken');
+            const sessionId = localStorage.getItem('chatSessionId');
+            const query = [`session_id=${encodeURIComponent(sessionId)}`]
+                .concat(missing.map(id => `ids=${encodeURIComponent(id)}`)).join('&');
+            const response = await fetch(`/api/chat/chunks?${query}`, {
+                method: 'GET',
+                headers: {
+                    'Authorization': `Bearer ${token}`
+                }
+            });
+            
+            if (!response.ok) {
+                throw new Error(`API error: ${response.status}`);
+            }
+            
+            const chunks = await response.json();
+            Object.entries(chunks).forEach(([id, chunk]) => chunkCache.set(id, chunk));
+        } catch (error) {
+            console.error('Error fetching citation chunks:', error);
+        }
+    }
+    
+    const found = {};
+    chunkIds.forEach(id => {
+        if (chunkCache.has(id)) {
+            found[id] = chunkCache.get(id);
+        }
+    });
+    return found;
+}
+
 /**
  * Hide citation tooltip
  */
@@ -984,6 +1074,7 @@ async function clearChatHistory() {
         // Reset chat history and assistant messages arrays
         chatHistory = [];
         assistantMessages = [];
+        historyBefore = null;
         
         // We don't end the session, just clear the UI
         showToast('Chat history cleared', 'success');
@@ -1168,9 +1259,9 @@ function showToast(message, type = 'info') {
 }
 
 /**
- * Load chat history from API
+ * Load a page of chat history from API, the latest messages or those before a position
  */
-async function loadHistoryFromAPI(sessionId) {
+async function loadHistoryFromAPI(sessionId, before = null) {
     try {
         const token = localStorage.getItem('authToken');
         if (!token) {
@@ -1180,7 +1271,8 @@ async function loadHistoryFromAPI(sessionId) {
         
         console.log('Loading chat history from API for session:', sessionId);
         
-        const response = await fetch(`/api/chat/history/${sessionId}`, {
+        const query = before !== null ? `?before=${before}` : '';
+        const response = await fetch(`/api/chat/history/${sessionId}${query}`, {
             method: 'GET',
             headers: {
                 'Authorization': `Bearer ${token}`
@@ -1193,43 +1285,15 @@ async function loadHistoryFromAPI(sessionId) {
         
         const data = await response.json();
         
-        // The backend returns an array of messages directly
-        if (Array.isArray(data)) {
-            // Check if we already have messages in the UI
-            const hasExistingMessages = chatHistory.length > 0;
+        // The backend returns a page: messages, cursor and the position to load earlier messages from
+        if (data && Array.isArray(data.messages)) {
+            if (before === null) {
+                historyCursor = data.cursor;
+            }
+            historyBefore = data.before;
             
-            // If we have messages already and this is loading history,
-            // we'll prevent duplicate greeting messages
-            const firstGreeting = hasExistingMessages && 
-                data.length > 0 && 
-                data[0].role === 'assistant' && 
-                data[0].content.includes("Hello! I'm ready to help");
-                
             // Transform the backend message format to our frontend format
-            return data
-                // Skip the first greeting message if we already have messages
-                .filter((msg, index) => !(hasExistingMessages && index === 0 && firstGreeting))
-                .map(msg => {
-                    const messageId = 'msg_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9);
-                    const messageObj = {
-                        id: messageId,
-                        role: msg.role,
-                        message: msg.content,
-                        timestamp: msg.timestamp || new Date().toISOString(),
-                        citations: msg.role === 'assistant' ? (msg.citations || []) : []
-                    };
-                    
-                    // Store assistant messages with citations for citation handling
-                    if (msg.role === 'assistant' && messageObj.citations && messageObj.citations.length > 0) {
-                        assistantMessages.push({
-                            id: messageId,
-                            message: messageObj.message,
-                            citations: messageObj.citations
-                        });
-                    }
-                    
-                    return messageObj;
-                });
+            return data.messages.map(messageFromAPI);
         }
         
         return [];
@@ -1299,14 +1363,8 @@ async function loadChatHistory() {
                     }
                 });
                 
-                // Build assistantMessages array (only with valid entries)
-                assistantMessages = chatHistory
-                    .filter(entry => entry && entry.role === 'assistant' && entry.citations)
-                    .map(entry => ({
-                        id: entry.id || ('msg_' + Date.now() + '_' + Math.random().toString(36).substr(2, 9)),
-                        message: entry.message,
-                        citations: entry.citations || []
-                    }));
+                // Older messages are loaded on demand
+                updateLoadEarlierButton();
                 
                 console.log('Chat history loaded from API:', chatHistory.length, 'messages');
                 chatSessionActive = true;
@@ -1333,11 +1391,56 @@ async function loadChatHistory() {
     }
 }
 
+/**
+ * Show a "load earlier messages" button above the oldest message while there are earlier pages
+ */
+function updateLoadEarlierButton() {
+    const chatMessagesElement = document.getElementById('chatMessages');
+    let button = document.getElementById('loadEarlierBtn');
+    
+    if (historyBefore === null) {
+        if (button) {
+            button.remove();
+        }
+        return;
+    }
+    
+    if (!button) {
+        button = document.createElement('button');
+        button.id = 'loadEarlierBtn';
+        button.className = 'load-earlier-btn';
+        button.textContent = 'Load earlier messages';
+        button.addEventListener('click', loadEarlierMessages);
+    }
+    chatMessagesElement.insertBefore(button, chatMessagesElement.querySelector('.message'));
+}
+
+/**
+ * Load the page of messages before the oldest one shown and prepend it
+ */
+async function loadEarlierMessages() {
+    const sessionId = localStorage.getItem('chatSessionId');
+    if (!sessionId || historyBefore === null) {
+        return;
+    }
+    
+    const earlier = await loadHistoryFromAPI(sessionId, historyBefore);
+    if (!earlier) {
+        showToast('Error loading earlier messages', 'error');
+        return;
+    }
+    
+    const firstMessage = document.querySelector('#chatMessages .message');
+    earlier.forEach(entry => addMessageToUI(entry, firstMessage));
+    chatHistory = earlier.concat(chatHistory);
+    updateLoadEarlierButton();
+}
+
 /**
  * Add a message to the UI without adding it to the chat history
- * Used for loading existing messages from API
+ * Used for loading existing messages from API; earlier messages are inserted before `beforeEl`
  */
-function addMessageToUI(entry) {
+function addMessageToUI(entry, beforeEl = null) {
     if (!entry || !entry.role || !entry.message) {
         console.error('Invalid message entry', entry);
         return;
@@ -1399,6 +1502,10 @@ function addMessageToUI(entry) {
     
     // Add to chat container
     const chatMessagesElement = document.getElementById('chatMessages');
+    if (beforeEl) {
+        chatMessagesElement.insertBefore(messageEl, beforeEl);
+        return;
+    }
     chatMessagesElement.appendChild(messageEl);
     
     // Scroll to bottom
@@ -1446,6 +1553,8 @@ async function endChatSession() {
         // Reset UI state
         chatHistory = [];
         assistantMessages = [];
+        historyCursor = 0;
+        historyBefore = null;
         chatSessionActive = false;
         
         // Show empty state
@@ -8,6 +8,7 @@ let selectedQAMode = null;
 let ragStatus = { initialized: false, message: "Checking..." };
 let currentAnswer = "";
 let currentCitations = [];
+let streamingAnswer = "";
 
 // Initialize on page load
 document.addEventListener('DOMContentLoaded', function() {
@@ -245,14 +246,21 @@ async function askQuestion() {
         const startTime = Date.now();
         let result;
         
+        // Show tokens as they arrive; citations are linked once the final event is received
+        const handlers = {
+            onToken: (content) => displayStreamingToken(content),
+            onReset: () => resetStreamingAnswer()
+        };
+        resetStreamingAnswer();
+        
         // Call appropriate API based on mode
         if (selectedQAMode === 'documents') {
-            result = await callDocumentsAPI(question, wordLength);
+            result = await callDocumentsAPI(question, wordLength, handlers);
         } else if (selectedQAMode === 'wikipedia') {
-            result = await callWikipediaAPI(question, wordLength);
+            result = await callWikipediaAPI(question, wordLength, handlers);
         } else if (selectedQAMode === 'hybrid') {
             // Updated to use the new RAG agent v1 API
-            result = await callRagAgentV1API(question, wordLength);
+            result = await callRagAgentV1API(question, wordLength, handlers);
         }
         
         const endTime = Date.now();
@@ -276,73 +284,126 @@ async function askQuestion() {
 /**
  * Call Documents API
  */
-async function callDocumentsAPI(question, wordLength) {
-    const token = localStorage.getItem('authToken');
-    const response = await fetch('/api/chain/ask_documents', {
-        method: 'POST',
-        headers: {
-            'Authorization': `Bearer ${token}`,
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            question: question,
-            word_length: wordLength
-        })
+async function callDocumentsAPI(question, wordLength, handlers = {}) {
+    const response = await fetchAnswerStream('/api/chain/ask_documents/stream', {
+        question: question,
+        word_length: wordLength
     });
     
     if (!response.ok) {
         throw new Error('Failed to get answer from documents');
     }
     
-    return await response.json();
+    return await readAnswerStream(response, handlers);
 }
 
 /**
  * Call Wikipedia API
  */
-async function callWikipediaAPI(question, wordLength) {
-    const token = localStorage.getItem('authToken');
-    const response = await fetch('/api/chain/ask_wikipedia', {
-        method: 'POST',
-        headers: {
-            'Authorization': `Bearer ${token}`,
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            question: question,
-            word_length: wordLength
-        })
+async function callWikipediaAPI(question, wordLength, handlers = {}) {
+    const response = await fetchAnswerStream('/api/chain/ask_wikipedia/stream', {
+        question: question,
+        word_length: wordLength
     });
     
     if (!response.ok) {
         throw new Error('Failed to get answer from Wikipedia');
     }
     
-    return await response.json();
+    return await readAnswerStream(response, handlers);
 }
 
 /**
  * Call RAG Agent V1 API - Updated to use the new endpoint
  */
-async function callRagAgentV1API(question, wordLength) {
+async function callRagAgentV1API(question, wordLength, handlers = {}) {
+    const response = await fetchAnswerStream('/api/chain/ask_rag_agent/stream', {
+        question: question,
+        word_length: wordLength
+    });
+    
+    if (!response.ok) {
+        throw new Error('Failed to get hybrid answer from Smart Document Assistant');
+    }
+    
+    return await readAnswerStream(response, handlers);
+}
+
+/**
+ * POST to a streaming endpoint
+ */
+async function fetchAnswerStream(url, body) {
     const token = localStorage.getItem('authToken');
-    const response = await fetch('/api/chain/ask_rag_agent', {
+    return await fetch(url, {
         method: 'POST',
         headers: {
             'Authorization': `Bearer ${token}`,
-            'Content-Type': 'application/json'
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream'
         },
-        body: JSON.stringify({
-            question: question,
-            word_length: wordLength
-        })
+        body: JSON.stringify(body)
     });
-    
-    if (!response.ok) {
-        throw new Error('Failed to get hybrid answer from Smart Document Assistant');
+}
+
+/**
+ * Read Server-Sent Events from a streaming response and resolve with the final event
+ */
+async function readAnswerStream(response, handlers = {}) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let finalEvent = null;
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const rawEvents = buffer.split('\n\n');
+        buffer = rawEvents.pop(); // Keep the incomplete event for the next chunk
+        
+        for (const rawEvent of rawEvents) {
+            if (!rawEvent.startsWith('data: ')) continue;
+            const event = JSON.parse(rawEvent.slice(6));
+            
+            if (event.type === 'token' && handlers.onToken) {
+                handlers.onToken(event.content);
+            } else if (event.type === 'reset' && handlers.onReset) {
+                handlers.onReset();
+            } else if (event.type === 'error') {
+                throw new Error(event.detail);
+            } else if (event.type === 'final') {
+                finalEvent = event;
+            }
+        }
     }
     
-    return await response.json();
+    if (!finalEvent) {
+        throw new Error('Answer stream ended unexpectedly');
+    }
+    return finalEvent;
+}
+
+/**
+ * Clear the answer currently being streamed
+ */
+function resetStreamingAnswer() {
+    streamingAnswer = '';
+    document.getElementById('answerContent').textContent = '';
+}
+
+/**
+ * Append a streamed token to the answer as plain text
+ */
+function displayStreamingToken(content) {
+    if (!streamingAnswer) {
+        // First token: replace the loading overlay with the answer being written
+        document.getElementById('loadingOverlay').style.display = 'none';
+        document.getElementById('answerSection').style.display = 'block';
+        document.getElementById('answerTime').textContent = 'Generating...';
+    }
+    streamingAnswer += content;
+    document.getElementById('answerContent').textContent = streamingAnswer;
 }
 
 /**
@@ -360,8 +421,9 @@ function displayAnswer(result, timeTaken) {
     const processedAnswer = processAnswerWithCitations(result.answer, currentCitations);
     answerContent.innerHTML = processedAnswer;
     
-    // Update only response time
-    document.getElementById('answerTime').textContent = `Response time: ${timeTaken}s`;
+    // Update response time, led by the time until the first token appeared
+    const firstTokenTime = result.time_to_first_token != null ? `First token: ${result.time_to_first_token.toFixed(1)}s · ` : '';
+    document.getElementById('answerTime').textContent = `${firstTokenTime}Response time: ${timeTaken}s`;
     
     // Scroll to answer
     document.getElementById('answerSection').scrollIntoView({ behavior: 'smooth' });